@@ -0,0 +1,166 @@
+import os
+from collections import deque
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from models import Alert
+from sim_snapshot import encode_table, decode_table
+
+# Alerts kept per session (older ones are evicted; counters still include them)
+ALERT_RETENTION = int(os.environ.get("SOLARIS_ALERT_RETENTION", "1000"))
+
+class AlertStore:
+    # Ring buffer of the most recent alerts. Every alert gets a sequence number
+    # (its position in the session's alert stream); the buffer slot is seq % capacity,
+    # so paging from a cursor is a slice, not a scan. Severity / rule / encounter
+    # indexes hold seqs in arrival order and are trimmed from the left on eviction.
+    def __init__(self, capacity: int = ALERT_RETENTION):
+        self.capacity = max(1, capacity)
+        self._ring: List[Optional[Alert]] = [None] * self.capacity
+        self.total = 0 # Alerts ever raised = next seq
+        self._seq_of: Dict[str, int] = {} # alert id -> seq (retained only)
+        self.by_severity: Dict[str, deque] = {}
+        self.by_rule: Dict[str, deque] = {}
+        self.by_encounter: Dict[str, deque] = {}
+        self.severity_counts: Dict[str, int] = {} # All-time, evictions included
+        self.rule_counts: Dict[str, int] = {}
+
+    def __len__(self):
+        return self.total - self.first_seq
+
+    def __iter__(self) -> Iterator[Alert]:
+        return iter(self.since(self.first_seq))
+
+    @property
+    def first_seq(self) -> int:
+        return max(0, self.total - self.capacity)
+
+    def append(self, alert: Alert) -> int:
+        seq = self.total
+        evicted = self._ring[seq % self.capacity]
+        if evicted is not None: self._evict(evicted)
+        self._ring[seq % self.capacity] = alert
+        self._seq_of[alert.id] = seq
+        self.by_severity.setdefault(alert.severity, deque()).append(seq)
+        self.by_rule.setdefault(alert.rule_violated, deque()).append(seq)
+        self.by_encounter.setdefault(alert.encounter_id, deque()).append(seq)
+        self.severity_counts[alert.severity] = self.severity_counts.get(alert.severity, 0) + 1
+        self.rule_counts[alert.rule_violated] = self.rule_counts.get(alert.rule_violated, 0) + 1
+        self.total += 1
+        return seq
+
+    def _evict(self, alert: Alert):
+        del self._seq_of[alert.id]
+        for index, key in ((self.by_severity, alert.severity), (self.by_rule, alert.rule_violated), (self.by_encounter, alert.encounter_id)):
+            seqs = index[key]
+            seqs.popleft() # Oldest retained seq of any index is always the one being evicted
+            if not seqs: del index[key]
+
+    def since(self, seq: int, limit: Optional[int] = None) -> List[Alert]:
+        # Alerts with sequence number >= seq that are still retained
+        start = max(seq, self.first_seq)
+        end = self.total if limit is None else min(self.total, start + limit)
+        return [self._ring[s % self.capacity] for s in range(start, end)]
+
+    def page(self, after: Optional[str] = None, limit: Optional[int] = None, severity: Optional[str] = None,
+             rule: Optional[str] = None, encounter_id: Optional[str] = None) -> List[Alert]:
+        # Cursor = id of the last alert the client has; an unknown (e.g. evicted) id
+        # restarts from the oldest retained alert
+        start = self._seq_of[after] + 1 if after in self._seq_of else self.first_seq
+        wanted = [(index, key) for index, key in ((self.by_severity, severity), (self.by_rule, rule), (self.by_encounter, encounter_id)) if key is not None]
+        if not wanted: return self.since(start, limit)
+        if any(key not in index for index, key in wanted): return []
+        # Walk the smallest matching index, check the other filters on the alert itself
+        seqs = min((index[key] for index, key in wanted), key=len)
+        page = []
+        for s in seqs:
+            if s < start: continue
+            alert = self._ring[s % self.capacity]
+            if severity is not None and alert.severity != severity: continue
+            if rule is not None and alert.rule_violated != rule: continue
+            if encounter_id is not None and alert.encounter_id != encounter_id: continue
+            page.append(alert)
+            if limit is not None and len(page) >= limit: break
+        return page
+
+    def view(self, previous: Optional["AlertView"] = None) -> "AlertView":
+        # Read-only copy; `previous` (an earlier view of this store) is reused when
+        # nothing was raised since, else extended instead of rebuilt
+        if previous is not None and previous.total == self.total: return previous
+        if previous is not None and previous.total < self.total:
+            kept = previous.alerts[max(0, self.first_seq - previous.first_seq):]
+            alerts = kept + tuple(self.since(max(previous.total, self.first_seq)))
+        else:
+            alerts = tuple(self.since(self.first_seq))
+        return AlertView(alerts, self.total, dict(self.severity_counts), dict(self.rule_counts))
+
+    def get_state(self) -> Dict:
+        return {
+            "capacity": self.capacity,
+            "total": self.total,
+            "alerts": encode_table(self.since(self.first_seq), Alert),
+            "severity_counts": dict(self.severity_counts), # Copies: may be pickled on another thread (broker sync)
+            "rule_counts": dict(self.rule_counts),
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict) -> "AlertStore":
+        store = cls(state["capacity"])
+        alerts = decode_table(state["alerts"], Alert)
+        store.total = state["total"] - len(alerts) # Re-appending gives the retained alerts their old seqs
+        for alert in alerts: store.append(alert)
+        store.severity_counts = dict(state["severity_counts"])
+        store.rule_counts = dict(state["rule_counts"])
+        return store
+
+    def counters(self) -> Dict:
+        return {
+            "total": self.total,
+            "retained": len(self),
+            "by_severity": dict(self.severity_counts),
+            "by_rule": dict(self.rule_counts),
+        }
+
+class AlertView:
+    # Frozen copy of an AlertStore's retained alerts, read by the API off the
+    # ticking thread. Same read methods; filters scan (at most `capacity` alerts)
+    # instead of keeping indexes.
+    def __init__(self, alerts: Tuple[Alert, ...], total: int, severity_counts: Dict[str, int], rule_counts: Dict[str, int]):
+        self.alerts = alerts
+        self.total = total
+        self.first_seq = total - len(alerts)
+        self.severity_counts = severity_counts
+        self.rule_counts = rule_counts
+
+    def __len__(self):
+        return len(self.alerts)
+
+    def since(self, seq: int, limit: Optional[int] = None) -> List[Alert]:
+        start = max(seq, self.first_seq) - self.first_seq
+        return list(self.alerts[start:None if limit is None else start + limit])
+
+    def page(self, after: Optional[str] = None, limit: Optional[int] = None, severity: Optional[str] = None,
+             rule: Optional[str] = None, encounter_id: Optional[str] = None) -> List[Alert]:
+        # Same cursor semantics as AlertStore.page; cursors are usually recent, so look from the end
+        start = 0
+        if after is not None:
+            for i in range(len(self.alerts) - 1, -1, -1):
+                if self.alerts[i].id == after:
+                    start = i + 1
+                    break
+        if severity is None and rule is None and encounter_id is None: return self.since(self.first_seq + start, limit)
+        page = []
+        for alert in self.alerts[start:]:
+            if severity is not None and alert.severity != severity: continue
+            if rule is not None and alert.rule_violated != rule: continue
+            if encounter_id is not None and alert.encounter_id != encounter_id: continue
+            page.append(alert)
+            if limit is not None and len(page) >= limit: break
+        return page
+
+    def counters(self) -> Dict:
+        return {
+            "total": self.total,
+            "retained": len(self),
+            "by_severity": dict(self.severity_counts),
+            "by_rule": dict(self.rule_counts),
+        }
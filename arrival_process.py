@@ -0,0 +1,141 @@
+import csv
+import math
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from facility_registry import REGISTRY
+
+# Arrival Process
+# Expected arrivals per minute per facility come from a (weekday, hour) rate
+# table plus any surge events. SOLARIS_ARRIVAL_RATES points at a CSV of
+# historical hourly rates (columns: facility_id, weekday, hour, arrivals_per_hour;
+# "*" or blank = all); entries it does not cover keep the built-in curve.
+# SOLARIS_ARRIVALS picks the sampler: "bernoulli" (at most one arrival per
+# facility per minute, the original model) or "poisson" (non-homogeneous
+# Poisson counts). Minutes with an active surge are always sampled as Poisson.
+ARRIVAL_RATES_FILE = os.environ.get("SOLARIS_ARRIVAL_RATES", "")
+ARRIVAL_MODEL = os.environ.get("SOLARIS_ARRIVALS", "poisson" if ARRIVAL_RATES_FILE else "bernoulli")
+ARRIVAL_MODELS = ("bernoulli", "poisson")
+START_WEEKDAY = 0 # Sim day 0 is a Monday
+MINUTES_PER_DAY = 1440
+WEEKDAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+
+def hour_bucket_rate(hour):
+    base_rate = 0.25
+    # 1. The "Lull" (Sinusoidal Arrival Rates)
+    if 0 <= hour < 8: return base_rate * 0.2 # Night
+    elif 8 <= hour < 20: return base_rate * 1.5 # Day (Standard Spec)
+    elif 20 <= hour < 24: return base_rate * 1.0 # Evening
+    else: return base_rate
+
+def default_rate_table() -> np.ndarray:
+    # weekday x hour x facility, arrivals per minute
+    curve = np.array([hour_bucket_rate(h) for h in range(24)])
+    return np.broadcast_to(curve[None, :, None], (7, 24, len(REGISTRY))).copy()
+
+def _selector(value, names, size):
+    # "*" / blank -> all, else an index (or weekday name)
+    value = (value or "*").strip().lower()
+    if value == "*": return list(range(size))
+    if value in names: return [names.index(value)]
+    index = int(value)
+    if not 0 <= index < size: raise ValueError(f"Out of range: {value}")
+    return [index]
+
+def load_rate_table(path: str) -> np.ndarray:
+    table = default_rate_table()
+    with open(path, newline="") as f:
+        for line, row in enumerate(csv.DictReader(f), start=2):
+            try:
+                fid = (row.get("facility_id") or "*").strip()
+                if fid != "*" and fid not in REGISTRY: raise ValueError(f"unknown facility '{fid}'")
+                facilities = list(range(len(REGISTRY))) if fid == "*" else [REGISTRY.index[fid]]
+                days = _selector(row.get("weekday"), WEEKDAYS, 7)
+                hours = _selector(row.get("hour"), (), 24)
+                rate = float(row["arrivals_per_hour"]) / 60
+                if rate < 0: raise ValueError("negative rate")
+            except (KeyError, TypeError, ValueError) as e:
+                raise ValueError(f"{path} line {line}: {e}")
+            table[np.ix_(days, hours, facilities)] = rate
+    return table
+
+RATE_TABLE = load_rate_table(ARRIVAL_RATES_FILE) if ARRIVAL_RATES_FILE else default_rate_table()
+
+def poisson_counts(lam: np.ndarray, u: np.ndarray) -> np.ndarray:
+    # Poisson(lam) by inversion, one uniform per entry, all entries at once:
+    # the smallest k whose CDF reaches u
+    lam = np.asarray(lam, dtype=float)
+    k = np.zeros(lam.shape, dtype=np.int64)
+    p = np.exp(-lam)
+    cdf = p.copy()
+    todo = u > cdf
+    top = float(lam.max()) if lam.size else 0.0
+    for step in range(1, int(top + 10 * math.sqrt(top) + 20)):
+        if not todo.any(): break
+        k[todo] += 1
+        p = p * lam / step
+        cdf += p
+        todo &= u > cdf
+    return k
+
+def truncated_poisson(lam: float, u: float) -> int:
+    # Poisson(lam) conditioned on at least one arrival
+    floor = math.exp(-lam)
+    return int(poisson_counts(np.array([lam]), np.array([floor + u * (1 - floor)]))[0])
+
+class ArrivalProcess:
+    # Per-engine view of the arrival model: the shared rate table, the sampler
+    # and this session's surge events (sim-minute windows that scale a
+    # facility's rate and/or add arrivals on top, e.g. a mass-casualty burst).
+    def __init__(self, start_hour: int, model: str = ARRIVAL_MODEL, table: np.ndarray = RATE_TABLE):
+        if model not in ARRIVAL_MODELS:
+            raise ValueError(f"Unknown arrival model '{model}'. Choose from: {', '.join(ARRIVAL_MODELS)}")
+        self.start_hour = start_hour
+        self.model = model
+        self.table = table
+        self.surges: List[Dict] = []
+        self._rates_minute = None
+        self._rates = None
+
+    def add_surge(self, start: int, end: int, facility_id: Optional[str] = None, multiplier: float = 1.0,
+                  extra_per_hour: float = 0.0, label: str = "surge") -> Dict:
+        if facility_id is not None and facility_id not in REGISTRY: raise ValueError(f"Unknown facility '{facility_id}'")
+        if end <= start: raise ValueError("Surge must last at least one minute")
+        surge = {"label": label, "facility_id": facility_id, "start": start, "end": end,
+                 "multiplier": multiplier, "extra_per_hour": extra_per_hour}
+        self.surges.append(surge)
+        self._rates_minute = None
+        return surge
+
+    def active_surges(self, minute: int) -> List[Dict]:
+        return [s for s in self.surges if s["start"] <= minute < s["end"]]
+
+    def poisson_at(self, minute: int) -> bool:
+        return self.model == "poisson" or any(s["start"] <= minute < s["end"] for s in self.surges)
+
+    def rates(self, minute: int) -> np.ndarray:
+        # Expected arrivals in sim minute `minute`, per facility (registry order).
+        # Cached per minute; callers must not modify the array.
+        if minute == self._rates_minute: return self._rates
+        clock = self.start_hour * 60 + minute
+        rates = self.table[(START_WEEKDAY + clock // MINUTES_PER_DAY) % 7, (clock // 60) % 24]
+        active = self.active_surges(minute)
+        if active:
+            rates = rates.copy()
+            for s in active:
+                target = slice(None) if s["facility_id"] is None else REGISTRY.index[s["facility_id"]]
+                rates[target] = rates[target] * s["multiplier"] + s["extra_per_hour"] / 60
+        if self.surges: # Finished ones are dropped (kept one extra minute for look-backs)
+            self.surges = [s for s in self.surges if s["end"] >= minute]
+        self._rates_minute, self._rates = minute, rates
+        return rates
+
+    def get_state(self) -> Dict:
+        return {"model": self.model, "surges": self.surges}
+
+    def set_state(self, state: Dict):
+        self.model = state["model"]
+        self.surges = list(state["surges"])
+        self._rates_minute = None
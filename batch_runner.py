@@ -0,0 +1,97 @@
+import argparse
+import json
+import multiprocessing as mp
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from engine_registry import create_engine
+
+MINUTES_PER_DAY = 1440
+SAMPLE_EVERY = 60 # Minutes between hallway / NEDOCS samples
+METRICS = ["lwbs", "avg_los", "hallway_patients", "nedocs"]
+# Replications x days one POST /simulate may ask for (it holds an API thread
+# until done); bigger studies run from the command line (main() below)
+API_LIMIT = int(os.environ.get("SOLARIS_BATCH_LIMIT", "1000"))
+
+def run_replication(seed: int, days: int, backend: str = "events", rng_backend: str = "numpy") -> Dict:
+    # One independent headless run. The engine owns its seeded RNG, so a
+    # replication depends only on its own seed, not on which process ran it.
+    sim = create_engine(backend, seed=seed, rng_backend=rng_backend)
+
+    hallway_samples = []
+    nedocs_samples = []
+    for _ in range(days * MINUTES_PER_DAY // SAMPLE_EVERY):
+        sim.advance(SAMPLE_EVERY, is_fast_forward=True)
+        vitals = sim._get_vitals()
+        hallway_samples.append(vitals["hallway_patients"])
+        nedocs_samples.append(vitals["nedocs"])
+
+    return {
+        "seed": seed,
+        "lwbs": sim.lwbs_count,
+        "avg_los": vitals["avg_los"],
+        "hallway_patients": sum(hallway_samples) / len(hallway_samples),
+        "nedocs": sum(nedocs_samples) / len(nedocs_samples),
+        "processed": sim.total_patients_processed,
+    }
+
+def summarize(values: List[float]) -> Dict:
+    arr = np.asarray(values, dtype=float)
+    p5, p50, p95 = np.percentile(arr, [5, 50, 95])
+    return {
+        "mean": round(float(arr.mean()), 3),
+        "std": round(float(arr.std()), 3),
+        "min": round(float(arr.min()), 3),
+        "p5": round(float(p5), 3),
+        "p50": round(float(p50), 3),
+        "p95": round(float(p95), 3),
+        "max": round(float(arr.max()), 3),
+    }
+
+def run_replications(replications: int, days: int, seed: int = 0, backend: str = "events",
+                     workers: Optional[int] = None, seeds: Optional[List[int]] = None,
+                     rng_backend: str = "numpy") -> Dict:
+    # Monte Carlo driver: N replications of K days on a process pool.
+    # Replication i uses seeds[i] (default: seed + i).
+    if seeds is None: seeds = [seed + i for i in range(replications)]
+    create_engine(backend, rng_backend=rng_backend) # Fail fast on bad names before forking
+
+    chunksize = max(1, len(seeds) // ((workers or 1) * 4))
+    # Spawned, not forked: the API process runs threads (log listener, writers)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn")) as pool:
+        runs = list(pool.map(run_replication, seeds, [days] * len(seeds), [backend] * len(seeds),
+                             [rng_backend] * len(seeds), chunksize=chunksize))
+
+    return {
+        "replications": len(runs),
+        "days": days,
+        "backend": backend,
+        "rng_backend": rng_backend,
+        "metrics": {name: summarize([r[name] for r in runs]) for name in METRICS},
+        "runs": runs,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless Monte Carlo runs of the ED simulation.")
+    parser.add_argument("--replications", "-n", type=int, default=10)
+    parser.add_argument("--days", "-k", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0, help="Replication i uses seed + i")
+    parser.add_argument("--backend", default="events")
+    parser.add_argument("--rng", default="numpy", choices=["python", "numpy"], help="Random stream generator")
+    parser.add_argument("--workers", type=int, default=None, help="Process pool size (default: CPU count)")
+    parser.add_argument("--output", "-o", help="Write the full JSON result here instead of stdout")
+    args = parser.parse_args()
+
+    result = run_replications(args.replications, args.days, seed=args.seed, backend=args.backend,
+                              workers=args.workers, rng_backend=args.rng)
+    if args.output:
+        with open(args.output, "w") as f: json.dump(result, f, indent=2)
+        print(json.dumps(result["metrics"], indent=2))
+    else:
+        print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+    main()
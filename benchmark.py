@@ -0,0 +1,324 @@
+import argparse
+import asyncio
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Dict, List
+
+# Benchmarks measure the simulation, not stdout or disk: unless overridden,
+# sim events are off and nothing is checkpointed (set before the engine imports)
+os.environ.setdefault("SOLARIS_SIM_EVENTS", "off")
+os.environ.setdefault("SOLARIS_CHECKPOINT_INTERVAL", "0")
+os.environ.setdefault("SOLARIS_SESSION_DIR", os.path.join(tempfile.gettempdir(), "solaris_bench_sessions"))
+
+import numpy as np
+
+from engine_registry import ENGINE_BACKENDS, create_engine
+from facility_registry import seed_records
+from sim_random import SimRandom
+
+# Benchmark Suite
+# Seeded fixtures (same seed = same state, so runs compare across versions):
+#   empty  - fresh engine, no patients
+#   steady - after `warmup` simulated minutes from the seed
+#   surge  - steady, plus 3 x physical_beds new arrivals in every waiting room
+# Engine cases run in a fresh process per facility count (the registry is
+# loaded at import); session and API cases use the built-in facilities.
+FIXTURES = ("empty", "steady", "surge")
+API_ENDPOINTS = ("/status", "/alerts", "/facilities")
+TICK_BUDGET_MS = 100 # Live loop: 1 tick = 0.1 s
+
+def latency_stats(seconds: List[float]) -> Dict:
+    ms = np.asarray(seconds, dtype=float) * 1000
+    return {
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "max_ms": round(float(ms.max()), 3),
+    }
+
+def build_fixture(backend: str, fixture: str, seed: int = 0, warmup: int = 720):
+    if fixture not in FIXTURES: raise ValueError(f"Unknown fixture '{fixture}'. Choose from: {', '.join(FIXTURES)}")
+    sim = create_engine(backend, seed=seed, rng_backend="numpy")
+    if fixture in ("steady", "surge"): sim.advance(warmup, is_fast_forward=True)
+    if fixture == "surge":
+        for fid in sim.facility_ids:
+            sim._generate_encounters([fid] * (3 * sim.resources[fid]["physical_beds"]), is_fast_forward=True)
+    return sim
+
+def clone(sim, seed: int):
+    # Same state, own random stream
+    copy = create_engine(_backend_of(sim)).restore(sim.snapshot(compress=False))
+    copy.rng = SimRandom(seed, backend=copy.rng.backend)
+    return copy
+
+def _backend_of(sim) -> str:
+    return next(name for name, cls in ENGINE_BACKENDS.items() if type(sim) is cls)
+
+# ---------------------------------------------------------
+# Engine: one session, live-loop ticks
+# ---------------------------------------------------------
+def bench_engine(backend: str, fixture: str, ticks: int, seed: int = 0, warmup: int = 720, alloc_ticks: int = 20) -> Dict:
+    sim = build_fixture(backend, fixture, seed, warmup)
+    active = sim._active_count()
+    snapshot = sim.snapshot(compress=False)
+
+    gc.collect()
+    durations = []
+    for _ in range(ticks):
+        start = time.perf_counter()
+        sim.tick()
+        durations.append(time.perf_counter() - start)
+
+    # Allocations on a fresh copy of the same state (tracemalloc slows every
+    # allocation, so it never overlaps the timed pass)
+    sim = create_engine(backend).restore(snapshot)
+    peaks, retained, blocks = [], [], []
+    tracemalloc.start()
+    for _ in range(min(alloc_ticks, ticks)):
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        blocks_before = sys.getallocatedblocks()
+        sim.tick()
+        after, peak = tracemalloc.get_traced_memory()
+        peaks.append(peak - before)
+        retained.append(after - before)
+        blocks.append(sys.getallocatedblocks() - blocks_before)
+    tracemalloc.stop()
+
+    return {
+        "backend": backend,
+        "facilities": len(sim.facility_ids),
+        "fixture": fixture,
+        "active_patients": active,
+        "ticks": ticks,
+        "ticks_per_sec": round(ticks / sum(durations), 1),
+        "tick": latency_stats(durations),
+        "alloc": {
+            "peak_kb_per_tick": round(float(np.mean(peaks)) / 1024, 1),
+            "retained_kb_per_tick": round(float(np.mean(retained)) / 1024, 2),
+            "net_blocks_per_tick": round(float(np.mean(blocks)), 1),
+        },
+    }
+
+def synthetic_facilities(count: int) -> List[Dict]:
+    # `count` EDs cloned from the seed facilities, spread over a ~100 km square
+    seeds = seed_records()
+    side = int(np.ceil(np.sqrt(count)))
+    records = []
+    for k in range(count):
+        base = seeds[k % len(seeds)]
+        records.append({**base, "id": f"{base['id']}-{k}", "name": f"{base['name']} #{k}",
+                        "lat": 43.2 + 0.9 * (k // side) / side, "lon": -79.9 + 1.2 * (k % side) / side})
+    return records
+
+def run_engine_case(case: Dict) -> Dict:
+    # Fresh interpreter per case: SOLARIS_FACILITIES is read at import
+    env = dict(os.environ)
+    with tempfile.TemporaryDirectory() as tmp:
+        if case["facilities"] != len(seed_records()):
+            path = os.path.join(tmp, "facilities.json")
+            with open(path, "w") as f: json.dump(synthetic_facilities(case["facilities"]), f)
+            env["SOLARIS_FACILITIES"] = path
+        else:
+            env.pop("SOLARIS_FACILITIES", None)
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), "--engine-case", json.dumps(case)],
+                             env=env, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+# ---------------------------------------------------------
+# Sessions: one live-loop iteration ticks every session
+# ---------------------------------------------------------
+def bench_sessions(backend: str, count: int, fixture: str, iterations: int, seed: int = 0, warmup: int = 720) -> Dict:
+    from session_manager import SessionManager
+
+    template = build_fixture(backend, fixture, seed, warmup)
+    sessions = SessionManager(backend, max_sessions=count, checkpoint_interval=0)
+    for i in range(count): sessions.adopt(f"bench-{i}", clone(template, seed + i))
+
+    gc.collect()
+    durations = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        sessions.tick_all(1)
+        durations.append(time.perf_counter() - start)
+    stats = latency_stats(durations)
+    return {
+        "backend": backend,
+        "sessions": count,
+        "fixture": fixture,
+        "iterations": iterations,
+        "session_ticks_per_sec": round(count * iterations / sum(durations), 1),
+        "loop": stats,
+        "overruns": sum(1 for d in durations if d * 1000 > TICK_BUDGET_MS),
+    }
+
+# ---------------------------------------------------------
+# API: concurrent clients against the in-process app (live loop running)
+# ---------------------------------------------------------
+async def _api_load(app, session_ids: List[str], clients: int, requests_per_client: int) -> Dict:
+    import httpx
+
+    latencies = {path: [] for path in API_ENDPOINTS}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        # Untimed first read per session: a session nobody polled waits one tick for its first publish
+        await asyncio.gather(*(client.get("/status", params={"session_id": sid}) for sid in session_ids))
+
+        async def run_client(k):
+            for i in range(requests_per_client):
+                path = API_ENDPOINTS[(k + i) % len(API_ENDPOINTS)]
+                start = time.perf_counter()
+                response = await client.get(path, params={"session_id": session_ids[(k + i) % len(session_ids)]})
+                latencies[path].append(time.perf_counter() - start)
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(run_client(k) for k in range(clients)))
+        elapsed = time.perf_counter() - start
+    return {
+        "requests": clients * requests_per_client,
+        "requests_per_sec": round(clients * requests_per_client / elapsed, 1),
+        "endpoints": {path: latency_stats(values) for path, values in latencies.items()},
+    }
+
+def bench_api(backend: str, session_count: int, client_counts: List[int], requests_per_client: int,
+              fixture: str = "steady", seed: int = 0, warmup: int = 720) -> List[Dict]:
+    os.environ["SOLARIS_SHARDS"] = "0" # Sessions are adopted into this process's manager
+    os.environ["SOLARIS_ENGINE"] = backend
+    import main
+
+    template = build_fixture(backend, fixture, seed, warmup)
+    session_ids = [f"api-{i}" for i in range(session_count)]
+    for i, sid in enumerate(session_ids): main.sessions.adopt(sid, clone(template, seed + i))
+
+    async def run_all():
+        loop = asyncio.create_task(main.run_simulation())
+        try:
+            results = []
+            for clients in client_counts:
+                result = await _api_load(main.app, session_ids, clients, requests_per_client)
+                results.append({"backend": backend, "sessions": session_count, "clients": clients, **result})
+            return results
+        finally:
+            loop.cancel()
+    return asyncio.run(run_all())
+
+# ---------------------------------------------------------
+# Driver
+# ---------------------------------------------------------
+def _meta(args) -> Dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "commit": commit,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "args": vars(args),
+    }
+
+def compare(old_path: str, new_path: str):
+    # Throughput and p99 of matching cases, new / old
+    with open(old_path) as f: old = json.load(f)
+    with open(new_path) as f: new = json.load(f)
+    print(f"{old['meta']['commit'] or old_path} -> {new['meta']['commit'] or new_path}")
+    sections = {
+        "engine": (("backend", "facilities", "fixture"), "ticks_per_sec", "tick"),
+        "sessions": (("backend", "sessions", "fixture"), "session_ticks_per_sec", "loop"),
+    }
+    for section, (keys, rate, latency) in sections.items():
+        before = {tuple(c[k] for k in keys): c for c in old.get(section, [])}
+        for case in new.get(section, []):
+            key = tuple(case[k] for k in keys)
+            if key not in before: continue
+            b = before[key]
+            print(f"{section:8} {'/'.join(map(str, key)):28} {rate} x{case[rate] / b[rate]:.2f}  "
+                  f"p99 {b[latency]['p99_ms']:.2f} -> {case[latency]['p99_ms']:.2f} ms")
+    before = {(c["backend"], c["sessions"], c["clients"]): c for c in old.get("api", [])}
+    for case in new.get("api", []):
+        b = before.get((case["backend"], case["sessions"], case["clients"]))
+        if b is None: continue
+        for path, stats in case["endpoints"].items():
+            print(f"api      {case['clients']:>3} clients {path:12} p99 {b['endpoints'][path]['p99_ms']:.2f} -> {stats['p99_ms']:.2f} ms")
+
+def _int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v]
+
+def _str_list(value: str) -> List[str]:
+    return [v for v in value.split(",") if v]
+
+def main():
+    parser = argparse.ArgumentParser(description="Tick throughput / latency and API latency benchmarks.")
+    parser.add_argument("--backends", type=_str_list, default=list(ENGINE_BACKENDS))
+    parser.add_argument("--fixtures", type=_str_list, default=list(FIXTURES))
+    parser.add_argument("--facilities", type=_int_list, default=[5, 50, 500], help="Facility counts for the engine cases")
+    parser.add_argument("--sessions", type=_int_list, default=[1, 20, 200], help="Session counts for the loop cases")
+    parser.add_argument("--clients", type=_int_list, default=[1, 8, 32], help="Concurrent API clients")
+    parser.add_argument("--api-sessions", type=int, default=10, help="Live sessions the API clients read")
+    parser.add_argument("--ticks", type=int, default=200, help="Timed ticks per engine case / loop iterations per session case")
+    parser.add_argument("--requests", type=int, default=50, help="Requests per API client")
+    parser.add_argument("--warmup", type=int, default=720, help="Simulated minutes before the steady / surge fixtures")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skip", type=_str_list, default=[], help="Sections to skip: engine, sessions, api")
+    parser.add_argument("--quick", action="store_true", help="Small smoke run (5 / 50 facilities, 1 / 20 sessions, 50 ticks)")
+    parser.add_argument("--output", "-o", default="benchmark.json")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Compare two result files and exit")
+    parser.add_argument("--engine-case", help=argparse.SUPPRESS) # Internal: one engine case (JSON) in this process
+    args = parser.parse_args()
+
+    if args.engine_case:
+        case = json.loads(args.engine_case)
+        case.pop("facilities")
+        print(json.dumps(bench_engine(**case)))
+        return
+    if args.compare:
+        compare(*args.compare)
+        return
+    if args.quick:
+        args.facilities, args.sessions, args.clients = [5, 50], [1, 20], [1, 8]
+        args.ticks, args.requests, args.warmup = 50, 20, 240
+    for backend in args.backends: create_engine(backend) # Fail fast on bad names
+    for fixture in args.fixtures:
+        if fixture not in FIXTURES: parser.error(f"Unknown fixture '{fixture}'")
+
+    result = {"meta": _meta(args), "engine": [], "sessions": [], "api": []}
+    if "engine" not in args.skip:
+        for facilities in args.facilities:
+            for backend in args.backends:
+                for fixture in args.fixtures:
+                    case = run_engine_case({"backend": backend, "fixture": fixture, "facilities": facilities,
+                                            "ticks": args.ticks, "seed": args.seed, "warmup": args.warmup})
+                    result["engine"].append(case)
+                    print(f"engine   {backend:8} {facilities:>4} EDs {fixture:6} {case['active_patients']:>6} patients  "
+                          f"{case['ticks_per_sec']:>8} ticks/s  p50 {case['tick']['p50_ms']:.2f} ms  p99 {case['tick']['p99_ms']:.2f} ms  "
+                          f"peak {case['alloc']['peak_kb_per_tick']} KB/tick")
+    if "sessions" not in args.skip:
+        for count in args.sessions:
+            for backend in args.backends:
+                case = bench_sessions(backend, count, "steady", args.ticks, args.seed, args.warmup)
+                result["sessions"].append(case)
+                print(f"sessions {backend:8} {count:>4} sessions  {case['session_ticks_per_sec']:>8} session-ticks/s  "
+                      f"loop p50 {case['loop']['p50_ms']:.2f} ms  p99 {case['loop']['p99_ms']:.2f} ms  overruns {case['overruns']}")
+    if "api" not in args.skip:
+        backend = args.backends[0]
+        for case in bench_api(backend, args.api_sessions, args.clients, args.requests, seed=args.seed, warmup=args.warmup):
+            result["api"].append(case)
+            endpoints = "  ".join(f"{path} p50 {s['p50_ms']:.1f} / p99 {s['p99_ms']:.1f} ms" for path, s in case["endpoints"].items())
+            print(f"api      {backend:8} {case['clients']:>3} clients  {case['requests_per_sec']:>7} req/s  {endpoints}")
+
+    with open(args.output, "w") as f: json.dump(result, f, indent=2)
+    print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
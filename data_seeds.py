@@ -99,3 +99,16 @@ CLINICAL_RULES = [
 ]
 
 SAFETY_KEYWORDS = ["hospitalization", "admit", "ICU"]
+
+# Syndromic surveillance: more than `threshold` arrivals with any of `symptoms`
+# at one facility within `window_minutes` of sim time raises `signal_id`
+SYNDROMIC_SIGNALS = [
+    {
+        "signal_id": "R-BIO-01",
+        "symptoms": ["Difficulty Breathing"],
+        "window_minutes": 60,
+        "threshold": 3,
+        "severity": "CRITICAL",
+        "explanation": "BIO_SIGNAL_DETECTED: >3 Respiratory Distress cases in <60 mins."
+    }
+]
@@ -0,0 +1,511 @@
+from typing import Dict
+
+import numpy as np
+
+from models import Encounter
+from facility_registry import REGISTRY
+from engine_sim import SimulationEngine, PRODUCTIVITY_FACTOR, DIVERSION_REDUCTION
+from sim_metrics import phase_clock
+
+# ---------------------------------------------------------
+# Small-int codes for the hot columns
+# ---------------------------------------------------------
+STATUS_CODES = ("WAITING", "ROOMED", "WAITING_FOR_RESULTS", "ADMITTED_NO_BED", "LWBS", "DISCHARGED")
+RESOURCE_CODES = ("NONE", "BED", "CHAIR", "HALLWAY")
+STAGE_CODES = (None, "TRIAGE", "ASSESSING", "TESTING", "TREATING", "BOARDING")
+DISPOSITION_CODES = (None, "ADMIT", "DISCHARGE")
+
+WAITING, ROOMED, WAITING_FOR_RESULTS, ADMITTED_NO_BED, LWBS, DISCHARGED = range(6)
+RES_NONE, RES_BED, RES_CHAIR, RES_HALLWAY = range(4)
+STAGE_NONE, TRIAGE, ASSESSING, TESTING, TREATING, BOARDING = range(6)
+DISP_NONE, DISP_ADMIT, DISP_DISCHARGE = range(3)
+
+# LWBS threshold (minutes waiting) indexed by CTAS. 0 = never leaves.
+LWBS_THRESHOLDS = np.array([0, 0, 0, 600, 240, 180], dtype=np.int32)
+
+FACILITY_IDS = REGISTRY.ids
+FACILITY_INDEX = REGISTRY.index
+
+# (column name, dtype) for everything the tick touches
+HOT_COLUMNS = (
+    ("alive", np.bool_),
+    ("facility", np.int16),
+    ("ctas", np.int8),
+    ("status", np.int8),
+    ("resource", np.int8),
+    ("stage", np.int8),
+    ("disposition", np.int8),
+    ("lab_timer", np.int32),
+    ("wait_time", np.int32),
+    ("treatment_time", np.int32),
+    ("seq", np.int64), # Arrival order, used as the queue tie-breaker
+)
+
+
+class PatientStore:
+    # Parallel typed arrays, one row (slot) per active patient.
+    # Freed slots are recycled so the arrays only grow to peak census.
+    def __init__(self, capacity=256):
+        self.capacity = capacity
+        self.size = 0 # High-water mark; rows >= size are never alive
+        self.free_slots = []
+        self.slot_of: Dict[str, int] = {}
+        self.next_seq = 0
+        for name, dtype in HOT_COLUMNS:
+            setattr(self, name, np.zeros(capacity, dtype=dtype))
+        # Cold fields are only read to build Encounter objects for the API
+        # (id, patient_age, symptom, is_serious, clinical_notes, arrival_time, arrival_tick)
+        self.cold = [None] * capacity
+
+    def __len__(self):
+        return len(self.slot_of)
+
+    def _grow(self):
+        new_capacity = self.capacity * 2
+        for name, dtype in HOT_COLUMNS:
+            column = np.zeros(new_capacity, dtype=dtype)
+            column[:self.capacity] = getattr(self, name)
+            setattr(self, name, column)
+        self.cold.extend([None] * (new_capacity - self.capacity))
+        self.capacity = new_capacity
+
+    def insert(self, encounter: Encounter):
+        if self.free_slots:
+            slot = self.free_slots.pop()
+        else:
+            if self.size == self.capacity: self._grow()
+            slot = self.size
+            self.size += 1
+
+        self.alive[slot] = True
+        self.facility[slot] = FACILITY_INDEX[encounter.facility_id]
+        self.ctas[slot] = encounter.assigned_ctas
+        self.status[slot] = STATUS_CODES.index(encounter.status)
+        self.resource[slot] = RESOURCE_CODES.index(encounter.resource_type)
+        self.stage[slot] = STAGE_CODES.index(encounter.stage)
+        self.disposition[slot] = DISPOSITION_CODES.index(encounter.disposition)
+        self.lab_timer[slot] = encounter.lab_timer
+        self.wait_time[slot] = encounter.wait_time_remaining
+        self.treatment_time[slot] = encounter.treatment_time_remaining
+        self.seq[slot] = self.next_seq
+        self.next_seq += 1
+        self.cold[slot] = (
+            encounter.id,
+            encounter.patient_age,
+            encounter.symptom,
+            encounter.is_serious,
+            encounter.clinical_notes,
+            encounter.arrival_time,
+            encounter.arrival_tick,
+        )
+        self.slot_of[encounter.id] = slot
+        return slot
+
+    def release(self, slots):
+        for slot in slots:
+            del self.slot_of[self.cold[slot][0]]
+            self.cold[slot] = None
+            self.free_slots.append(slot)
+        self.alive[slots] = False
+
+    def clear(self):
+        self.alive[:] = False
+        self.size = 0
+        self.free_slots = []
+        self.slot_of = {}
+        self.cold = [None] * self.capacity
+
+    def get_state(self):
+        n = self.size
+        live = [slot for slot in range(n) if self.cold[slot] is not None]
+        cold = [self.cold[slot] for slot in live]
+        return {
+            "size": n,
+            "next_seq": self.next_seq,
+            "free_slots": self.free_slots,
+            "columns": {name: getattr(self, name)[:n] for name, _ in HOT_COLUMNS},
+            "live": live,
+            "cold": [list(column) for column in zip(*cold)] if cold else [[] for _ in range(7)],
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        n = state["size"]
+        store = cls(capacity=max(256, n))
+        store.size = n
+        store.next_seq = state["next_seq"]
+        store.free_slots = list(state["free_slots"])
+        for name, _ in HOT_COLUMNS: getattr(store, name)[:n] = state["columns"][name]
+        for slot, cold in zip(state["live"], zip(*state["cold"])):
+            store.cold[slot] = cold
+            store.slot_of[cold[0]] = slot
+        return store
+
+    def live_slots(self):
+        return np.flatnonzero(self.alive[:self.size])
+
+    def to_encounter(self, slot) -> Encounter:
+        eid, age, symptom, is_serious, notes, arrival_time, arrival_tick = self.cold[slot]
+        return Encounter(
+            id=eid,
+            facility_id=FACILITY_IDS[self.facility[slot]],
+            patient_age=age,
+            symptom=symptom,
+            assigned_ctas=int(self.ctas[slot]),
+            arrival_time=arrival_time,
+            arrival_tick=arrival_tick,
+            status=STATUS_CODES[self.status[slot]],
+            resource_type=RESOURCE_CODES[self.resource[slot]],
+            disposition=DISPOSITION_CODES[self.disposition[slot]],
+            stage=STAGE_CODES[self.stage[slot]],
+            lab_timer=int(self.lab_timer[slot]),
+            is_serious=is_serious,
+            clinical_notes=notes,
+            wait_time_remaining=int(self.wait_time[slot]),
+            treatment_time_remaining=int(self.treatment_time[slot]),
+            discharged=False,
+        )
+
+
+class ColumnarSimulationEngine(SimulationEngine):
+    # Same behaviour and API as SimulationEngine, but patient state lives in a
+    # PatientStore and the per-minute state machine runs as vectorized masks.
+    # Encounter objects are only materialized when the API asks for them.
+    def __init__(self, **kwargs):
+        self.store = PatientStore()
+        super().__init__(**kwargs)
+
+    # Built on demand; assigning a dict reloads the store from Encounter objects
+    @property
+    def active_encounters(self) -> Dict[str, Encounter]:
+        return {self.store.cold[slot][0]: self.store.to_encounter(slot) for slot in self.store.live_slots()}
+
+    @active_encounters.setter
+    def active_encounters(self, encounters):
+        self.store.clear()
+        for encounter in encounters.values():
+            self.store.insert(encounter)
+
+    def _add_encounter(self, encounter):
+        self.store.insert(encounter)
+
+    # Snapshots keep the raw slot layout: the tick draws one uniform per slot,
+    # so the same layout is what makes a restored run identical
+    def _snapshot_patients(self):
+        return self.store.get_state()
+
+    def _restore_patients(self, patients):
+        self.store = PatientStore.from_state(patients)
+
+    def _active_count(self):
+        return len(self.store)
+
+    def _status_counts(self) -> Dict[str, int]:
+        st = self.store
+        counts = np.bincount(st.status[:st.size][st.alive[:st.size]], minlength=len(STATUS_CODES))
+        return {STATUS_CODES[i]: int(c) for i, c in enumerate(counts) if c}
+
+    def _max_wait(self):
+        st = self.store
+        n = st.size
+        waiting = st.alive[:n] & (st.status[:n] == WAITING)
+        return int(st.wait_time[:n][waiting].max()) if waiting.any() else 0
+
+    def _set_scenario_parameters(self, params):
+        super()._set_scenario_parameters(params)
+        # Per-facility arrays for the vectorized arrival step
+        self._diversion_queue_limit = np.array([self.resources[fid]["physical_beds"] * self.diversion_factor for fid in FACILITY_IDS])
+        self._forced_index = np.array([FACILITY_INDEX[fid] for fid in self.forced_diversion], dtype=np.int64)
+        self._forced_value = np.array(list(self.forced_diversion.values()), dtype=np.bool_)
+        self._discharge_budgets = {shift: np.array([rates[fid] for fid in FACILITY_IDS]) for shift, rates in self._discharge_rates.items()}
+
+    def _nearest_open_facility(self, facility_id):
+        for j in REGISTRY.neighbour_index[FACILITY_INDEX[facility_id]].tolist():
+            if not self._diverted_mask[j]: return FACILITY_IDS[j]
+        return None
+
+    def _facility_boarding(self):
+        st = self.store
+        n = st.size
+        boarding = st.alive[:n] & (st.stage[:n] == BOARDING) & ((st.status[:n] == ROOMED) | (st.status[:n] == ADMITTED_NO_BED))
+        counts = np.bincount(st.facility[:n][boarding], minlength=len(FACILITY_IDS))
+        return {FACILITY_IDS[i]: int(c) for i, c in enumerate(counts) if c}
+
+    def _discharge_budget(self):
+        return self._discharge_budgets[self._current_shift()]
+
+    def tick(self, is_fast_forward=False):
+        clock = phase_clock(is_fast_forward)
+        self._advance_clock(is_fast_forward)
+        st = self.store
+        n_fac = len(FACILITY_IDS)
+
+        # ---------------------------------------------------------
+        # 1. ARRIVALS (With Ambulance Diversion)
+        # ---------------------------------------------------------
+        n = st.size
+        waiting = st.alive[:n] & (st.status[:n] == WAITING)
+        queue_len = np.bincount(st.facility[:n][waiting], minlength=n_fac)
+        rates = self.arrivals.rates(self.sim_minute)
+        diverted = queue_len > self._diversion_queue_limit
+        diverted[self._forced_index] = self._forced_value
+        # Regional redirects are routed by the start-of-minute diversion state
+        if self.regional: self._diverted_mask = diverted
+        if self.arrivals.poisson_at(self.sim_minute):
+            self._poisson_arrivals(rates, diverted, is_fast_forward)
+        else:
+            prob = np.minimum(1.0, rates * self._multiplier_array)
+            undiverted = prob.copy() if self.regional else None
+            prob[diverted] *= DIVERSION_REDUCTION # 90% Reduction (Diversion)
+            u = self.rng.uniforms(n_fac)
+            self._generate_encounters([FACILITY_IDS[i] for i in np.flatnonzero(u < prob).tolist()], is_fast_forward)
+            if self.regional:
+                # Would have arrived without diversion
+                for i in np.flatnonzero((u >= prob) & (u < undiverted)):
+                    self._redirect_arrival(FACILITY_IDS[i], is_fast_forward)
+
+        clock.lap("arrivals")
+
+        # ---------------------------------------------------------
+        # 2. PROCESS PATIENTS (Vectorized States & Timers)
+        # ---------------------------------------------------------
+        n = st.size
+        alive = st.alive[:n]
+        fac = st.facility[:n]
+        ctas = st.ctas[:n]
+        status = st.status[:n]
+        resource = st.resource[:n]
+        stage = st.stage[:n]
+        disposition = st.disposition[:n]
+        lab_timer = st.lab_timer[:n]
+        wait_time = st.wait_time[:n]
+        treatment_time = st.treatment_time[:n]
+
+        # Masks are taken from start-of-tick state so each patient follows
+        # exactly one branch, as in the per-object loop.
+        status0 = status.copy()
+        stage0 = stage.copy()
+        in_care = alive & ((status0 == ROOMED) | (status0 == ADMITTED_NO_BED))
+
+        # Census by facility + resource type (BED/CHAIR/HALLWAY)
+        occupied = in_care & (resource != RES_NONE)
+        census = np.bincount(fac[occupied].astype(np.int64) * 4 + resource[occupied], minlength=n_fac * 4).reshape(n_fac, 4)
+
+        discharge_budget = self._discharge_budget()
+        u = self.rng.uniforms(n) # One uniform per patient; each branch uses it at most once
+
+        # --- ASSESSING: 1/15 chance per minute to reach the decision point ---
+        assessing = in_care & (stage0 == ASSESSING)
+        decided = assessing & (u < (1/15))
+        needs_tests = decided & (ctas <= 3)
+        stage[needs_tests] = TESTING
+        lab_timer[needs_tests] = 90 if (0 <= self.current_sim_hour < 8) else 45
+        stage[decided & (ctas > 3)] = TREATING
+
+        # --- TESTING: most CTAS 2+ move to the internal results room ---
+        testing = in_care & (stage0 == TESTING)
+        to_results = testing & (ctas > 1) & (u < 0.8)
+        status[to_results] = WAITING_FOR_RESULTS
+        resource[to_results] = RES_NONE
+        in_bed = testing & ~to_results
+        lab_timer[in_bed] -= 1
+        results_back = in_bed & (lab_timer <= 0)
+        stage[results_back & (disposition == DISP_ADMIT)] = BOARDING
+        stage[results_back & (disposition != DISP_ADMIT)] = TREATING
+
+        # --- TREATING / BOARDING: countdown, then discharge within MD budget ---
+        treating = in_care & ((stage0 == TREATING) | (stage0 == BOARDING))
+        treatment_time[treating] -= 1
+        discharged = treating & (treatment_time <= 0) & (u < discharge_budget[fac])
+
+        # --- Anything else in care (TRIAGE) starts assessment ---
+        stage[in_care & ~(assessing | testing | treating)] = ASSESSING
+
+        # --- Internal Waiting Room: consuming time but NO resources ---
+        lab_timer[alive & (status0 == WAITING_FOR_RESULTS)] -= 1
+
+        # --- WAITING: LWBS check ---
+        waiting = alive & (status0 == WAITING)
+        wait_time[waiting] += 1
+        threshold = LWBS_THRESHOLDS[ctas]
+        left = waiting & (threshold > 0) & (wait_time > threshold)
+        status[left] = LWBS
+
+        # Exits
+        discharged_slots = np.flatnonzero(discharged)
+        left_slots = np.flatnonzero(left)
+        for slot in discharged_slots:
+            encounter = st.to_encounter(slot)
+            fid = encounter.facility_id
+            if stage0[slot] == BOARDING:
+                self._log_exit(encounter, "DISCHARGED", "WARD", "ADMIT", fid)
+            else:
+                self._log_exit(encounter, "DISCHARGED", "HOME", "DISCHARGE", fid)
+        for slot in left_slots:
+            encounter = st.to_encounter(slot)
+            self._log_exit(encounter, "LWBS", "EXIT", "UNKNOWN", encounter.facility_id, ttl=300)
+        self.lwbs_count += len(left_slots)
+        for i in fac[left_slots].tolist(): self.lwbs_by_facility[FACILITY_IDS[i]] += 1
+
+        clock.lap("patients")
+
+        # Cleanup Active
+        if len(discharged_slots) or len(left_slots):
+            st.release(np.concatenate([discharged_slots, left_slots]))
+        self._prune_recent_exits()
+        clock.lap("cleanup")
+
+        # ---------------------------------------------------------
+        # 3. ADMISSION LOGIC (Complex Flow)
+        # ---------------------------------------------------------
+        alive = st.alive[:n]
+        ready = alive & (status == WAITING_FOR_RESULTS) & (lab_timer <= 0)
+        waiting = alive & (status == WAITING)
+
+        for i, fid in enumerate(FACILITY_IDS):
+            res = self.resources[fid]
+
+            p_beds = res["physical_beds"]
+            p_chairs = res.get("chair_capacity", 20)
+            surge_cap = res["surge_capacity"]
+
+            occ_beds = int(census[i, RES_BED])
+            occ_chairs = int(census[i, RES_CHAIR])
+            total_census = int(census[i, RES_BED] + census[i, RES_CHAIR] + census[i, RES_HALLWAY])
+
+            # Velocity Cap
+            rate = discharge_budget[i]
+            admit_quota = int(rate) + (1 if self.rng.random() < (rate % 1) else 0)
+            if admit_quota == 0: continue
+            admitted_count = 0
+
+            # 1. Process "Results Back" Patients (Priority Re-Entry), in arrival order
+            results_queue = np.flatnonzero(ready & (fac == i))
+            results_queue = results_queue[np.argsort(st.seq[results_queue], kind="stable")]
+
+            for slot in results_queue:
+                if admitted_count >= admit_quota: break
+
+                # Re-assign resource
+                assigned = RES_NONE
+                if occ_chairs < p_chairs and ctas[slot] in (2, 3, 4, 5):
+                    assigned = RES_CHAIR
+                    occ_chairs += 1
+                elif occ_beds < p_beds:
+                    assigned = RES_BED
+                    occ_beds += 1
+                elif total_census < surge_cap:
+                    assigned = RES_HALLWAY
+                    total_census += 1
+
+                if assigned != RES_NONE:
+                    resource[slot] = assigned
+                    status[slot] = ROOMED
+                    stage[slot] = BOARDING if disposition[slot] == DISP_ADMIT else TREATING
+                    admitted_count += 1
+                    if not is_fast_forward:
+                        self.event_log.event(self.sim_minute, "results_back", "Patient P-{patient} Results Back -> {resource}.",
+                                             facility_id=fid, patient=st.cold[slot][0][-4:], resource=RESOURCE_CODES[assigned])
+
+            # 2. Process Waiting Room, sorted by (CTAS, arrival)
+            waiting_queue = np.flatnonzero(waiting & (fac == i))
+            waiting_queue = waiting_queue[np.lexsort((st.seq[waiting_queue], ctas[waiting_queue]))]
+
+            for slot in waiting_queue:
+                if admitted_count >= admit_quota: break
+
+                new_status = None
+                # CTAS 1 -> BED Priority
+                if ctas[slot] == 1:
+                    if occ_beds < p_beds:
+                        new_status, assigned = ROOMED, RES_BED
+                        occ_beds += 1
+                    # If no beds, maybe Hallway? CTAS 1 needs Bed ideally.
+                    elif total_census < surge_cap:
+                        new_status, assigned = ADMITTED_NO_BED, RES_HALLWAY
+                        total_census += 1
+
+                # CTAS 2 -> CHAIR Priority
+                elif ctas[slot] == 2:
+                    if occ_chairs < p_chairs:
+                        new_status, assigned = ROOMED, RES_CHAIR
+                        occ_chairs += 1
+                    elif occ_beds < p_beds:
+                        new_status, assigned = ROOMED, RES_BED
+                        occ_beds += 1
+
+                # Others
+                else:
+                    if occ_chairs < p_chairs:
+                        new_status, assigned = ROOMED, RES_CHAIR
+                        occ_chairs += 1
+                    elif occ_beds < p_beds:
+                        new_status, assigned = ROOMED, RES_BED
+                        occ_beds += 1
+                    elif total_census < surge_cap:
+                        new_status, assigned = ADMITTED_NO_BED, RES_HALLWAY
+                        total_census += 1
+
+                if new_status is not None:
+                    status[slot] = new_status
+                    resource[slot] = assigned
+                    admitted_count += 1
+                    self._init_slot_flow(slot)
+        clock.lap("admission")
+
+    def _init_slot_flow(self, slot):
+        st = self.store
+        st.stage[slot] = ASSESSING
+        # Scale Checkups/Labs by Productivity
+        base_lab = 90 if (0 <= self.current_sim_hour < 8) else 45
+        st.lab_timer[slot] = int(base_lab / PRODUCTIVITY_FACTOR)
+
+        if self.rng.random() < 0.15:
+            st.disposition[slot] = DISP_ADMIT
+            base_treat = self.rng.randint(1440, 2880)
+        else:
+            st.disposition[slot] = DISP_DISCHARGE
+            if st.ctas[slot] in (1, 2):
+                 base_treat = self.rng.randint(240, 480)
+            elif st.ctas[slot] == 3:
+                 base_treat = self.rng.randint(180, 360)
+            else:
+                 base_treat = self.rng.randint(60, 180)
+        st.treatment_time[slot] = int(base_treat / PRODUCTIVITY_FACTOR)
+
+    def _facility_census(self):
+        st = self.store
+        counts = np.bincount(st.facility[st.live_slots()], minlength=len(FACILITY_IDS))
+        return {FACILITY_IDS[i]: int(c) for i, c in enumerate(counts) if c}
+
+    def _collect_patients(self):
+        st = self.store
+        slots = st.live_slots()
+        status = st.status[slots]
+
+        in_care = (status == ROOMED) | (status == ADMITTED_NO_BED)
+        fac_counts = np.bincount(st.facility[slots][in_care], minlength=len(FACILITY_IDS))
+        census = {FACILITY_IDS[i]: int(c) for i, c in enumerate(fac_counts) if c}
+        hallway_count = int((status == ADMITTED_NO_BED).sum())
+
+        patient_list = []
+        for slot, fac, ctas, status_code, stage, disposition, resource in zip(
+            slots.tolist(),
+            st.facility[slots].tolist(),
+            st.ctas[slots].tolist(),
+            status.tolist(),
+            st.stage[slots].tolist(),
+            st.disposition[slots].tolist(),
+            st.resource[slots].tolist(),
+        ):
+            patient_list.append({
+                "id": st.cold[slot][0],
+                "facility_id": FACILITY_IDS[fac],
+                "assigned_ctas": ctas,
+                "status": STATUS_CODES[status_code],
+                "stage": STAGE_CODES[stage],
+                "disposition": DISPOSITION_CODES[disposition],
+                "resource_type": RESOURCE_CODES[resource],
+                "ttl": -1 # Active
+            })
+        return census, hallway_count, patient_list
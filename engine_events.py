@@ -0,0 +1,394 @@
+import heapq
+import math
+
+import numpy as np
+
+from arrival_process import truncated_poisson
+from engine_sim import SimulationEngine, DIVERSION_REDUCTION
+from sim_metrics import phase_clock
+from facility_registry import REGISTRY
+
+# Phases within one simulated minute, in the same order tick() runs them
+PHASE_CLOCK = 0    # Hour rollover (and the shift change it may cause), surge start / end
+PHASE_ARRIVAL = 1  # New patients
+PHASE_PATIENT = 2  # Lab results, treatment complete, LWBS deadlines, ...
+
+# LWBS threshold (minutes waiting) by CTAS; CTAS 1/2 never leave
+LWBS_THRESHOLDS = {3: 600, 4: 240, 5: 180}
+
+
+def geometric(p, rng):
+    # Number of per-minute Bernoulli(p) trials up to and including the first success
+    if p >= 1: return 1
+    if p <= 0: return math.inf
+    return 1 + int(math.log(1.0 - rng.random()) / math.log(1.0 - p))
+
+
+class EventScheduler:
+    # Priority queue of (minute, phase, seq, kind, target, token).
+    # Events are cancelled lazily: the engine bumps a token and stale events
+    # are dropped when they come due.
+    def __init__(self):
+        self._heap = []
+        self._seq = 0
+
+    def __len__(self):
+        return len(self._heap)
+
+    def push(self, minute, phase, kind, target, token):
+        if minute == math.inf: return
+        heapq.heappush(self._heap, (minute, phase, self._seq, kind, target, token))
+        self._seq += 1
+
+    def peek_minute(self):
+        return self._heap[0][0] if self._heap else math.inf
+
+    def pop_due(self, minute, phase):
+        # Next event at (minute, <= phase), or None
+        if self._heap and self._heap[0][0] <= minute and self._heap[0][1] <= phase:
+            return heapq.heappop(self._heap)
+        return None
+
+
+class EventDrivenSimulationEngine(SimulationEngine):
+    # Next-event kernel with the same per-minute semantics as tick().
+    #
+    # Every per-minute coin flip in SimulationEngine is a Bernoulli trial, so
+    # the minute it first succeeds is geometric and can be drawn up front:
+    # arrivals (hourly rate / diversion), assessment (1/15), the 0.8
+    # results-room split and the MD discharge roll. Countdown timers and the
+    # hour rollover become fixed deadlines. When a rate changes (new hour, shift
+    # change, diversion on/off) the pending draw is simply redrawn, which is
+    # exact because the trials are memoryless.
+    #
+    # Minutes with no due event and no possible admission are skipped, so
+    # advance() runs multi-day horizons in a handful of steps per patient.
+    # Timers on the Encounter objects are brought up to date lazily (sync()).
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.scheduler = EventScheduler()
+        self._tokens = {}       # encounter id / facility id / "HOUR" -> current event token
+        self._anchors = {}      # encounter id -> (field, value, minute, direction) for lazy timers
+        self._treat_start = {}  # encounter id -> (first discharge-roll minute) while treating
+        self._diverted = {fid: False for fid in self.facility_ids}
+        self._is_fast_forward = True
+
+        self._schedule("HOUR", self.sim_minute + 60, PHASE_CLOCK, "HOUR")
+        for fid in self.facility_ids:
+            self._schedule_arrival(fid, self.sim_minute + 1)
+
+    # ---------------------------------------------------------
+    # Public API
+    # ---------------------------------------------------------
+    def tick(self, is_fast_forward=False):
+        self.advance(1, is_fast_forward)
+
+    def advance(self, minutes, is_fast_forward=True):
+        target = self.sim_minute + minutes
+        self._is_fast_forward = is_fast_forward
+        while True:
+            minute = self._next_active_minute()
+            if minute > target: break
+            self._process_minute(minute)
+        # Idle tail: nothing happens, only exit-banner TTLs run down
+        self._prune_recent_exits(target - self.sim_minute)
+        self.sim_minute = target
+
+    def set_scenario(self, **overrides):
+        super().set_scenario(**overrides)
+        # Rates may have changed: redraw pending arrivals and discharge rolls
+        # from the next minute (exact, the trials are memoryless)
+        for fid in self.facility_ids:
+            self._diverted[fid] = self._is_diverted(fid, len(self.waiting_queues[fid]))
+            self._schedule_arrival(fid, self.sim_minute + 1)
+        for eid, first_roll in self._treat_start.items():
+            self._schedule_discharge(eid, self.active_encounters[eid].facility_id, max(first_roll, self.sim_minute + 1))
+
+    def add_surge(self, *args, **kwargs):
+        # Arrival rates (and possibly the sampler) change at both ends of the window
+        surge = super().add_surge(*args, **kwargs)
+        for minute in (surge["start"], surge["end"]):
+            self._schedule(f"RATES@{minute}", minute, PHASE_CLOCK, "RATES")
+        return surge
+
+    def sync(self):
+        # Materialize lazily tracked timers onto the Encounter objects
+        for eid in self._anchors:
+            self._sync_timer(eid)
+
+    # ---------------------------------------------------------
+    # Scheduling
+    # ---------------------------------------------------------
+    def _schedule(self, target, minute, phase, kind):
+        token = self._tokens.get(target, 0) + 1
+        self._tokens[target] = token
+        self.scheduler.push(minute, phase, kind, target, token)
+
+    def _cancel(self, target):
+        self._tokens[target] = self._tokens.get(target, 0) + 1
+
+    def _arrival_rate(self, fid):
+        # Expected arrivals per minute (Poisson sampler)
+        rate = self.arrivals.rates(self.sim_minute)[REGISTRY.index[fid]] * self.arrival_multipliers[fid]
+        if self._diverted[fid] and not self.regional: rate *= DIVERSION_REDUCTION
+        return rate
+
+    def _arrival_probability(self, fid):
+        # Chance of at least one arrival in a minute. Poisson counts are
+        # thinned to their first minute here; _on_arrival draws the batch size.
+        if self.arrivals.poisson_at(self.sim_minute): return -math.expm1(-self._arrival_rate(fid))
+        prob = self._undiverted_arrival_probability(fid, self.arrivals.rates(self.sim_minute)[REGISTRY.index[fid]])
+        # Regional mode keeps the full rate; the diverted share is redirected on arrival
+        if self._diverted[fid] and not self.regional: prob *= DIVERSION_REDUCTION # 90% Reduction (Diversion)
+        return prob
+
+    def _schedule_arrival(self, fid, first_minute):
+        self._schedule(fid, first_minute - 1 + geometric(self._arrival_probability(fid), self.rng), PHASE_ARRIVAL, "ARRIVAL")
+
+    def _refresh_diversion(self, fid):
+        # A flip changes the arrival rate from next minute (regional mode: only where they go)
+        diverted = self._is_diverted(fid, len(self.waiting_queues[fid]))
+        if diverted != self._diverted[fid]:
+            self._diverted[fid] = diverted
+            if not self.regional: self._schedule_arrival(fid, self.sim_minute + 1)
+
+    def _schedule_discharge(self, eid, fid, first_roll):
+        start = max(first_roll, self.sim_minute)
+        self._schedule(eid, start - 1 + geometric(self._discharge_rate(fid), self.rng), PHASE_PATIENT, "DISCHARGE")
+
+    def _set_anchor(self, eid, field, value, direction):
+        self._anchors[eid] = (field, value, self.sim_minute, direction)
+
+    def _sync_timer(self, eid):
+        field, value, minute, direction = self._anchors[eid]
+        setattr(self.active_encounters[eid], field, value + direction * (self.sim_minute - minute))
+
+    def _admission_possible(self, fid):
+        if not self.waiting_queues[fid] and not self.results_ready[fid]: return False
+        res = self.resources[fid]
+        counts = self.census[fid]
+        return (counts["CHAIR"] < res.get("chair_capacity", 20)
+                or counts["BED"] < res["physical_beds"]
+                or counts["TOTAL"] < res["surge_capacity"])
+
+    def _next_active_minute(self):
+        # Admission runs every minute while someone is queued and a spot is free
+        for fid in self.facility_ids:
+            if self._admission_possible(fid): return self.sim_minute + 1
+        return max(self.scheduler.peek_minute(), self.sim_minute + 1)
+
+    # ---------------------------------------------------------
+    # One simulated minute (same phase order as tick())
+    # ---------------------------------------------------------
+    def _process_minute(self, minute):
+        if minute - self.sim_minute > 1:
+            self._prune_recent_exits(minute - self.sim_minute - 1)
+        self.sim_minute = minute
+        clock = phase_clock(self._is_fast_forward)
+
+        # 1. Clock + Arrivals
+        self._run_events(minute, PHASE_ARRIVAL)
+        clock.lap("arrivals")
+
+        # 2. Patient events; admission sees the census from before them
+        census_counts = {fid: dict(counts) for fid, counts in self.census.items()}
+        self._run_events(minute, PHASE_PATIENT)
+        clock.lap("patients")
+        self._prune_recent_exits()
+        clock.lap("cleanup")
+
+        # 3. Admission
+        for fid, counts in census_counts.items():
+            if self.waiting_queues[fid] or self.results_ready[fid]:
+                self._admit_facility(fid, counts, self._discharge_rate(fid), self._is_fast_forward)
+                self._refresh_diversion(fid)
+        clock.lap("admission")
+
+    def _run_events(self, minute, phase):
+        while True:
+            event = self.scheduler.pop_due(minute, phase)
+            if event is None: return
+            _, _, _, kind, target, token = event
+            if self._tokens.get(target) != token: continue # Cancelled / superseded
+            getattr(self, "_on_" + kind.lower())(target)
+
+    # ---------------------------------------------------------
+    # Event handlers
+    # ---------------------------------------------------------
+    def _on_hour(self, _):
+        old_arrivals = self.arrivals.rates(self.sim_minute - 1)
+        old_rates = {fid: self._discharge_rate(fid) for fid in self.facility_ids}
+
+        self._roll_hour(self._is_fast_forward)
+        self._schedule("HOUR", self.sim_minute + 60, PHASE_CLOCK, "HOUR")
+
+        # Arrival rates changed: redraw those facilities from this minute
+        for i in np.flatnonzero(self.arrivals.rates(self.sim_minute) != old_arrivals).tolist():
+            self._schedule_arrival(self.facility_ids[i], self.sim_minute)
+
+        # Shift change: redraw pending discharge rolls with the new MD budget
+        changed = {fid for fid in self.facility_ids if self._discharge_rate(fid) != old_rates[fid]}
+        if changed:
+            for eid, first_roll in self._treat_start.items():
+                fid = self.active_encounters[eid].facility_id
+                if fid in changed: self._schedule_discharge(eid, fid, first_roll)
+
+    def _on_rates(self, target):
+        # Surge started / ended: redraw every facility from this minute
+        self._tokens.pop(target, None)
+        for fid in self.facility_ids:
+            self._schedule_arrival(fid, self.sim_minute)
+
+    def _on_arrival(self, fid):
+        count = 1
+        if self.arrivals.poisson_at(self.sim_minute): count = truncated_poisson(self._arrival_rate(fid), self.rng.random())
+        arrived = 0
+        for _ in range(count):
+            if self.regional and self._diverted[fid] and self.rng.random() >= DIVERSION_REDUCTION:
+                self._redirect_arrival(fid, self._is_fast_forward)
+            else:
+                arrived += 1
+        self._generate_encounters([fid] * arrived, self._is_fast_forward)
+        self._schedule_arrival(fid, self.sim_minute + 1)
+
+    def _nearest_open_facility(self, fid):
+        for nid in REGISTRY.neighbours[fid]:
+            if not self._diverted[nid]: return nid
+        return None
+
+    def _on_assessed(self, eid):
+        # Decision Point: CTAS 1/2/3 need tests, CTAS 4/5 go straight to treatment
+        patient = self.active_encounters[eid]
+        if patient.assigned_ctas <= 3:
+            patient.stage = "TESTING"
+            lab = 90 if (0 <= self.current_sim_hour < 8) else 45
+            patient.lab_timer = lab
+            self._set_anchor(eid, "lab_timer", lab, -1)
+            # Each minute CTAS 2+ move to the results room with p=0.8;
+            # otherwise the lab timer runs out in the bed
+            leave_after = geometric(0.8, self.rng) if patient.assigned_ctas > 1 else math.inf
+            if leave_after <= lab:
+                self._schedule(eid, self.sim_minute + leave_after, PHASE_PATIENT, "TO_RESULTS")
+            else:
+                self._schedule(eid, self.sim_minute + lab, PHASE_PATIENT, "TESTS_DONE")
+        else:
+            self._start_treatment(patient, "TREATING")
+
+    def _on_to_results(self, eid):
+        patient = self.active_encounters[eid]
+        self._sync_timer(eid)
+        patient.lab_timer += 1 # This minute's decrement does not happen when leaving
+        self._set_anchor(eid, "lab_timer", patient.lab_timer, -1)
+        self._send_to_results(patient)
+        if patient.lab_timer > 0:
+            self._schedule(eid, self.sim_minute + patient.lab_timer, PHASE_PATIENT, "RESULTS_READY")
+        else:
+            self._cancel(eid)
+
+    def _on_tests_done(self, eid):
+        patient = self.active_encounters[eid]
+        patient.lab_timer = 0
+        self._start_treatment(patient, "BOARDING" if patient.disposition == "ADMIT" else "TREATING")
+
+    def _on_results_ready(self, eid):
+        patient = self.active_encounters[eid]
+        self._sync_timer(eid)
+        self.results_ready[patient.facility_id].push(self.arrival_seq[eid], eid)
+
+    def _on_discharge(self, eid):
+        patient = self.active_encounters[eid]
+        self._sync_timer(eid)
+        patient.discharged = True
+        if patient.stage == "BOARDING":
+            self._log_exit(patient, "DISCHARGED", "WARD", "ADMIT", patient.facility_id)
+        else:
+            self._log_exit(patient, "DISCHARGED", "HOME", "DISCHARGE", patient.facility_id)
+        self._remove_encounter(eid)
+
+    def _on_lwbs(self, eid):
+        patient = self.active_encounters[eid]
+        self._sync_timer(eid)
+        patient.status = "LWBS"
+        patient.discharged = True
+        self.lwbs_count += 1
+        self.lwbs_by_facility[patient.facility_id] += 1
+        self._log_exit(patient, "LWBS", "EXIT", "UNKNOWN", patient.facility_id, ttl=300)
+        self._remove_encounter(eid)
+        self._refresh_diversion(patient.facility_id)
+
+    def _start_treatment(self, patient, stage):
+        # Countdown starts next minute; once it hits zero the MD roll runs every minute
+        patient.stage = stage
+        eid = patient.id
+        self._set_anchor(eid, "treatment_time_remaining", patient.treatment_time_remaining, -1)
+        first_roll = self.sim_minute + max(patient.treatment_time_remaining, 1)
+        self._treat_start[eid] = first_roll
+        self._schedule_discharge(eid, patient.facility_id, first_roll)
+
+    # ---------------------------------------------------------
+    # SimulationEngine hooks
+    # ---------------------------------------------------------
+    def _add_encounter(self, encounter):
+        super()._add_encounter(encounter)
+        eid = encounter.id
+        # Arrivals are processed the same minute, so the wait clock reads 1
+        encounter.wait_time_remaining = 1
+        self._set_anchor(eid, "wait_time_remaining", 1, +1)
+        threshold = LWBS_THRESHOLDS.get(encounter.assigned_ctas)
+        if threshold is not None:
+            self._schedule(eid, self.sim_minute + threshold, PHASE_PATIENT, "LWBS")
+        self._refresh_diversion(encounter.facility_id)
+
+    def _init_patient_flow(self, patient):
+        self._sync_timer(patient.id) # Freeze the wait clock
+        super()._init_patient_flow(patient)
+        self._anchors.pop(patient.id)
+        self._schedule(patient.id, self.sim_minute + geometric(1/15, self.rng), PHASE_PATIENT, "ASSESSED")
+
+    def _results_back(self, patient, resource_type):
+        self._sync_timer(patient.id)
+        super()._results_back(patient, resource_type)
+        self._start_treatment(patient, patient.stage)
+
+    def _remove_encounter(self, encounter_id):
+        super()._remove_encounter(encounter_id)
+        self._tokens.pop(encounter_id, None) # Pending events become stale
+        self._anchors.pop(encounter_id, None)
+        self._treat_start.pop(encounter_id, None)
+
+    def _snapshot_state(self):
+        state = super()._snapshot_state()
+        state["events"] = {
+            "heap": self.scheduler._heap,
+            "seq": self.scheduler._seq,
+            "tokens": self._tokens,
+            "anchors": self._anchors,
+            "treat_start": self._treat_start,
+            "diverted": self._diverted,
+            "is_fast_forward": self._is_fast_forward,
+        }
+        return state
+
+    def _restore_state(self, state):
+        super()._restore_state(state)
+        events = state["events"]
+        self.scheduler = EventScheduler()
+        self.scheduler._heap = events["heap"] # Stored in heap order
+        self.scheduler._seq = events["seq"]
+        self._tokens = events["tokens"]
+        self._anchors = events["anchors"]
+        self._treat_start = events["treat_start"]
+        self._diverted = events["diverted"]
+        self._is_fast_forward = events["is_fast_forward"]
+
+    def _max_wait(self):
+        max_wait = 0
+        for queue in self.waiting_queues.values():
+            for eid in queue:
+                field, value, minute, direction = self._anchors[eid]
+                max_wait = max(max_wait, value + (self.sim_minute - minute))
+        return max_wait
+
+    def _collect_patients(self):
+        self.sync()
+        return super()._collect_patients()
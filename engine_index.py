@@ -0,0 +1,48 @@
+import heapq
+
+
+class IndexedHeap:
+    # Min-heap of (key, item) with O(1) membership and lazy deletion.
+    # Discarded items stay in the heap until popped (or a compaction runs),
+    # so removing a patient never costs a heap rebuild on the hot path.
+    def __init__(self):
+        self._heap = []
+        self._live = {} # item -> key
+
+    def __len__(self):
+        return len(self._live)
+
+    def __contains__(self, item):
+        return item in self._live
+
+    def __iter__(self):
+        return iter(self._live)
+
+    def items(self):
+        # Live (key, item) pairs, in insertion order
+        return [(key, item) for item, key in self._live.items()]
+
+    @classmethod
+    def from_items(cls, items):
+        heap = cls()
+        for key, item in items: heap.push(key, item)
+        return heap
+
+    def push(self, key, item):
+        self._live[item] = key
+        heapq.heappush(self._heap, (key, item))
+
+    def discard(self, item):
+        if self._live.pop(item, None) is None: return
+        # Stale entries only cost memory; compact once they dominate
+        if len(self._heap) > 2 * len(self._live) + 32:
+            self._heap = [(key, i) for i, key in self._live.items()]
+            heapq.heapify(self._heap)
+
+    def pop(self):
+        while self._heap:
+            key, item = heapq.heappop(self._heap)
+            if self._live.get(item) == key:
+                del self._live[item]
+                return key, item
+        raise IndexError("pop from empty IndexedHeap")
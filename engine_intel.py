@@ -1,65 +1,113 @@
 
 # engine_intel.py
-import uuid
+import re
+from collections import deque
 from datetime import datetime
-from typing import Optional
-from models import Encounter, Alert
-from data_seeds import CLINICAL_RULES, SAFETY_KEYWORDS
+from typing import Dict, List, Optional
+from models import Encounter, Alert, trusted_model
+from data_seeds import CLINICAL_RULES, SAFETY_KEYWORDS, SYNDROMIC_SIGNALS
+
+class RuleIndex:
+    # Protocol library compiled once: symptom -> rules (in library order) and
+    # all safety keywords folded into one case-insensitive regex, so an audit
+    # costs the same with 5 protocols or 500.
+    def __init__(self, rules: List[Dict], keywords: List[str], signals: List[Dict] = ()):
+        self.by_symptom: Dict[str, List[Dict]] = {}
+        for rule in rules:
+            self.by_symptom.setdefault(rule["symptom"], []).append(rule)
+        self.signals_by_symptom: Dict[str, List[Dict]] = {}
+        for signal in signals:
+            for symptom in signal["symptoms"]:
+                self.signals_by_symptom.setdefault(symptom, []).append(signal)
+        # Longest first so overlapping keywords still match (re alternation is ordered)
+        ordered = sorted(set(keywords), key=len, reverse=True)
+        self.keyword_matcher = re.compile("|".join(re.escape(k) for k in ordered), re.IGNORECASE) if ordered else None
+
+    def has_safety_keyword(self, text: str) -> bool:
+        return self.keyword_matcher is not None and self.keyword_matcher.search(text) is not None
+
+# Shared by every session; swapped (not edited) via load_rules when the library changes
+DEFAULT_RULES = RuleIndex(CLINICAL_RULES, SAFETY_KEYWORDS, SYNDROMIC_SIGNALS)
+
+def load_rules(rules: List[Dict], keywords: List[str], signals: List[Dict] = SYNDROMIC_SIGNALS):
+    global DEFAULT_RULES
+    DEFAULT_RULES = RuleIndex(rules, keywords, signals)
 
 class IntelligenceEngine:
-    def __init__(self):
-        self.respiratory_history = []
+    def __init__(self, rules: Optional[RuleIndex] = None):
+        self.signal_windows: Dict[tuple, deque] = {} # (signal_id, facility_id) -> arrival minutes
+        self.alert_count = 0 # Alert ids are this counter (hex), unique within the session
+        self._rules = rules # None = follow DEFAULT_RULES
+
+    @property
+    def rules(self) -> RuleIndex:
+        return self._rules or DEFAULT_RULES
+
+    def audit_encounter(self, encounter: Encounter, now: Optional[datetime] = None) -> Optional[Alert]:
+        # Every arrival counts towards clusters, even one that raises another alert
+        signal = self._record_signals(encounter)
 
-    def audit_encounter(self, encounter: Encounter) -> Optional[Alert]:
         # 1. Check Clinical Rules (CTAS mismatch)
-        for rule in CLINICAL_RULES:
-            if rule["symptom"] == encounter.symptom:
-                if encounter.assigned_ctas != rule["required_ctas"]:
-                    return Alert(
-                        id=str(uuid.uuid4()),
-                        encounter_id=encounter.id,
-                        rule_violated=rule["rule_id"],
-                        severity=rule["risk_level"],
-                        timestamp=datetime.now(),
-                        explanation=f"Patient P-{encounter.id[-4:]} ({encounter.symptom}) assigned CTAS {encounter.assigned_ctas}. Protocol requires CTAS {rule['required_ctas']}."
-                    )
+        for rule in self.rules.by_symptom.get(encounter.symptom, ()):
+            if encounter.assigned_ctas != rule["required_ctas"]:
+                return self._alert(encounter, rule["rule_id"], rule["risk_level"], now,
+                    f"Patient P-{encounter.id[-4:]} ({encounter.symptom}) assigned CTAS {encounter.assigned_ctas}. Protocol requires CTAS {rule['required_ctas']}.")
 
         # 2. Check Safety Keywords
-        found_keyword = False
-        for keyword in SAFETY_KEYWORDS:
-            if keyword.lower() in encounter.clinical_notes.lower():
-                found_keyword = True
-                break
-        
-        if found_keyword and not encounter.is_serious:
-             return Alert(
-                id=str(uuid.uuid4()),
-                encounter_id=encounter.id,
-                rule_violated="R-SAFETY-01",
-                severity="CRITICAL",
-                timestamp=datetime.now(),
-                explanation=f"Safety keyword detected in notes but is_serious is False."
-            )
-        
-        # 3. Public Health Signal (Respiratory Cluster)
-        # Check > 3 cases in < 60 mins (Simulated Time). 
-        # Since sim runs at 60x speed, 60 mins = 6 seconds real-time.
-        from datetime import timedelta
-        if encounter.symptom == "Difficulty Breathing":
-            self.respiratory_history.append(datetime.now())
+        if not encounter.is_serious and self.rules.has_safety_keyword(encounter.clinical_notes):
+            return self._alert(encounter, "R-SAFETY-01", "CRITICAL", now,
+                "Safety keyword detected in notes but is_serious is False.")
         
-        # Prune old cases (> 6 seconds real time = > 60 mins sim time)
-        cutoff = datetime.now() - timedelta(seconds=6)
-        self.respiratory_history = [t for t in self.respiratory_history if t > cutoff]
-        
-        if len(self.respiratory_history) > 3:
-             return Alert(
-                id=str(uuid.uuid4()),
-                encounter_id=encounter.id,
-                rule_violated="R-BIO-01",
-                severity="CRITICAL",
-                timestamp=datetime.now(),
-                explanation=f"BIO_SIGNAL_DETECTED: >3 Respiratory Distress cases in <60 mins."
-            )
+        # 3. Public Health Signals (syndromic clusters, counted above)
+        if signal is not None:
+            return self._alert(encounter, signal["signal_id"], signal["severity"], now,
+                f"{signal['explanation']} ({encounter.facility_id})")
 
         return None
+
+    def audit_encounters(self, encounters: List[Encounter]) -> List[Alert]:
+        # One tick's arrivals, in arrival order; one clock read for the batch
+        now = datetime.now()
+        alerts = []
+        for encounter in encounters:
+            alert = self.audit_encounter(encounter, now)
+            if alert is not None: alerts.append(alert)
+        return alerts
+
+    def _alert(self, encounter: Encounter, rule_violated: str, severity: str, now: Optional[datetime], explanation: str) -> Alert:
+        # Every field is engine-produced, so the Alert skips validation
+        self.alert_count += 1
+        return trusted_model(Alert, {
+            "id": f"{self.alert_count:08x}",
+            "encounter_id": encounter.id,
+            "rule_violated": rule_violated,
+            "severity": severity,
+            "timestamp": now or datetime.now(),
+            "explanation": explanation,
+        })
+
+    def get_state(self) -> Dict:
+        return {
+            "signal_windows": {key: list(window) for key, window in self.signal_windows.items()},
+            "alert_count": self.alert_count,
+        }
+
+    def set_state(self, state: Dict):
+        self.signal_windows = {key: deque(window) for key, window in state["signal_windows"].items()}
+        self.alert_count = state.get("alert_count", 0)
+
+    def _record_signals(self, encounter: Encounter) -> Optional[Dict]:
+        # Sliding windows of arrival minutes per (signal, facility): append the new
+        # case, drop the ones that aged out. Returns the first signal now over threshold.
+        fired = None
+        now = encounter.arrival_tick
+        for signal in self.rules.signals_by_symptom.get(encounter.symptom, ()):
+            key = (signal["signal_id"], encounter.facility_id)
+            window = self.signal_windows.get(key)
+            if window is None: window = self.signal_windows[key] = deque()
+            window.append(now)
+            cutoff = now - signal["window_minutes"]
+            while window[0] <= cutoff: window.popleft()
+            if fired is None and len(window) > signal["threshold"]: fired = signal
+        return fired
+
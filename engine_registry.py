@@ -0,0 +1,16 @@
+from engine_sim import SimulationEngine
+from engine_columnar import ColumnarSimulationEngine
+from engine_events import EventDrivenSimulationEngine
+
+# Engine Backends: "object" (pydantic encounters), "columnar" (NumPy arrays)
+# or "events" (next-event kernel)
+ENGINE_BACKENDS = {
+    "object": SimulationEngine,
+    "columnar": ColumnarSimulationEngine,
+    "events": EventDrivenSimulationEngine,
+}
+
+def create_engine(backend="object", seed=None, rng_backend="python") -> SimulationEngine:
+    if backend not in ENGINE_BACKENDS:
+        raise ValueError(f"Unknown engine backend '{backend}'. Choose from: {', '.join(ENGINE_BACKENDS)}")
+    return ENGINE_BACKENDS[backend](seed=seed, rng_backend=rng_backend)
@@ -1,115 +1,266 @@
 
 # engine_sim.py
-import random
-import uuid
+import logging
+import os
+import numpy as np
 from datetime import datetime
-from typing import List, Dict
+from typing import Dict
 
-from models import Encounter, Alert
-from data_seeds import FACILITIES, CLINICAL_RULES, FACILITY_RESOURCES
+from models import Encounter, trusted_model
+from data_seeds import CLINICAL_RULES
+from facility_registry import REGISTRY, SHIFTS, capacity_totals
+from arrival_process import ArrivalProcess, hour_bucket_rate, poisson_counts
 from engine_intel import IntelligenceEngine
+from engine_index import IndexedHeap
+from sim_random import SimRandom
+from vitals_snapshot import PublishedSession, VitalsSnapshot, board_payload
+from alert_store import AlertStore
+from sim_log import EventLog
+from sim_metrics import phase_clock
+from sim_snapshot import dumps, loads, encode_table, decode_table
 
 PRODUCTIVITY_FACTOR = 5.0
+START_HOUR = 8 # Simulation starts at 8 AM
+DIVERSION_QUEUE_FACTOR = 3 # Diversion when queue depth > beds * factor
+DIVERSION_REDUCTION = 0.1 # Arrival rate kept while diverted
+# Regional Mode: ambulances turned away by a diverted ED go to the nearest
+# non-diverted one (registry neighbour lists) instead of being lost
+REGIONAL_MODE = os.environ.get("SOLARIS_REGIONAL", "0") == "1"
+
+# Per protocol: (required CTAS, symptom, is_serious, presenting note, the other CTAS levels)
+ARRIVAL_PROFILES = [
+    (rule["required_ctas"], rule["symptom"], rule["risk_level"] in ("HIGH", "CRITICAL"),
+     f"Patient presents with {rule['symptom']}.", [c for c in [1, 2, 3, 4, 5] if c != rule["required_ctas"]])
+    for rule in CLINICAL_RULES
+]
+ENCOUNTER_DEFAULTS = {name: field.default for name, field in Encounter.model_fields.items() if not field.is_required()}
+ENCOUNTER_FIELDS = set(Encounter.model_fields)
 
 class SimulationEngine:
-    def __init__(self):
+    def __init__(self, seed=None, rng_backend="python"):
+        # Every draw goes through this engine-owned stream: same seed, same trajectory
+        self.rng = SimRandom(seed, backend=rng_backend)
         self.active_encounters: Dict[str, Encounter] = {}
-        self.alerts: List[Alert] = []
+        self.alerts = AlertStore() # Bounded; see alert_store.ALERT_RETENTION
+        self.event_log = EventLog() # Live-mode narration (arrivals, alerts, ...); see sim_log
         self.intel_engine = IntelligenceEngine()
         self.total_patients_processed = 0
+        self.encounter_count = 0 # Encounter ids are this counter (hex), unique within the session
         self.lwbs_count = 0 
-        self.current_sim_hour = 8 # Start at 8 AM
+        self.sim_minute = 0 # Simulated minutes since start (1 tick = 1 minute)
+        self.current_sim_hour = START_HOUR # Derived from sim_minute
         self.history = [] 
         self.recent_exits = [] # Track recently discharged/LWBS for UI
         self.los_history = [] # For Moving Average LOS
 
-    def _get_active_resources(self, facility_id):
+        # Incremental Indexes (kept in sync by the status-change helpers below)
+        # waiting_queues[fid]: (CTAS, arrival seq) priority heap of WAITING patients
+        # results_ready[fid]: arrival-ordered WAITING_FOR_RESULTS patients with lab_timer <= 0
+        # census[fid]: live occupied resources by type
+        self.facility_ids = REGISTRY.ids
+        self.arrival_seq: Dict[str, int] = {}
+        self._next_seq = 0
+        self.waiting_queues = {fid: IndexedHeap() for fid in self.facility_ids}
+        self.results_ready = {fid: IndexedHeap() for fid in self.facility_ids}
+        self.census = {fid: {"BED": 0, "CHAIR": 0, "HALLWAY": 0, "TOTAL": 0} for fid in self.facility_ids}
+        self.lwbs_by_facility = {fid: 0 for fid in self.facility_ids}
+        self.arrivals = ArrivalProcess(START_HOUR) # Rate curves + surge events
+        self.redirected_count = 0 # Diverted arrivals routed to another ED (regional mode)
+        self.diversion_lost = 0 # Diverted arrivals with no open ED among the neighbours
+
+        # Scenario Parameters (defaults = facility registry; what-if runs override them via set_scenario)
+        # resources: beds / surge / staffing per facility
+        # forced_diversion: fid -> diversion pinned on / off regardless of queue depth
+        self._set_scenario_parameters({
+            "resources": REGISTRY.resources,
+            "arrival_multipliers": {fid: 1.0 for fid in self.facility_ids},
+            "diversion_factor": DIVERSION_QUEUE_FACTOR,
+            "forced_diversion": {},
+            "regional": REGIONAL_MODE,
+        })
+
+        # Versioned patient board for /status deltas, refreshed at most once per sim minute
+        self.board = VitalsSnapshot()
+        self._board_minute = None
+        self._board_counts = ({}, 0)
+
+    def _current_shift(self):
         # Determine Shift
         hour = self.current_sim_hour
         shift = "day_shift"
         if 0 <= hour < 8: shift = "night_shift"
         elif 16 <= hour < 24: shift = "evening_shift"
         # Note: Day shift is now 08:00 - 16:00
-        
-        return FACILITY_RESOURCES[facility_id]["staffing"][shift]
+        return shift
+
+    def _get_active_resources(self, facility_id):
+        return self.resources[facility_id]["staffing"][self._current_shift()]
+
+    def _discharge_rate(self, facility_id):
+        return self._discharge_rates[self._current_shift()][facility_id]
 
     def _get_arrival_probability(self):
-        base_rate = 0.25
-        hour = self.current_sim_hour
+        # Built-in hour-bucket curve; per-facility rates come from self.arrivals
+        return hour_bucket_rate(self.current_sim_hour)
+
+    def _is_diverted(self, facility_id, queue_len):
+        # Queue Depth vs Beds * factor, unless the scenario pins it
+        forced = self.forced_diversion.get(facility_id)
+        if forced is not None: return forced
+        return queue_len > self.resources[facility_id]["physical_beds"] * self.diversion_factor
+
+    def _undiverted_arrival_probability(self, facility_id, base_prob):
+        return min(1.0, base_prob * self.arrival_multipliers[facility_id])
+
+    def _facility_arrival_probability(self, facility_id, base_prob, queue_len):
+        prob = self._undiverted_arrival_probability(facility_id, base_prob)
+        if self._is_diverted(facility_id, queue_len):
+            prob *= DIVERSION_REDUCTION # 90% Reduction (Diversion)
+        return prob
+
+    def _nearest_open_facility(self, facility_id):
+        # Nearest neighbour that is not on diversion, or None
+        for nid in REGISTRY.neighbours[facility_id]:
+            if not self._is_diverted(nid, len(self.waiting_queues[nid])): return nid
+        return None
+
+    def _redirect_arrival(self, facility_id, is_fast_forward=False):
+        # Regional mode: an ambulance turned away by `facility_id`
+        destination = self._nearest_open_facility(facility_id)
+        if destination is None:
+            self.diversion_lost += 1
+            return
+        self.redirected_count += 1
+        if not is_fast_forward:
+            self.event_log.event(self.sim_minute, "redirect", "[{facility_id}] On diversion, ambulance redirected to {destination}",
+                                 facility_id=facility_id, destination=destination)
+        self._generate_new_encounter(facility_id=destination, is_fast_forward=is_fast_forward)
+
+    def add_surge(self, duration_minutes, start_in_minutes=0, facility_id=None, multiplier=1.0, extra_per_hour=0.0, label="surge"):
+        # Surge event starting `start_in_minutes` after the current minute, e.g. a
+        # mass-casualty burst = extra_per_hour arrivals at one facility for a short window
+        start = self.sim_minute + 1 + start_in_minutes
+        return self.arrivals.add_surge(start, start + duration_minutes, facility_id, multiplier, extra_per_hour, label)
+
+    def set_scenario(self, resources=None, arrival_multipliers=None, diversion_factor=None, forced_diversion=None, regional=None):
+        # What-if overrides; anything left as None keeps its current value
+        params = self._scenario_parameters()
+        if resources is not None: params["resources"] = resources
+        if arrival_multipliers is not None: params["arrival_multipliers"] = {**params["arrival_multipliers"], **arrival_multipliers}
+        if diversion_factor is not None: params["diversion_factor"] = diversion_factor
+        if forced_diversion is not None: params["forced_diversion"] = {**params["forced_diversion"], **forced_diversion}
+        if regional is not None: params["regional"] = regional
+        self._set_scenario_parameters(params)
+
+    def _scenario_parameters(self) -> Dict:
+        return {
+            "resources": None if self.resources is REGISTRY.resources else self.resources, # None = registry defaults
+            "arrival_multipliers": self.arrival_multipliers,
+            "diversion_factor": self.diversion_factor,
+            "forced_diversion": self.forced_diversion,
+            "regional": self.regional,
+        }
+
+    def _set_scenario_parameters(self, params):
+        self.resources = params["resources"] or REGISTRY.resources
+        self.arrival_multipliers = dict(params["arrival_multipliers"])
+        self.diversion_factor = params["diversion_factor"]
+        self.forced_diversion = dict(params["forced_diversion"])
+        self.regional = params.get("regional", REGIONAL_MODE)
+        self._multiplier_array = np.array([self.arrival_multipliers[fid] for fid in self.facility_ids])
+        # Derived once per configuration, not per tick / per /status call
+        self._capacity_totals = capacity_totals(self.resources)
+        # Max patients processed per minute = (MDs * 1.0 complex cases * PRODUCTIVITY_FACTOR) / 60
+        self._discharge_rates = {
+            shift: {fid: (res["staffing"][shift]["md_count"] * 1.0 * PRODUCTIVITY_FACTOR) / 60 for fid, res in self.resources.items()}
+            for shift in SHIFTS
+        }
+
+    def _active_count(self):
+        return len(self.active_encounters)
+
+    def _status_counts(self) -> Dict[str, int]:
+        counts = {}
+        for enc in self.active_encounters.values(): counts[enc.status] = counts.get(enc.status, 0) + 1
+        return counts
+
+    def _max_wait(self):
+        max_wait = 0
+        for e in self.active_encounters.values():
+            if e.status == "WAITING" and e.wait_time_remaining > max_wait:
+                max_wait = e.wait_time_remaining
+        return max_wait
+
+    def _advance_clock(self, is_fast_forward=False):
+        # Update Simulated Time (1 tick = 1 minute); hour and shift follow exactly
+        self.sim_minute += 1
+        if self.sim_minute % 60 == 0:
+            self._roll_hour(is_fast_forward)
+
+    def _roll_hour(self, is_fast_forward=False):
+        self.current_sim_hour = (START_HOUR + self.sim_minute // 60) % 24
+        # Record History
+        active_count = self._active_count()
+        self.history.append({"hour": self.current_sim_hour, "active": active_count})
+        if len(self.history) > 24: self.history.pop(0)
         
-        # 1. The "Lull" (Sinusoidal Arrival Rates)
-        if 0 <= hour < 8: return base_rate * 0.2 # Night
-        elif 8 <= hour < 20: return base_rate * 1.5 # Day (Standard Spec)
-        elif 20 <= hour < 24: return base_rate * 1.0 # Evening
-        else: return base_rate
+        # DEBUG: Check Max Wait
+        if not is_fast_forward and self.event_log.enabled:
+            self.event_log.event(self.sim_minute, "hour", "Hour {hour}:00 - Active: {active}, Max Wait: {max_wait_hours:.1f}h",
+                                 routine=False, hour=self.current_sim_hour, active=active_count, max_wait_hours=self._max_wait() / 60)
+
+    def advance(self, minutes, is_fast_forward=True):
+        # Headless driver: run `minutes` ticks back to back
+        for _ in range(minutes): self.tick(is_fast_forward=is_fast_forward)
 
     def tick(self, is_fast_forward=False):
-        # Update Simulated Time (1 tick = 1 minute)
-        if random.random() < (1/60): 
-             self.current_sim_hour = (self.current_sim_hour + 1) % 24
-             # Record History
-             active_count = len(self.active_encounters)
-             self.history.append({"hour": self.current_sim_hour, "active": active_count})
-             if len(self.history) > 24: self.history.pop(0)
-             
-             # DEBUG: Check Max Wait
-             max_wait = 0
-             for e in self.active_encounters.values():
-                 if e.status == "WAITING" and e.wait_time_remaining > max_wait:
-                     max_wait = e.wait_time_remaining
-             if not is_fast_forward:
-                 print(f"[SIM] Hour {self.current_sim_hour}:00 - Active: {active_count}, Max Wait: {max_wait/60:.1f}h")
+        # One block of uniforms covers this tick's coin flips (arrivals,
+        # per-patient stage rolls, admission quotas)
+        clock = phase_clock(is_fast_forward)
+        self.rng.prefetch(2 * len(self.facility_ids) + self._active_count())
+        self._advance_clock(is_fast_forward)
 
         # ---------------------------------------------------------
         # 1. ARRIVALS (With Ambulance Diversion)
         # ---------------------------------------------------------
-        base_prob = self._get_arrival_probability()
-        for facility in FACILITIES:
-            fid = facility["id"]
-            
-            # Ambulance Diversion Logic
-            # Check Queue Depth vs Beds * 3
-            queue_len = len([e for e in self.active_encounters.values() if e.facility_id == fid and e.status == "WAITING"])
-            phys_beds = FACILITY_RESOURCES[fid]["physical_beds"]
-            
-            prob = base_prob
-            if queue_len > (phys_beds * 3):
-                prob *= 0.1 # 90% Reduction (Diversion)
-            
-            if random.random() < prob: 
-                self._generate_new_encounter(facility_id=fid, is_fast_forward=is_fast_forward)
+        rates = self.arrivals.rates(self.sim_minute)
+        if self.arrivals.poisson_at(self.sim_minute):
+            diverted = np.array([self._is_diverted(fid, len(self.waiting_queues[fid])) for fid in self.facility_ids])
+            self._poisson_arrivals(rates, diverted, is_fast_forward)
+        else:
+            for i, fid in enumerate(self.facility_ids):
+                # Ambulance Diversion Logic
+                prob = self._facility_arrival_probability(fid, rates[i], len(self.waiting_queues[fid]))
+                
+                u = self.rng.random()
+                if u < prob: 
+                    self._generate_new_encounter(facility_id=fid, is_fast_forward=is_fast_forward)
+                elif self.regional and u < self._undiverted_arrival_probability(fid, rates[i]):
+                    # Would have arrived without diversion: same draw decides the redirect
+                    self._redirect_arrival(fid, is_fast_forward)
+
+        clock.lap("arrivals")
 
         # ---------------------------------------------------------
         # 2. PROCESS PATIENTS (States & Timers)
         # ---------------------------------------------------------
         to_remove = []
-        census_counts = {} # counts by facility + resource type
-        # Structure: census_counts[fid] = {"BED": 0, "CHAIR": 0, "HALLWAY": 0}
+        # Census at the start of processing; admission works against this
+        # snapshot, so beds freed this minute are only reused next minute.
+        # Structure: census_counts[fid] = {"BED": 0, "CHAIR": 0, "HALLWAY": 0, "TOTAL": 0}
+        census_counts = {fid: dict(counts) for fid, counts in self.census.items()}
         
         # Pre-calculate discharge budget per facility
-        discharge_budget = {}
-        for fid in FACILITY_RESOURCES:
-            if fid not in census_counts: census_counts[fid] = {"BED": 0, "CHAIR": 0, "HALLWAY": 0, "TOTAL": 0}
-            
-            res = self._get_active_resources(fid)
-            # Max patients processed per minute = (MDs * 1.0 complex cases * PRODUCTIVITY_FACTOR) / 60
-            discharge_budget[fid] = (res["md_count"] * 1.0 * PRODUCTIVITY_FACTOR) / 60
+        discharge_budget = self._discharge_rates[self._current_shift()]
 
         for encounter_id, encounter in self.active_encounters.items():
             fid = encounter.facility_id
-            
-            # Count census for resource checks
-            if encounter.status in ["ROOMED", "ADMITTED_NO_BED"]:
-                 r_type = encounter.resource_type
-                 if r_type in ["BED", "CHAIR", "HALLWAY"]:
-                     census_counts[fid][r_type] += 1
-                     census_counts[fid]["TOTAL"] += 1
 
             if encounter.status == "ROOMED" or encounter.status == "ADMITTED_NO_BED":
                 
                 # --- GRANULAR STAGE LOGIC ---
                 if encounter.stage == "ASSESSING":
-                     if random.random() < (1/15): 
+                     if self.rng.random() < (1/15): 
                          # Decision Point: Simple or Complex?
                          # CTAS 1/2/3 often need tests. CTAS 4/5 often simple.
                          if encounter.assigned_ctas <= 3:
@@ -122,9 +273,8 @@ class SimulationEngine:
                      # Simulate Sending to Internal Waiting Room (Release Resource)
                      # For now, let's say 50% go to waiting room, 50% stay in bed (too sick)
                      # CTAS 1 never leaves bed. CTAS 2/3 can.
-                     if encounter.assigned_ctas > 1 and random.random() < 0.8:
-                         encounter.status = "WAITING_FOR_RESULTS"
-                         encounter.resource_type = "NONE" # Free up element
+                     if encounter.assigned_ctas > 1 and self.rng.random() < 0.8:
+                         self._send_to_results(encounter) # Free up element
                      else:
                          # Stay in Bed/Chair
                          encounter.lab_timer -= 1
@@ -135,7 +285,7 @@ class SimulationEngine:
                 elif encounter.stage == "BOARDING":
                      encounter.treatment_time_remaining -= 1
                      if encounter.treatment_time_remaining <= 0:
-                         if random.random() < discharge_budget[fid]:
+                         if self.rng.random() < discharge_budget[fid]:
                              encounter.discharged = True
                              to_remove.append(encounter_id)
                              self._log_exit(encounter, "DISCHARGED", "WARD", "ADMIT", fid)
@@ -143,7 +293,7 @@ class SimulationEngine:
                 elif encounter.stage == "TREATING":
                      encounter.treatment_time_remaining -= 1
                      if encounter.treatment_time_remaining <= 0:
-                         if random.random() < discharge_budget[fid]:
+                         if self.rng.random() < discharge_budget[fid]:
                              encounter.discharged = True
                              to_remove.append(encounter_id)
                              self._log_exit(encounter, "DISCHARGED", "HOME", "DISCHARGE", fid)
@@ -153,6 +303,8 @@ class SimulationEngine:
             elif encounter.status == "WAITING_FOR_RESULTS":
                 # Internal Waiting Room - consuming time but NO resources
                 encounter.lab_timer -= 1
+                if encounter.lab_timer == 0:
+                     self.results_ready[fid].push(self.arrival_seq[encounter_id], encounter_id)
                 if encounter.lab_timer <= 0:
                      # Results back! Needs MD Review.
                      # Simplified: Just move to TREATING and put back in queue? 
@@ -176,163 +328,160 @@ class SimulationEngine:
                      encounter.status = "LWBS"
                      encounter.discharged = True 
                      self.lwbs_count += 1
+                     self.lwbs_by_facility[fid] += 1
                      to_remove.append(encounter_id)
                      self._log_exit(encounter, "LWBS", "EXIT", "UNKNOWN", fid, ttl=300)
 
+        clock.lap("patients")
+
         # Cleanup Active
-        for eid in to_remove: del self.active_encounters[eid]
+        for eid in to_remove: self._remove_encounter(eid)
         self._prune_recent_exits()
+        clock.lap("cleanup")
 
         # ---------------------------------------------------------
         # 3. ADMISSION LOGIC (Complex Flow)
         # ---------------------------------------------------------
-        for facility in FACILITIES:
-            fid = facility["id"]
-            res = FACILITY_RESOURCES[fid]
+        for fid in self.facility_ids:
+            self._admit_facility(fid, census_counts[fid], discharge_budget[fid], is_fast_forward)
+        clock.lap("admission")
+
+    def _poisson_arrivals(self, rates, diverted, is_fast_forward=False):
+        # Non-homogeneous Poisson arrivals: one vectorized draw for every facility.
+        # Diversion thins a facility's stream; in regional mode the thinned-out
+        # part (itself Poisson) is redirected instead of lost.
+        lam = rates * self._multiplier_array
+        local = np.where(diverted, lam * DIVERSION_REDUCTION, lam)
+        counts = poisson_counts(local, self.rng.uniforms(len(lam)))
+        if counts.any():
+            ids = self.facility_ids
+            self._generate_encounters([ids[i] for i in np.repeat(np.arange(len(ids)), counts).tolist()], is_fast_forward)
+        if self.regional and diverted.any():
+            turned_away = np.flatnonzero(diverted)
+            redirected = poisson_counts(lam[turned_away] - local[turned_away], self.rng.uniforms(len(turned_away)))
+            for i, count in zip(turned_away.tolist(), redirected.tolist()):
+                for _ in range(count): self._redirect_arrival(self.facility_ids[i], is_fast_forward)
+
+    def _generate_encounters(self, facility_ids, is_fast_forward=False):
+        # One batch of arrivals (facility id per patient). Encounters are built
+        # from the protocol table and the RNG, never from a request, so they skip
+        # pydantic validation; one clock read and one audit pass per batch.
+        if not facility_ids: return
+        now = datetime.now()
+        encounters = []
+        for fid in facility_ids:
+            encounter = self._new_encounter(fid, now)
+            self._add_encounter(encounter)
+            encounters.append(encounter)
+            if not is_fast_forward:
+                self.event_log.event(self.sim_minute, "arrival", "[{facility_id}] Patient P-{patient} arrived ({symptom}). Assigned CTAS: {ctas}",
+                                     facility_id=fid, patient=encounter.id[-4:], symptom=encounter.symptom, ctas=encounter.assigned_ctas)
+        self.total_patients_processed += len(encounters)
+
+        for alert in self.intel_engine.audit_encounters(encounters):
+            self.alerts.append(alert)
+            if not is_fast_forward:
+                self.event_log.event(self.sim_minute, "alert", "🚨 ALERT DETECTED: {explanation}", level=logging.WARNING, routine=False,
+                                     alert_id=alert.id, rule=alert.rule_violated, severity=alert.severity, explanation=alert.explanation)
+
+    def _admit_facility(self, fid, counts, rate, is_fast_forward=False):
+        res = self.resources[fid]
+        
+        p_beds = res["physical_beds"]
+        p_chairs = res.get("chair_capacity", 20)
+        surge_cap = res["surge_capacity"]
+        
+        occ_beds = counts["BED"]
+        occ_chairs = counts["CHAIR"]
+        occ_hallway = counts["HALLWAY"]
+        total_census = counts["TOTAL"]
+        
+        # Velocity Cap
+        admit_quota = int(rate) + (1 if self.rng.random() < (rate % 1) else 0)
+        admitted_count = 0
+        
+        # 1. Process "Results Back" Patients (Priority Re-Entry)
+        # They need a spot to be discharged or admitted
+        results_queue = self.results_ready[fid]
+        skipped = []
+        
+        while results_queue and admitted_count < admit_quota:
+            seq, eid = results_queue.pop()
+            patient = self.active_encounters[eid]
             
-            p_beds = res["physical_beds"]
-            p_chairs = res.get("chair_capacity", 20)
-            surge_cap = res["surge_capacity"]
+            # Re-assign resource
+            assigned = None
+            if occ_chairs < p_chairs and patient.assigned_ctas in [2, 3, 4, 5]:
+                assigned = "CHAIR"
+                occ_chairs += 1
+            elif occ_beds < p_beds:
+                assigned = "BED"
+                occ_beds += 1
+            elif total_census < surge_cap:
+                assigned = "HALLWAY"
+                total_census += 1
             
-            occ_beds = census_counts[fid]["BED"]
-            occ_chairs = census_counts[fid]["CHAIR"]
-            occ_hallway = census_counts[fid]["HALLWAY"]
-            total_census = census_counts[fid]["TOTAL"]
+            if assigned:
+                self._results_back(patient, assigned)
+                admitted_count += 1
+                if not is_fast_forward:
+                    self.event_log.event(self.sim_minute, "results_back", "Patient P-{patient} Results Back -> {resource}.",
+                                         facility_id=fid, patient=patient.id[-4:], resource=patient.resource_type)
+            else:
+                skipped.append((seq, eid))
+        for seq, eid in skipped: results_queue.push(seq, eid)
+
+        # 2. Process Waiting Room, popped in (CTAS, arrival) order
+        waiting_queue = self.waiting_queues[fid]
+        skipped = []
+        
+        while waiting_queue and admitted_count < admit_quota:
+            # Nothing left to hand out: every remaining patient would be skipped
+            if occ_chairs >= p_chairs and occ_beds >= p_beds and total_census >= surge_cap: break
+            key, eid = waiting_queue.pop()
+            patient = self.active_encounters[eid]
             
-            # Velocity Cap
-            rate = discharge_budget[fid]
-            admit_quota = int(rate) + (1 if random.random() < (rate % 1) else 0)
-            admitted_count = 0
+            assigned = None
+            # CTAS 1 -> BED Priority
+            if patient.assigned_ctas == 1:
+                if occ_beds < p_beds:
+                    assigned = ("ROOMED", "BED")
+                    occ_beds += 1
+                # If no beds, maybe Hallway? CTAS 1 needs Bed ideally.
+                elif total_census < surge_cap:
+                    assigned = ("ADMITTED_NO_BED", "HALLWAY")
+                    total_census += 1
             
-            # 1. Process "Results Back" Patients (Priority Re-Entry)
-            # They need a spot to be discharged or admitted
-            results_queue = [e for e in self.active_encounters.values() if e.facility_id == fid and e.status == "WAITING_FOR_RESULTS" and e.lab_timer <= 0]
+            # CTAS 2 -> CHAIR Priority
+            elif patient.assigned_ctas == 2:
+                if occ_chairs < p_chairs:
+                    assigned = ("ROOMED", "CHAIR")
+                    occ_chairs += 1
+                elif occ_beds < p_beds:
+                    assigned = ("ROOMED", "BED")
+                    occ_beds += 1
             
-            for patient in results_queue:
-                if admitted_count >= admit_quota: break
-                
-                # Re-assign resource
-                assigned = False
-                if occ_chairs < p_chairs and patient.assigned_ctas in [2, 3, 4, 5]:
-                    patient.resource_type = "CHAIR"
+            # Others
+            else:
+                if occ_chairs < p_chairs:
+                    assigned = ("ROOMED", "CHAIR")
                     occ_chairs += 1
-                    assigned = True
                 elif occ_beds < p_beds:
-                    patient.resource_type = "BED"
+                    assigned = ("ROOMED", "BED")
                     occ_beds += 1
-                    assigned = True
                 elif total_census < surge_cap:
-                    patient.resource_type = "HALLWAY"
+                    assigned = ("ADMITTED_NO_BED", "HALLWAY")
                     total_census += 1
-                    assigned = True
-                
-                if assigned:
-                    patient.status = "ROOMED"
-                    if patient.disposition == "ADMIT": patient.stage = "BOARDING"
-                    else: patient.stage = "TREATING"
-                    admitted_count += 1
-                    if not is_fast_forward: print(f"[SIM] Patient P-{patient.id[-4:]} Results Back -> {patient.resource_type}.")
-
-            # 2. Process Waiting Room
-            waiting_queue = [e for e in self.active_encounters.values() if e.facility_id == fid and e.status == "WAITING"]
-            waiting_queue.sort(key=lambda x: (x.assigned_ctas, x.arrival_time))
             
-            for patient in waiting_queue:
-                if admitted_count >= admit_quota: break
-                
-                active = False
-                # CTAS 1 -> BED Priority
-                if patient.assigned_ctas == 1:
-                    if occ_beds < p_beds:
-                        patient.status = "ROOMED"
-                        patient.resource_type = "BED"
-                        occ_beds += 1
-                        active = True
-                    # If no beds, maybe Hallway? CTAS 1 needs Bed ideally.
-                    elif total_census < surge_cap:
-                        patient.status = "ADMITTED_NO_BED"
-                        patient.resource_type = "HALLWAY"
-                        total_census += 1
-                        active = True
-                
-                # CTAS 2 -> CHAIR Priority
-                elif patient.assigned_ctas == 2:
-                    if occ_chairs < p_chairs:
-                        patient.status = "ROOMED"
-                        patient.resource_type = "CHAIR"
-                        occ_chairs += 1
-                        active = True
-                    elif occ_beds < p_beds:
-                        patient.status = "ROOMED"
-                        patient.resource_type = "BED"
-                        occ_beds += 1
-                        active = True
-                
-                # Others
-                else:
-                    if occ_chairs < p_chairs:
-                        patient.status = "ROOMED"
-                        patient.resource_type = "CHAIR"
-                        occ_chairs += 1
-                        active = True
-                    elif occ_beds < p_beds:
-                        patient.status = "ROOMED"
-                        patient.resource_type = "BED"
-                        occ_beds += 1
-                        active = True
-                    elif total_census < surge_cap:
-                        patient.status = "ADMITTED_NO_BED"
-                        patient.resource_type = "HALLWAY"
-                        total_census += 1
-                        active = True
-                
-                if active:
-                    admitted_count += 1
-                    self._init_patient_flow(patient)
+            if assigned:
+                self._occupy(patient, *assigned)
+                admitted_count += 1
+                self._init_patient_flow(patient)
+            else:
+                skipped.append((key, eid))
+        for key, eid in skipped: waiting_queue.push(key, eid)
     
     def _log_exit(self, encounter, status, stage, disposition, fid, ttl=50):
-        # Calculate LOS
-        if status == "DISCHARGED":
-             arrival = encounter.arrival_time
-             # Since arrival_time is a datetime, and we are simulating, we can't use wall clock.
-             # But wait, encounter.arrival_time IS a datetime.
-             # However, the simulation moves faster.
-             # Actually, best to use the `active_encounters` tracking if we want sim-time.
-             # But simpler: we know each tick is 1 minute.
-             # We can just track "ticks active".
-             # Wait, `arrival_time` is set to `datetime.now()` in `_generate_new_encounter`.
-             # That is Real Time.
-             # We need Sim Time. The proper way is to track `tick_arrival`.
-             # But I didn't add that field.
-             # Let's rely on `arrival_time` diff if the sim runs smoothly, OR
-             # Better: Use `wait_time_remaining` logic? No.
-             # Let's just use Real Time delta for now, assuming user is watching live.
-             # Actually, user asked for "simulated time".
-             # Since 1 tick = 1 minute, real time delta is not accurate if we speed up/slow down?
-             # Actually, `datetime.now()` is real time.
-             # If I want SIMULATED time, I should have tracked simulation start time.
-             # Let's approximate: 1 real second = X sim minutes?
-             # No, let's just add `tick_arrival` to model later?
-             # For now, I will use `wait_time_remaining` if it was tracked? No.
-             # Let's just use "Real Time Minutes" for now as a proxy, or I can add `sim_start_tick`.
-             # Simpler: The user said "how long simulated time all patients have been in the system".
-             # I will calculate `(Current Sim Hour * 60) + Sim Minute` - `Arrival Sim Hour...`?
-             # No, day turnover makes that hard.
-             # Let's just store `arrival_tick` in the encounter?
-             # I can't edit `Encounter` easily right now without breaking things?
-             # Actually I can.
-             # But to be safe/fast: estimated LOS = (Now - Arrival) * 60 if we assume 1s = 1m? No.
-             # Let's use the actual datetime delta. Even if it's "Real Time", it reflects the user's experience of the sim speed.
-             # Wait, the prompt says "based on Simulated Time".
-             # Since 1 tick = 1 minute, I should track ticks.
-             # But I don't have `tick_arrival`.
-             # I'll stick to real-time delta in minutes for now as "Time in System".
-             # It's a Moving Average of the "System Dwell Time".
-             pass
-        
-        # Actually, let's look at `_log_exit`.
-        pass
-        
         self.recent_exits.append({
              "id": encounter.id,
              "facility_id": fid,
@@ -344,21 +493,16 @@ class SimulationEngine:
          })
          
         if status == "DISCHARGED":
-            # Simple Hack: We don't have perfect Sim Time tracking on the object.
-            # But we can approximate using Real Time delta.
-            duration = (datetime.now() - encounter.arrival_time).total_seconds() / 60
-            # Scale it? The user said "simulated time".
-            # 1 tick = 0.1s = 1 minute.
-            # So 1 real second = 10 simulated minutes.
-            # Real Duration (min) * 60 (sec/min) * 10 (sim min/sec) = Sim Minutes.
-            # Sim Minutes = Real Seconds * 10.
-            sim_minutes = (datetime.now() - encounter.arrival_time).total_seconds() * 10
+            # Length of stay in simulated minutes, independent of how fast the loop runs
+            sim_minutes = self.sim_minute - encounter.arrival_tick
             self.los_history.append(sim_minutes / 60) # Store in Hours
             if len(self.los_history) > 150: self.los_history.pop(0)
     
-    def _prune_recent_exits(self):
-        self.recent_exits = [e for e in self.recent_exits if e["ttl"] > 0]
-        for e in self.recent_exits: e["ttl"] -= 1
+    def _prune_recent_exits(self, minutes=1):
+        # Same as `minutes` consecutive single-minute prunes
+        if minutes <= 0: return
+        self.recent_exits = [e for e in self.recent_exits if e["ttl"] - (minutes - 1) > 0]
+        for e in self.recent_exits: e["ttl"] -= minutes
 
     def _init_patient_flow(self, patient):
         patient.stage = "ASSESSING"
@@ -366,23 +510,23 @@ class SimulationEngine:
         base_lab = 90 if (0 <= self.current_sim_hour < 8) else 45
         patient.lab_timer = int(base_lab / PRODUCTIVITY_FACTOR)
         
-        if random.random() < 0.15: 
+        if self.rng.random() < 0.15: 
             patient.disposition = "ADMIT"
-            base_treat = random.randint(1440, 2880)
+            base_treat = self.rng.randint(1440, 2880)
             patient.treatment_time_remaining = int(base_treat / PRODUCTIVITY_FACTOR)
         else:
             patient.disposition = "DISCHARGE"
             if patient.assigned_ctas in [1, 2]:
-                 base_treat = random.randint(240, 480)
+                 base_treat = self.rng.randint(240, 480)
             elif patient.assigned_ctas == 3:
-                 base_treat = random.randint(180, 360) 
+                 base_treat = self.rng.randint(180, 360) 
             else:
-                 base_treat = random.randint(60, 180)
+                 base_treat = self.rng.randint(60, 180)
             
             patient.treatment_time_remaining = int(base_treat / PRODUCTIVITY_FACTOR)
 
 
-    def _get_vitals(self):
+    def _collect_patients(self):
         census = {}
         hallway_count = 0
         
@@ -404,12 +548,55 @@ class SimulationEngine:
                 "resource_type": enc.resource_type,
                 "ttl": -1 # Active
             })
-            
+        return census, hallway_count, patient_list
+
+    def _facility_census(self):
+        # All active patients (waiting or in care) per facility
+        census = {}
+        for enc in self.active_encounters.values():
+            census[enc.facility_id] = census.get(enc.facility_id, 0) + 1
+        return census
+
+    def _facility_boarding(self):
+        # Admitted patients still holding an ED spot, per facility
+        boarding = {}
+        for enc in self.active_encounters.values():
+            if enc.stage == "BOARDING" and enc.status in ["ROOMED", "ADMITTED_NO_BED"]:
+                boarding[enc.facility_id] = boarding.get(enc.facility_id, 0) + 1
+        return boarding
+
+    def _refresh_board(self):
+        # Patients only change on ticks, so the board is rebuilt once per sim minute
+        # however many clients poll in between
+        if self._board_minute == self.sim_minute: return
+        census, hallway_count, patient_list = self._collect_patients()
+        rows = {p["id"]: p for p in patient_list}
         # Add Recent Exits
-        patient_list.extend(self.recent_exits)
+        for e in self.recent_exits: rows[e["id"]] = dict(e)
+        self.board.update(rows)
+        self._board_minute = self.sim_minute
+        self._board_counts = (census, hallway_count)
+
+    def _get_vitals(self, since_version=None):
+        self._refresh_board()
+        vitals = self._vitals_fields()
+        vitals.update(board_payload(self.board, since_version))
+        return vitals
+
+    def publish(self, previous=None) -> PublishedSession:
+        # Immutable copy of everything the read endpoints serve (see PublishedSession);
+        # `previous` lets unchanged alert / event views be shared
+        self._refresh_board()
+        return PublishedSession(self._vitals_fields(), self.board.frozen(), self._facility_census(),
+                                self.alerts.view(previous.alerts if previous else None),
+                                self.event_log.view(previous.events if previous else None))
+
+    def _vitals_fields(self):
+        # Vitals without the patient board (after _refresh_board)
+        census, hallway_count = self._board_counts
         
-        total_capacity = sum([f["capacity"] for f in FACILITIES])
-        active_total = len(self.active_encounters)
+        total_capacity = REGISTRY.total_capacity
+        active_total = self._active_count()
         occupancy_ratio = active_total / total_capacity if total_capacity > 0 else 0
         
         if occupancy_ratio < 0.2: nedocs = 1 
@@ -421,59 +608,179 @@ class SimulationEngine:
         
         avg_los = sum(self.los_history) / len(self.los_history) if self.los_history else 0
         
-        return {
+        vitals = {
             "census": census,
+            "version": self.board.version,
             "processed": self.total_patients_processed,
             "lwbs": self.lwbs_count,
+            "redirected": self.redirected_count,
+            "surges": self.arrivals.active_surges(self.sim_minute),
+            "diversion_lost": self.diversion_lost,
             "sim_hour": self.current_sim_hour,
-            "history": self.history,
+            "sim_minute": self.sim_minute,
+            "history": list(self.history),
             "nedocs": nedocs,
             "hallway_patients": hallway_count,
             "avg_los": round(avg_los, 1),
-            "patients": patient_list,
             "capacity_thresholds": {
-                "total_physical": sum([r["physical_beds"] for r in FACILITY_RESOURCES.values()]),
-                "total_surge": sum([r["surge_capacity"] for r in FACILITY_RESOURCES.values()])
+                "total_physical": self._capacity_totals[0],
+                "total_surge": self._capacity_totals[1]
             }
         }
+        return vitals
+
+    # ---------------------------------------------------------
+    # Snapshot / Restore (binary layout in sim_snapshot)
+    # ---------------------------------------------------------
+    def snapshot(self, compress=True) -> bytes:
+        return dumps(self._snapshot_state(), compress)
+
+    def restore(self, data: bytes):
+        # Loads a snapshot taken from the same backend; the run carries on exactly
+        # as the original would (same RNG stream, queues, timers and alerts)
+        state = loads(data)
+        if state["backend"] != type(self).__name__:
+            raise ValueError(f"Snapshot is from {state['backend']}, not {type(self).__name__}")
+        if state.get("registry", REGISTRY.version) != REGISTRY.version:
+            raise ValueError("Snapshot was taken with a different facility configuration")
+        self._restore_state(state)
+        return self
+
+    def _snapshot_state(self) -> Dict:
+        return {
+            "backend": type(self).__name__,
+            "registry": REGISTRY.version,
+            "sim_minute": self.sim_minute,
+            "current_sim_hour": self.current_sim_hour,
+            "total_patients_processed": self.total_patients_processed,
+            "encounter_count": self.encounter_count,
+            "lwbs_count": self.lwbs_count,
+            "lwbs_by_facility": self.lwbs_by_facility,
+            "redirected_count": self.redirected_count,
+            "arrivals": self.arrivals.get_state(),
+            "diversion_lost": self.diversion_lost,
+            "scenario": self._scenario_parameters(),
+            "history": self.history,
+            "recent_exits": self.recent_exits,
+            "los_history": self.los_history,
+            "patients": self._snapshot_patients(),
+            "rng": self.rng.get_state(),
+            "intel": self.intel_engine.get_state(),
+            "alerts": self.alerts.get_state(),
+            "board_version": self.board.version,
+            "event_log": self.event_log.get_state(),
+        }
+
+    def _restore_state(self, state):
+        self.sim_minute = state["sim_minute"]
+        self.current_sim_hour = state["current_sim_hour"]
+        self.total_patients_processed = state["total_patients_processed"]
+        self.encounter_count = state.get("encounter_count", 0)
+        self.lwbs_count = state["lwbs_count"]
+        self.lwbs_by_facility.update(state.get("lwbs_by_facility", {}))
+        self.redirected_count = state.get("redirected_count", 0)
+        if "arrivals" in state: self.arrivals.set_state(state["arrivals"])
+        self.diversion_lost = state.get("diversion_lost", 0)
+        if "scenario" in state: self._set_scenario_parameters(state["scenario"])
+        self.history = state["history"]
+        self.recent_exits = state["recent_exits"]
+        self.los_history = state["los_history"]
+        self._restore_patients(state["patients"])
+        self.rng = SimRandom.from_state(state["rng"])
+        self.intel_engine.set_state(state["intel"])
+        self.alerts = AlertStore.from_state(state["alerts"])
+        self.board.restart_at(state["board_version"])
+        self._board_minute = None
+        if "event_log" in state: self.event_log.set_state(state["event_log"])
+
+    def _snapshot_patients(self) -> Dict:
+        encounters = list(self.active_encounters.values())
+        return {
+            "encounters": encode_table(encounters, Encounter),
+            "arrival_seq": np.array([self.arrival_seq[e.id] for e in encounters], dtype=np.int64),
+            "next_seq": self._next_seq,
+            "waiting_queues": {fid: queue.items() for fid, queue in self.waiting_queues.items()},
+            "results_ready": {fid: queue.items() for fid, queue in self.results_ready.items()},
+            "census": self.census,
+        }
+
+    def _restore_patients(self, patients):
+        encounters = decode_table(patients["encounters"], Encounter)
+        self.active_encounters = {e.id: e for e in encounters}
+        self.arrival_seq = {e.id: seq for e, seq in zip(encounters, patients["arrival_seq"].tolist())}
+        self._next_seq = patients["next_seq"]
+        self.waiting_queues = {fid: IndexedHeap.from_items(items) for fid, items in patients["waiting_queues"].items()}
+        self.results_ready = {fid: IndexedHeap.from_items(items) for fid, items in patients["results_ready"].items()}
+        self.census = patients["census"]
+
+    # ---------------------------------------------------------
+    # Status-change helpers (keep the incremental indexes in sync)
+    # ---------------------------------------------------------
+    def _add_encounter(self, encounter):
+        self.active_encounters[encounter.id] = encounter
+        self.arrival_seq[encounter.id] = self._next_seq
+        self._next_seq += 1
+        self.waiting_queues[encounter.facility_id].push((encounter.assigned_ctas, self.arrival_seq[encounter.id]), encounter.id)
+
+    def _occupy(self, patient, status, resource_type):
+        # WAITING / results-back patient takes a BED, CHAIR or HALLWAY spot.
+        # The queues have already popped the patient.
+        patient.status = status
+        patient.resource_type = resource_type
+        counts = self.census[patient.facility_id]
+        counts[resource_type] += 1
+        counts["TOTAL"] += 1
+
+    def _results_back(self, patient, resource_type):
+        self._occupy(patient, "ROOMED", resource_type)
+        if patient.disposition == "ADMIT": patient.stage = "BOARDING"
+        else: patient.stage = "TREATING"
+
+    def _vacate(self, patient):
+        if patient.status in ["ROOMED", "ADMITTED_NO_BED"] and patient.resource_type in ["BED", "CHAIR", "HALLWAY"]:
+            counts = self.census[patient.facility_id]
+            counts[patient.resource_type] -= 1
+            counts["TOTAL"] -= 1
+
+    def _send_to_results(self, patient):
+        self._vacate(patient)
+        patient.status = "WAITING_FOR_RESULTS"
+        patient.resource_type = "NONE"
+        if patient.lab_timer <= 0:
+            self.results_ready[patient.facility_id].push(self.arrival_seq[patient.id], patient.id)
+
+    def _remove_encounter(self, encounter_id):
+        patient = self.active_encounters.pop(encounter_id)
+        self._vacate(patient)
+        self.waiting_queues[patient.facility_id].discard(encounter_id)
+        self.results_ready[patient.facility_id].discard(encounter_id)
+        del self.arrival_seq[encounter_id]
 
     def _generate_new_encounter(self, facility_id, is_fast_forward=False):
-        rule = random.choice(CLINICAL_RULES)
-        assigned_ctas = rule["required_ctas"]
-        is_serious = True if rule["risk_level"] in ["HIGH", "CRITICAL"] else False
-        notes = f"Patient presents with {rule['symptom']}."
-
-        if random.random() < 0.2:
-            if random.random() < 0.5:
-                incorrect_ctas = random.choice([c for c in [1,2,3,4,5] if c != rule["required_ctas"]])
-                assigned_ctas = incorrect_ctas
+        self._generate_encounters([facility_id], is_fast_forward)
+
+    def _new_encounter(self, facility_id, now):
+        required_ctas, symptom, is_serious, notes, wrong_ctas = self.rng.choice(ARRIVAL_PROFILES)
+        assigned_ctas = required_ctas
+
+        if self.rng.random() < 0.2:
+            if self.rng.random() < 0.5:
+                assigned_ctas = self.rng.choice(wrong_ctas)
             else:
                 is_serious = False
                 notes += " slightly concerned about hospitalization."
 
-        encounter = Encounter(
-            id=str(uuid.uuid4()),
-            facility_id=facility_id,
-            patient_age=random.randint(18, 90),
-            symptom=rule["symptom"],
-            assigned_ctas=assigned_ctas,
-            arrival_time=datetime.now(),
-            status="WAITING",
-            is_serious=is_serious,
-            clinical_notes=notes,
-            wait_time_remaining=0 
-        )
-
-        self.active_encounters[encounter.id] = encounter
-        self.total_patients_processed += 1
-        
-        if not is_fast_forward:
-            print(f"[SIM] [{facility_id}] Patient P-{encounter.id[-4:]} arrived ({encounter.symptom}). Assigned CTAS: {encounter.assigned_ctas}")
-            alert = self.intel_engine.audit_encounter(encounter)
-            if alert:
-                self.alerts.append(alert)
-                print(f"[INTEL] 🚨 ALERT DETECTED: {alert.explanation}")
-        else:
-            alert = self.intel_engine.audit_encounter(encounter)
-            if alert:
-                self.alerts.append(alert)
+        self.encounter_count += 1
+        return trusted_model(Encounter, {
+            **ENCOUNTER_DEFAULTS,
+            "id": f"{self.encounter_count:08x}",
+            "facility_id": facility_id,
+            "patient_age": self.rng.randint(18, 90),
+            "symptom": symptom,
+            "assigned_ctas": assigned_ctas,
+            "arrival_time": now,
+            "arrival_tick": self.sim_minute,
+            "is_serious": is_serious,
+            "clinical_notes": notes,
+            "wait_time_remaining": 0,
+        }, ENCOUNTER_FIELDS)
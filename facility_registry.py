@@ -0,0 +1,132 @@
+import csv
+import hashlib
+import json
+import os
+from typing import Dict, List
+
+import numpy as np
+
+from data_seeds import FACILITIES, FACILITY_RESOURCES
+from spatial_index import SpatialGrid
+
+# Facility Registry
+# SOLARIS_FACILITIES points at a .json, .yaml, .csv or .parquet file with one
+# record per ED; unset = the built-in seed facilities (data_seeds). Every
+# process (API, shards, scenario workers) loads the same file at import.
+FACILITIES_FILE = os.environ.get("SOLARIS_FACILITIES", "")
+SHIFTS = ("day_shift", "evening_shift", "night_shift")
+DEFAULT_CHAIRS = 20
+# Regional routing: nearest facilities kept per ED (searched in order for a non-diverted one)
+NEIGHBOURS = int(os.environ.get("SOLARIS_NEIGHBOURS", "8"))
+
+PUBLIC_FIELDS = ("id", "name", "lat", "lon", "capacity") # What /facilities shows
+INT_FIELDS = ("capacity", "physical_beds", "surge_capacity", "chair_capacity")
+
+class FacilityRegistry:
+    # Facilities in a fixed order (engines iterate `ids`, columnar arrays use
+    # `index`), with O(1) lookups by id and everything derived from the
+    # configuration computed once: capacity totals, per-shift MD / RN tables,
+    # nearest-neighbour lists for regional routing and the public /facilities rows.
+    def __init__(self, records: List[Dict], source: str = "data_seeds"):
+        records = [_normalize(r) for r in records]
+        if not records: raise ValueError(f"No facilities in {source}")
+        self.source = source
+        self.ids = [r["id"] for r in records]
+        if len(set(self.ids)) != len(self.ids): raise ValueError(f"Duplicate facility ids in {source}")
+        self.index = {fid: i for i, fid in enumerate(self.ids)}
+        # Same shapes as data_seeds.FACILITIES / FACILITY_RESOURCES
+        self.facilities = {r["id"]: {k: r[k] for k in PUBLIC_FIELDS} for r in records}
+        self.resources = {
+            r["id"]: {k: r[k] for k in ("name", "type", "physical_beds", "surge_capacity", "chair_capacity", "staffing")}
+            for r in records
+        }
+        self.rows = list(self.facilities.values())
+
+        self.total_capacity = sum(r["capacity"] for r in records)
+        self.total_physical, self.total_surge = capacity_totals(self.resources)
+        self.md_counts = {s: np.array([r["staffing"][s]["md_count"] for r in records], dtype=np.int32) for s in SHIFTS}
+        self.rn_counts = {s: np.array([r["staffing"][s]["rn_count"] for r in records], dtype=np.int32) for s in SHIFTS}
+        # Nearest-first neighbour lists from a spatial grid over lat / lon
+        grid = SpatialGrid([r["lat"] for r in records], [r["lon"] for r in records])
+        k = min(NEIGHBOURS, len(records) - 1)
+        self.neighbour_index = [np.array(grid.nearest(i, k), dtype=np.int64) for i in range(len(records))]
+        self.neighbours = {fid: [self.ids[j] for j in self.neighbour_index[i].tolist()] for i, fid in enumerate(self.ids)}
+        self.neighbour_km = {
+            fid: [round(grid.distance_km(i, j), 2) for j in self.neighbour_index[i].tolist()] for i, fid in enumerate(self.ids)
+        }
+
+        # Changes whenever the configuration does; caches of derived responses key on it
+        self.version = hashlib.sha256(json.dumps(records, sort_keys=True).encode()).hexdigest()[:12]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, facility_id):
+        return facility_id in self.index
+
+    def get(self, facility_id: str) -> Dict:
+        return self.facilities[facility_id]
+
+def capacity_totals(resources: Dict[str, Dict]):
+    # (physical beds, surge capacity) summed over a resources table
+    return (sum(r["physical_beds"] for r in resources.values()),
+            sum(r["surge_capacity"] for r in resources.values()))
+
+def _normalize(record: Dict) -> Dict:
+    # Nested staffing ({"staffing": {"day_shift": {"md_count": ..}}}) or flat
+    # columns (day_shift_md_count, day_shift_rn_count, ...) as in a CSV
+    fid = record.get("id")
+    if not fid: raise ValueError(f"Facility record without an id: {record}")
+    missing = [k for k in ("name", "lat", "lon", "capacity", "physical_beds", "surge_capacity") if record.get(k) in (None, "")]
+    if missing: raise ValueError(f"Facility {fid}: missing {', '.join(missing)}")
+    staffing = record.get("staffing") or {}
+    try:
+        out = {
+            "id": str(fid),
+            "name": str(record["name"]),
+            "type": str(record.get("type") or ""),
+            "lat": float(record["lat"]),
+            "lon": float(record["lon"]),
+            "chair_capacity": DEFAULT_CHAIRS if record.get("chair_capacity") in (None, "") else record["chair_capacity"],
+            "staffing": {},
+        }
+        for k in INT_FIELDS:
+            out[k] = int(record[k]) if k in record and record[k] not in (None, "") else out[k]
+        for shift in SHIFTS:
+            counts = staffing.get(shift) or {k: record.get(f"{shift}_{k}") for k in ("md_count", "rn_count")}
+            out["staffing"][shift] = {k: int(counts.get(k) or 0) for k in ("md_count", "rn_count")}
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Facility {fid}: {e}")
+    return out
+
+def _read_records(path: str) -> List[Dict]:
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".json":
+        with open(path) as f: data = json.load(f)
+    elif ext in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError:
+            raise ValueError("PyYAML is required for YAML facility files (pip install pyyaml)")
+        with open(path) as f: data = yaml.safe_load(f)
+    elif ext == ".csv":
+        with open(path, newline="") as f: data = list(csv.DictReader(f))
+    elif ext == ".parquet":
+        try:
+            import pandas as pd
+        except ImportError:
+            raise ValueError("pandas + pyarrow are required for Parquet facility files")
+        data = pd.read_parquet(path).to_dict("records")
+    else:
+        raise ValueError(f"Unsupported facility file type '{ext}' (use .json, .yaml, .csv or .parquet)")
+    if isinstance(data, dict): data = data.get("facilities", [])
+    return data
+
+def seed_records() -> List[Dict]:
+    return [{**FACILITY_RESOURCES[f["id"]], **f} for f in FACILITIES]
+
+def load_registry(path: str = FACILITIES_FILE) -> FacilityRegistry:
+    if not path: return FacilityRegistry(seed_records())
+    return FacilityRegistry(_read_records(path), source=path)
+
+REGISTRY = load_registry()
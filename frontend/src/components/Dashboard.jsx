@@ -1,4 +1,4 @@
-import React, { useEffect, useState, useMemo } from 'react';
+import React, { useEffect, useState, useMemo, useRef } from 'react';
 import axios from 'axios';
 import StatsPanel from './StatsPanel';
 import FacilityMap from './FacilityMap';
@@ -9,6 +9,8 @@ import HighRiskPanel from './HighRiskPanel';
 import ActionsPanel from './ActionsPanel';
 
 const API_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000';
+// Alerts kept in the tab: the server's retention (SOLARIS_ALERT_RETENTION), which is all /alerts returns
+const ALERT_LIMIT = 1000;
 
 export default function Dashboard() {
     const [status, setStatus] = useState({});
@@ -17,6 +19,7 @@ export default function Dashboard() {
     const [session, setSession] = useState(localStorage.getItem('solar_session_id') || null);
     const [tempName, setTempName] = useState("");
     const [activeDriver, setActiveDriver] = useState(null);
+    const board = useRef({ version: null, patients: {} }); // Patient board merged from /status deltas
 
     const handleLogin = (e) => {
         e.preventDefault();
@@ -26,16 +29,30 @@ export default function Dashboard() {
         setSession(newSession);
     };
 
+    const applyStatus = (data) => {
+        const { patients, changed, removed, delta, ...vitals } = data;
+        if (delta) {
+            changed.forEach(p => { board.current.patients[p.id] = p; });
+            removed.forEach(id => { delete board.current.patients[id]; });
+        } else {
+            board.current.patients = Object.fromEntries(patients.map(p => [p.id, p]));
+        }
+        board.current.version = vitals.version;
+        setStatus({ ...vitals, patients: Object.values(board.current.patients) });
+    };
+
     const fetchData = async () => {
         if (!session) return;
         try {
             const [statusRes, facilitiesRes, alertsRes] = await Promise.all([
-                axios.get(`${API_URL}/status?session_id=${session}`),
+                axios.get(`${API_URL}/status`, {
+                    params: { session_id: session, since_version: board.current.version ?? undefined }
+                }),
                 axios.get(`${API_URL}/facilities?session_id=${session}`),
                 axios.get(`${API_URL}/alerts?session_id=${session}`)
             ]);
 
-            setStatus(statusRes.data);
+            applyStatus(statusRes.data);
             setFacilities(facilitiesRes.data);
             setAlerts(alertsRes.data);
         } catch (error) {
@@ -44,11 +61,30 @@ export default function Dashboard() {
     };
 
     useEffect(() => {
-        if (session) {
+        board.current = { version: null, patients: {} };
+        setAlerts([]);
+        if (!session) return;
+
+        // Push stream (one combined frame per tick); fall back to 1 Hz polling if it drops
+        let interval = null;
+        const ws = new WebSocket(`${API_URL.replace(/^http/, 'ws')}/stream?session_id=${session}`);
+        ws.onmessage = (event) => {
+            const frame = JSON.parse(event.data);
+            applyStatus(frame.status);
+            if (frame.facilities) setFacilities(frame.facilities);
+            if (frame.new_alerts.length) setAlerts(prev => [...prev, ...frame.new_alerts].slice(-ALERT_LIMIT));
+        };
+        ws.onclose = () => {
+            if (interval) return;
+            board.current = { version: null, patients: {} };
             fetchData();
-            const interval = setInterval(fetchData, 1000);
-            return () => clearInterval(interval);
-        }
+            interval = setInterval(fetchData, 1000);
+        };
+        return () => {
+            ws.onclose = null;
+            ws.close();
+            if (interval) clearInterval(interval);
+        };
     }, [session]);
 
     // Filter Patients based on Driver Selection
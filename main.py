@@ -1,11 +1,28 @@
 
 # main.py
 import asyncio
-from typing import Dict
-from fastapi import FastAPI, Query
+import os
+import time
+from functools import lru_cache
+from typing import Optional
+from fastapi import FastAPI, HTTPException, Query, Response, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from engine_sim import SimulationEngine
-from data_seeds import FACILITIES
+from batch_runner import API_LIMIT as BATCH_LIMIT, run_replications
+from session_scheduler import ShardedSessionScheduler
+from sim_broker import BrokerClient
+from session_manager import SessionManager
+from scenario_runner import ScenarioRunner
+from sim_clock import TickClock
+from models import BatchSimulationRequest, ScenarioRequest, SurgeEvent
+from facility_registry import REGISTRY
+from vitals_snapshot import PublishedSession
+from response_cache import ResponseCache, encode_json
+from sim_log import logger, setup_logging
+from sim_metrics import PROFILING, export_metrics, family, record_loop, render
+
+setup_logging() # Before anything logs: records go through a background listener
 
 app = FastAPI(title="Solaris-ClearAE Backend")
 
@@ -17,62 +34,302 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Multi-Tenant Session Store
-# Format: { "session_id": SimulationEngine() }
-active_sessions: Dict[str, SimulationEngine] = {}
+# Engine Backend (see engine_registry.ENGINE_BACKENDS)
+ENGINE_BACKEND = os.environ.get("SOLARIS_ENGINE", "object")
+
+# Sharded Mode: SOLARIS_SHARDS > 0 ticks sessions in that many worker processes
+# and the endpoints read their published snapshots. 0 = in-process loop.
+NUM_SHARDS = int(os.environ.get("SOLARIS_SHARDS", "0"))
+
+# Broker Mode: SOLARIS_BROKER = socket of a `python3 sim_broker.py` owner process.
+# This process then only serves the API (any number of uvicorn workers can) and
+# the owner's shards do all the ticking.
+BROKER = os.environ.get("SOLARIS_BROKER", "")
+if BROKER: scheduler = BrokerClient(BROKER)
+else: scheduler = ShardedSessionScheduler(NUM_SHARDS, backend=ENGINE_BACKEND) if NUM_SHARDS > 0 else None
+
+# Multi-Tenant Session Store (LRU-capped; idle sessions pause, then hibernate to disk).
+# In-process mode only: with a scheduler the sessions live in the shards.
+sessions = SessionManager(ENGINE_BACKEND) if scheduler is None else None
+
+# What-if replications run on their own process pool, away from the live loop.
+# Broker mode starts it on the first scenario request: every uvicorn worker has one.
+scenarios = ScenarioRunner()
+
+# Encoded /status, /alerts and /facilities bodies per session and state version
+responses = ResponseCache()
 
 def get_or_create_session(session_id: str) -> SimulationEngine:
-    if session_id not in active_sessions:
-        print(f"[SYSTEM] Creating new session: {session_id}")
-        active_sessions[session_id] = SimulationEngine()
-    return active_sessions[session_id]
+    return sessions.get(session_id)
 
 @app.on_event("startup")
 async def startup_event():
-    asyncio.create_task(run_simulation())
+    if not BROKER: scenarios.start() # Spawn + warm the pool now, not on the first request
+    if scheduler:
+        scheduler.start()
+    else:
+        asyncio.create_task(run_simulation())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    scenarios.stop()
+    if scheduler: scheduler.stop()
+    else: sessions.close() # Final checkpoint of every live session
 
 async def run_simulation():
-    print("Starting Multi-Tenant Simulation Loop...")
+    logger.info("Starting Multi-Tenant Simulation Loop...")
+    clock = TickClock(tick_seconds=0.1) # 1 tick = 0.1s
     while True:
-        # Tick all active sessions
-        # We use list() to avoid runtime error if dict changes size during iteration
-        for session_id in list(active_sessions.keys()):
-            try:
-                active_sessions[session_id].tick()
-            except Exception as e:
-                print(f"Error in session {session_id}: {e}")
-        
-        await asyncio.sleep(0.1) # 1 tick = 0.1s
+        ticks = clock.due()
+        if ticks > 1: logger.warning(f"[SYSTEM] Loop behind schedule, catching up {ticks} ticks")
+        # Tick all non-idle sessions (a backlog runs as one batch); idle ones pause / hibernate
+        start = time.perf_counter()
+        try:
+            sessions.tick_all(ticks)
+        except Exception as e: # Keep the loop alive: a dead loop freezes every session
+            logger.exception(f"[SYSTEM] Simulation loop iteration failed: {e}")
+        record_loop(clock, time.perf_counter() - start)
+
+        await asyncio.sleep(clock.sleep_time())
+
+def published(session_id: str) -> PublishedSession:
+    # Every read endpoint serves the session's latest published state: built by
+    # the loop (or shard) after a tick, never modified, so reads need no locks
+    state = scheduler.published(session_id) if scheduler else sessions.published(session_id)
+    if state is None:
+        raise HTTPException(status_code=503, detail=f"Session {session_id} has not published a snapshot yet")
+    return state
+
+def cached_json(session_id: str, key: tuple, build) -> Response:
+    # build(state) -> payload; encoded once per published state and key
+    state = published(session_id)
+    return Response(responses.get(session_id, state.version, key, lambda: build(state)), media_type="application/json")
+
+@lru_cache(maxsize=1024)
+def facilities_response(registry_version: str, census: tuple) -> list:
+    # Shared across sessions and requests with the same census; keyed on the
+    # registry version so a configuration change never serves stale rows.
+    # Callers must not mutate the result.
+    return [{**row, "current_census": count} for row, count in zip(REGISTRY.rows, census)]
+
+def session_facilities(state: PublishedSession) -> list:
+    census = state.facility_census
+    return facilities_response(REGISTRY.version, tuple(census.get(fid, 0) for fid in REGISTRY.ids))
 
 @app.get("/status")
-def get_status(session_id: str = Query(..., description="Unique Session ID")):
-    sim = get_or_create_session(session_id)
-    vitals = sim._get_vitals() 
-    return {
-        **vitals,
-        "total_alerts": len(sim.alerts)
-    }
+def get_status(
+    session_id: str = Query(..., description="Unique Session ID"),
+    since_version: Optional[int] = Query(None, description="Only return patients changed since this board version"),
+):
+    return cached_json(session_id, ("status", since_version), lambda state: state.status(since_version))
 
 @app.get("/alerts")
-def get_alerts(session_id: str = Query(..., description="Unique Session ID")):
-    sim = get_or_create_session(session_id)
-    return sim.alerts
+def get_alerts(
+    session_id: str = Query(..., description="Unique Session ID"),
+    after: Optional[str] = Query(None, description="Cursor: id of the last alert already received"),
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    severity: Optional[str] = None,
+    rule: Optional[str] = None,
+    encounter_id: Optional[str] = None,
+):
+    return cached_json(session_id, ("alerts", after, limit, severity, rule, encounter_id),
+                       lambda state: state.alerts.page(after, limit, severity, rule, encounter_id))
+
+@app.get("/alerts/summary")
+def get_alert_summary(session_id: str = Query(..., description="Unique Session ID")):
+    # All-time totals by severity and rule, plus how many are still retained
+    return published(session_id).alerts.counters()
+
+@app.get("/sessions/{session_id}/events")
+def get_events(
+    session_id: str,
+    after: int = Query(-1, description="Cursor: seq of the last event already received"),
+    limit: int = Query(100, ge=1, le=1000),
+    kind: Optional[str] = Query(None, description="arrival, alert, results_back, redirect or hour"),
+    level: str = Query("DEBUG", description="Minimum level (INFO, WARNING, ...)"),
+):
+    # Recent simulation events (newest SOLARIS_EVENT_LOG_SIZE kept per session)
+    try:
+        return published(session_id).events.query(after, limit, kind, level)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/facilities")
 def get_facilities(session_id: str = Query(..., description="Unique Session ID")):
-    sim = get_or_create_session(session_id)
-    
-    census = {}
-    for enc in sim.active_encounters.values():
-        census[enc.facility_id] = census.get(enc.facility_id, 0) + 1
-    
-    response = []
-    for fac in FACILITIES:
-        fac_copy = fac.copy()
-        fac_copy["current_census"] = census.get(fac["id"], 0)
-        response.append(fac_copy)
-    
-    return response
+    return cached_json(session_id, ("facilities",), session_facilities)
+
+def build_frame(session_id: str, since_version: Optional[int], alerts_sent: int) -> dict:
+    # One combined update from one published state: board delta, alerts raised
+    # since the last frame, census
+    state = published(session_id)
+    return {
+        "status": state.status(since_version),
+        "new_alerts": state.alerts.since(alerts_sent),
+        "alert_seq": state.alerts.total,
+        "facilities": session_facilities(state),
+    }
+
+@app.websocket("/stream")
+async def stream(
+    websocket: WebSocket,
+    session_id: str = Query(..., description="Unique Session ID"),
+    interval: float = Query(0.1, ge=0.1, le=10.0, description="Seconds between frames (0.1 = every tick)"),
+):
+    # Push replacement for polling /status, /alerts and /facilities.
+    # Frames are built only when the previous one has been sent, as a delta from
+    # what this client last received, so a slow consumer gets fewer, coalesced
+    # frames instead of a growing backlog of stale ones.
+    await websocket.accept()
+    closed = asyncio.Event()
+
+    async def watch_close():
+        try:
+            while (await websocket.receive())["type"] != "websocket.disconnect": pass
+        finally:
+            closed.set()
+
+    watcher = asyncio.create_task(watch_close())
+    version, alerts_sent, last_minute, last_census = None, 0, None, None
+    try:
+        while not closed.is_set():
+            try: # Off the event loop: a read can wait for the session's next publish
+                frame = await run_in_threadpool(build_frame, session_id, version, alerts_sent)
+            except HTTPException:
+                frame = None # Not published yet, retry next interval
+            if frame and (frame["status"]["sim_minute"] != last_minute or frame["new_alerts"]):
+                status = frame["status"]
+                census = [f["current_census"] for f in frame["facilities"]]
+                if census == last_census: del frame["facilities"]
+                await websocket.send_text(encode_json(frame).decode())
+                version, last_minute, last_census = status["version"], status["sim_minute"], census
+                alerts_sent = frame["alert_seq"]
+            try:
+                await asyncio.wait_for(closed.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+    except (WebSocketDisconnect, RuntimeError):
+        pass # Client went away mid-send
+    finally:
+        watcher.cancel()
+
+@app.get("/sessions")
+async def get_sessions(state_size: bool = Query(False, description="Also measure each live session's serialized size")):
+    # Live / paused / hibernated sessions with per-session tick cost.
+    # On the event loop: state_size snapshots the in-process engines between ticks.
+    if scheduler: return await run_in_threadpool(scheduler.session_stats)
+    return sessions.stats(state_size)
+
+@app.post("/sessions/{session_id}/fork")
+async def fork_session(
+    session_id: str,
+    new_id: Optional[str] = Query(None, description="Id for the clone (default: <session_id>_fork_<random>)"),
+    seed: Optional[int] = Query(None, description="Reseed the clone so it diverges; omit to replay the same random stream"),
+):
+    # On the event loop, like add_surge: the source is snapshotted between two ticks
+    try:
+        if scheduler:
+            fork = await run_in_threadpool(scheduler.fork, session_id, new_id, seed)
+            if fork is None: raise HTTPException(status_code=503, detail=f"Session {session_id} could not be forked in time")
+            return fork
+        return sessions.fork(session_id, new_id, seed)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.post("/sessions/{session_id}/surge")
+async def add_surge(session_id: str, surge: SurgeEvent):
+    # Arrival surge on the live session (mass-casualty burst, outbreak, ...).
+    # Runs on the event loop so it never interleaves with a tick.
+    if surge.facility_id is not None and surge.facility_id not in REGISTRY:
+        raise HTTPException(status_code=400, detail=f"Unknown facility '{surge.facility_id}'")
+    if scheduler:
+        scheduled = await run_in_threadpool(scheduler.add_surge, session_id, surge.model_dump())
+        if scheduled is None: raise HTTPException(status_code=503, detail=f"Session {session_id} did not respond in time")
+    else:
+        scheduled = get_or_create_session(session_id).add_surge(**surge.model_dump())
+    return {"session_id": session_id, "surge": scheduled}
+
+@app.post("/sessions/{session_id}/scenario")
+async def run_scenario(session_id: str, request: ScenarioRequest):
+    # "What if" from the session's current state: replications under the overrides,
+    # percentile bands of census, boarding and LWBS per facility per hour.
+    # The live session is not modified. The snapshot is taken on the event loop,
+    # between two ticks (like fork); the replications then wait on the threadpool.
+    if scheduler:
+        blob = await run_in_threadpool(scheduler.export, session_id)
+        if blob is None: raise HTTPException(status_code=503, detail=f"Session {session_id} could not be exported in time")
+    else:
+        blob = get_or_create_session(session_id).snapshot(compress=False)
+    overrides = request.model_dump(exclude={"hours", "replications", "seed", "budget_seconds"}, exclude_none=True)
+    try:
+        result = await run_in_threadpool(scenarios.run, blob, ENGINE_BACKEND, overrides, hours=request.hours,
+                                         replications=request.replications, seed=request.seed,
+                                         budget_seconds=request.budget_seconds)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except TimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    return {"session_id": session_id, "backend": ENGINE_BACKEND, "overrides": overrides, **result}
+
+@app.get("/shards")
+def get_shards():
+    # Per-shard session count, tick cost and deadline overruns
+    if not scheduler: return {"shards": 0}
+    return scheduler.stats()
+
+@app.get("/metrics")
+async def get_metrics():
+    # Prometheus text: tick phase / session / loop timings, loop lag, session and
+    # patient counts, alerts. Sharded mode adds every shard's (label shard="N").
+    # On the event loop: in-process sessions are counted between ticks.
+    # Shard metrics come off it (in broker mode they are a round trip to the owner).
+    sources = [({}, export_metrics(None if scheduler else sessions) + [
+        family("solaris_response_cache_total", "Read requests answered from / encoded into the response cache", "counter", "result",
+               {"hit": responses.hits, "miss": responses.misses}),
+    ])]
+    if scheduler: sources += await run_in_threadpool(scheduler.metrics)
+    return Response(render(sources), media_type="text/plain; version=0.0.4")
+
+@app.post("/sessions/{session_id}/profile")
+async def start_profile(session_id: str, kind: str = "cpu", ticks: int = Query(100, ge=1), every: int = Query(1, ge=1)):
+    # Profiles the session's next `ticks` ticks (every `every`-th one): "cpu" = cProfile,
+    # "memory" = tracemalloc. Fetch the result from GET once it is done.
+    if not PROFILING: raise HTTPException(status_code=403, detail="Profiling is disabled (set SOLARIS_PROFILING=1)")
+    try:
+        if scheduler:
+            status = await run_in_threadpool(scheduler.start_capture, session_id, {"kind": kind, "ticks": ticks, "every": every})
+            if status is None: raise HTTPException(status_code=503, detail=f"Session {session_id} did not respond in time")
+        else:
+            status = sessions.start_capture(session_id, kind, ticks, every)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return status
+
+@app.get("/sessions/{session_id}/profile")
+async def get_profile(session_id: str, format: str = Query("raw", pattern="^(raw|text)$")):
+    # Capture status while running; the profile as a download once done
+    # (cpu: pstats file, or the top functions with format=text; memory: text)
+    if not PROFILING: raise HTTPException(status_code=403, detail="Profiling is disabled (set SOLARIS_PROFILING=1)")
+    try:
+        if scheduler:
+            result = await run_in_threadpool(scheduler.capture_result, session_id, format)
+            if result is None: raise HTTPException(status_code=503, detail=f"Session {session_id} did not respond in time")
+        else:
+            result = sessions.capture_result(session_id, format)
+            if result is None: raise LookupError(f"No profile capture for session {session_id}")
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    if "body" not in result: return result
+    headers = {"Content-Disposition": f'attachment; filename="{result["filename"]}"'}
+    return Response(result["body"], media_type=result["media_type"], headers=headers)
+
+@app.post("/simulate")
+def simulate(request: BatchSimulationRequest):
+    # Headless Monte Carlo replications (independent of any live session)
+    if request.replications * request.days > BATCH_LIMIT:
+        raise HTTPException(status_code=400, detail=f"replications x days is limited to {BATCH_LIMIT} over HTTP "
+                                                    "(SOLARIS_BATCH_LIMIT); run bigger studies with batch_runner.py")
+    return run_replications(request.replications, request.days, seed=request.seed, backend=request.backend,
+                            rng_backend=request.rng_backend)
 
 if __name__ == "__main__":
     import uvicorn
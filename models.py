@@ -1,7 +1,7 @@
 
 # models.py
-from pydantic import BaseModel
-from typing import Optional, Literal
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional, Literal
 from datetime import datetime
 
 class Encounter(BaseModel):
@@ -11,6 +11,7 @@ class Encounter(BaseModel):
     symptom: str
     assigned_ctas: int
     arrival_time: datetime
+    arrival_tick: int = 0 # Simulated minute of arrival (SimulationEngine.sim_minute)
     status: Literal["WAITING", "ROOMED", "WAITING_FOR_RESULTS", "ADMITTED_NO_BED", "LWBS", "DISCHARGED"] = "WAITING"
     resource_type: Literal["NONE", "BED", "CHAIR", "HALLWAY"] = "NONE"
     disposition: Optional[Literal["ADMIT", "DISCHARGE"]] = None
@@ -29,3 +30,51 @@ class Alert(BaseModel):
     severity: str
     timestamp: datetime
     explanation: str
+
+def trusted_model(model_cls, values: Dict, fields_set: Optional[set] = None):
+    # For values the engine produced itself (not a request): skip validation and
+    # model_construct's per-field default handling and fill the same four slots
+    # pydantic's own constructor does. `values` must hold every field.
+    model = object.__new__(model_cls)
+    object.__setattr__(model, "__dict__", values)
+    object.__setattr__(model, "__pydantic_fields_set__", set(values) if fields_set is None else fields_set)
+    object.__setattr__(model, "__pydantic_extra__", None)
+    object.__setattr__(model, "__pydantic_private__", None)
+    return model
+
+class BatchSimulationRequest(BaseModel):
+    replications: int = Field(10, ge=1, le=1000)
+    days: int = Field(1, ge=1, le=365) # replications x days is capped too (batch_runner.API_LIMIT)
+    seed: int = 0
+    backend: Literal["object", "columnar", "events"] = "events"
+    rng_backend: Literal["python", "numpy"] = "numpy"
+
+Shift = Literal["day_shift", "evening_shift", "night_shift"]
+
+class FacilityOverride(BaseModel):
+    physical_beds: Optional[int] = Field(None, ge=0)
+    surge_capacity: Optional[int] = Field(None, ge=0)
+    chair_capacity: Optional[int] = Field(None, ge=0)
+    md_count: Optional[Dict[Shift, int]] = None # Replaces the shift's MD count
+    extra_md: Optional[Dict[Shift, int]] = None # Added to it (negative = fewer)
+    arrival_multiplier: Optional[float] = Field(None, ge=0, le=10)
+    diverted: Optional[bool] = None # Pin diversion on / off; None = queue-depth rule
+
+class SurgeEvent(BaseModel):
+    # Arrival surge, e.g. a mass-casualty burst: rates x multiplier + extra_per_hour
+    duration_minutes: int = Field(..., ge=1, le=7 * 1440)
+    start_in_minutes: int = Field(0, ge=0) # From the session's current minute
+    facility_id: Optional[str] = None # None = every facility
+    multiplier: float = Field(1.0, ge=0, le=20)
+    extra_per_hour: float = Field(0.0, ge=0, le=600)
+    label: str = "surge"
+
+class ScenarioRequest(BaseModel):
+    hours: int = Field(8, ge=1, le=72)
+    replications: int = Field(20, ge=1, le=500)
+    seed: int = 0
+    budget_seconds: float = Field(2.0, gt=0, le=60)
+    diversion_factor: Optional[float] = Field(None, gt=0) # Diversion when queue > beds * factor (default 3)
+    regional: Optional[bool] = None # Route diverted arrivals to the nearest open ED (default: SOLARIS_REGIONAL)
+    facilities: Dict[str, FacilityOverride] = {}
+    surges: List[SurgeEvent] = []
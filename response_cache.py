@@ -0,0 +1,56 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+from pydantic import BaseModel
+from pydantic_core import to_json
+
+# Response Encoding
+# Read endpoints answer with pre-encoded JSON: orjson when it is installed,
+# else pydantic-core (always there with pydantic 2). Both give the same bytes as
+# FastAPI's default encoder for these payloads, at a fraction of the cost.
+# ResponseCache keeps the encoded bytes per session and state version, so N
+# clients polling one session between two ticks cost one encode.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def _default(obj):
+    # Models built with trusted_model() have their fields in __dict__ as well
+    if isinstance(obj, BaseModel): return obj.__dict__
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+def encode_json(obj: Any) -> bytes:
+    if orjson is not None: return orjson.dumps(obj, default=_default)
+    return to_json(obj)
+
+class ResponseCache:
+    # session_id -> (state version, {request key: bytes}), least recently used
+    # sessions dropped first. A new version replaces the session's whole entry.
+    def __init__(self, max_sessions: int = 1024, max_keys: int = 64):
+        self.max_sessions = max_sessions
+        self.max_keys = max_keys # Distinct requests (cursors, filters) kept per version
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[int, Dict[Hashable, bytes]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str, version: int, key: Hashable, build: Callable[[], Any]) -> bytes:
+        # Cached bytes, or encode build() (outside the lock; concurrent misses may both encode)
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None and entry[0] == version and key in entry[1]:
+                self._entries.move_to_end(session_id)
+                self.hits += 1
+                return entry[1][key]
+            self.misses += 1
+        body = encode_json(build())
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None or entry[0] != version:
+                entry = self._entries[session_id] = (version, {})
+            if len(entry[1]) < self.max_keys: entry[1][key] = body
+            self._entries.move_to_end(session_id)
+            while len(self._entries) > self.max_sessions: self._entries.popitem(last=False)
+        return body
@@ -0,0 +1,139 @@
+import copy
+import multiprocessing as mp
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from engine_registry import create_engine
+from facility_registry import REGISTRY, SHIFTS
+from sim_random import SimRandom
+
+# What-if Scenarios: M branched fast-forward replications of a live session's
+# snapshot under parameter overrides, run on a process pool shared by all
+# requests (SOLARIS_SCENARIO_WORKERS processes, default CPU count).
+SCENARIO_WORKERS = int(os.environ.get("SOLARIS_SCENARIO_WORKERS", "0")) or os.cpu_count() or 1
+SAMPLE_EVERY = 60 # Minutes between census / boarding / LWBS samples
+BANDS = (5, 50, 95) # Percentiles reported per sample
+METRICS = ("census", "boarding", "lwbs")
+
+def check_overrides(overrides: Dict):
+    # Fail in the API process, before anything is forked
+    for fid, override in overrides.get("facilities", {}).items():
+        if fid not in REGISTRY: raise ValueError(f"Unknown facility '{fid}'")
+        for shift in list(override.get("md_count") or {}) + list(override.get("extra_md") or {}):
+            if shift not in SHIFTS: raise ValueError(f"Unknown shift '{shift}'. Choose from: {', '.join(SHIFTS)}")
+    for surge in overrides.get("surges", []):
+        if surge.get("facility_id") is not None and surge["facility_id"] not in REGISTRY:
+            raise ValueError(f"Unknown facility '{surge['facility_id']}'")
+
+def apply_overrides(sim, overrides: Dict):
+    # overrides = ScenarioRequest fields: per-facility beds / surge / chairs,
+    # MD counts per shift (absolute or extra), arrival multiplier, pinned diversion,
+    # plus a global diversion queue factor, regional routing on / off and surge events
+    resources = copy.deepcopy(sim.resources)
+    multipliers, forced = {}, {}
+    for fid, override in overrides.get("facilities", {}).items():
+        res = resources[fid]
+        for key in ("physical_beds", "surge_capacity", "chair_capacity"):
+            if override.get(key) is not None: res[key] = override[key]
+        for shift, count in (override.get("md_count") or {}).items():
+            res["staffing"][shift]["md_count"] = count
+        for shift, extra in (override.get("extra_md") or {}).items():
+            res["staffing"][shift]["md_count"] = max(0, res["staffing"][shift]["md_count"] + extra)
+        if override.get("arrival_multiplier") is not None: multipliers[fid] = override["arrival_multiplier"]
+        if override.get("diverted") is not None: forced[fid] = override["diverted"]
+    sim.set_scenario(resources=resources, arrival_multipliers=multipliers,
+                     diversion_factor=overrides.get("diversion_factor"), forced_diversion=forced,
+                     regional=overrides.get("regional"))
+    for surge in overrides.get("surges", []): sim.add_surge(**surge)
+
+def run_branch(blob: bytes, backend: str, overrides: Dict, hours: int, seed: int,
+               deadline: Optional[float] = None) -> Optional[np.ndarray]:
+    # One replication (worker process): restore, reseed so branches diverge,
+    # apply the overrides, then sample every SAMPLE_EVERY minutes.
+    # Returns samples x metrics x facilities; LWBS counts from the branch point.
+    # None once `deadline` (time.time()) has passed: the request stopped waiting,
+    # so the worker gives up between samples instead of running to the end.
+    if deadline is not None and time.time() > deadline: return None
+    sim = create_engine(backend).restore(blob)
+    sim.rng = SimRandom(seed, backend=sim.rng.backend)
+    apply_overrides(sim, overrides)
+    lwbs_start = dict(sim.lwbs_by_facility)
+
+    samples = np.zeros((hours * 60 // SAMPLE_EVERY, len(METRICS), len(REGISTRY.ids)), dtype=np.int32)
+    for i in range(len(samples)):
+        if deadline is not None and time.time() > deadline: return None
+        sim.advance(SAMPLE_EVERY, is_fast_forward=True)
+        census = sim._facility_census()
+        boarding = sim._facility_boarding()
+        for j, fid in enumerate(REGISTRY.ids):
+            samples[i, :, j] = (census.get(fid, 0), boarding.get(fid, 0), sim.lwbs_by_facility[fid] - lwbs_start[fid])
+    return samples
+
+def _warm_up():
+    return os.getpid()
+
+class ScenarioRunner:
+    # Long-lived pool so a request pays for replications, not process start-up.
+    # Workers are spawned (the API process runs threads) and warmed at startup
+    # (broker mode: on first use, since every API worker has its own pool).
+    def __init__(self, workers: int = SCENARIO_WORKERS):
+        self.workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=mp.get_context("spawn"))
+                for _ in range(self.workers): self._pool.submit(_warm_up)
+        return self._pool
+
+    def stop(self):
+        with self._lock:
+            if self._pool is not None: self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def run(self, blob: bytes, backend: str, overrides: Dict, hours: int = 8, replications: int = 20,
+            seed: int = 0, budget_seconds: float = 2.0) -> Dict:
+        # Replication i is seeded seed + i. Whatever has finished when the budget
+        # runs out is summarized; the rest is cancelled: queued ones here, running
+        # ones by the shared deadline, so they free their worker within one sample.
+        start = time.perf_counter()
+        check_overrides(overrides)
+        pool = self.start()
+        deadline = time.time() + budget_seconds
+        try:
+            futures = [pool.submit(run_branch, blob, backend, overrides, hours, seed + i, deadline) for i in range(replications)]
+            done, not_done = wait(futures, timeout=max(0.0, budget_seconds - (time.perf_counter() - start)))
+            for future in not_done: future.cancel()
+            runs = [run for run in (f.result() for f in futures if f in done) if run is not None]
+        except BrokenProcessPool:
+            self.stop() # A worker died; the next request gets a fresh pool
+            raise
+        if not runs: raise TimeoutError(f"No replication finished within {budget_seconds}s")
+        return {
+            "hours": hours,
+            "sample_minutes": SAMPLE_EVERY,
+            "replications_requested": replications,
+            "replications_completed": len(runs),
+            "budget_exhausted": len(runs) < replications,
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+            "facilities": summarize_bands(runs),
+        }
+
+def summarize_bands(runs: List[np.ndarray]) -> Dict:
+    # Per facility and metric: one list per percentile, one value per sample
+    bands = np.percentile(np.stack(runs), BANDS, axis=0) # bands x samples x metrics x facilities
+    return {
+        fid: {
+            metric: {f"p{p}": [round(float(v), 1) for v in bands[b, :, m, j]] for b, p in enumerate(BANDS)}
+            for m, metric in enumerate(METRICS)
+        }
+        for j, fid in enumerate(REGISTRY.ids)
+    }
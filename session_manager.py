@@ -0,0 +1,326 @@
+import hashlib
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+from engine_sim import SimulationEngine
+from engine_registry import create_engine
+from sim_random import SimRandom
+from sim_snapshot import dumps, loads
+from sim_log import logger
+from sim_metrics import SESSION_TICK, ProfileCapture
+from vitals_snapshot import PublishedSession
+
+# Session Lifecycle (seconds of no API access)
+# Idle sessions stop ticking after SOLARIS_IDLE_PAUSE and are written to
+# SOLARIS_SESSION_DIR after SOLARIS_HIBERNATE_AFTER; at most SOLARIS_MAX_SESSIONS
+# stay in memory (least recently used are hibernated first, at the next tick).
+MAX_SESSIONS = int(os.environ.get("SOLARIS_MAX_SESSIONS", "100"))
+IDLE_PAUSE = float(os.environ.get("SOLARIS_IDLE_PAUSE", "300"))
+HIBERNATE_AFTER = float(os.environ.get("SOLARIS_HIBERNATE_AFTER", "1800"))
+SESSION_DIR = os.environ.get("SOLARIS_SESSION_DIR", "session_store")
+# Live sessions are also checkpointed there every SOLARIS_CHECKPOINT_INTERVAL
+# seconds (0 = off), so a restart resumes them instead of starting over
+CHECKPOINT_INTERVAL = float(os.environ.get("SOLARIS_CHECKPOINT_INTERVAL", "60"))
+# Reads are served from a PublishedSession the loop builds after a session's
+# tick. Sessions read within the last SOLARIS_PUBLISH_WINDOW seconds publish
+# every tick; for the others a read waits for the next loop iteration.
+PUBLISH_WINDOW = float(os.environ.get("SOLARIS_PUBLISH_WINDOW", "5"))
+
+class SessionRecord:
+    def __init__(self, sim: SimulationEngine):
+        self.sim = sim
+        self.last_access = time.monotonic()
+        self.ticks = 0
+        self.checkpointed_ticks = 0
+        self.tick_ms = 0.0 # Moving average cost of one tick() call
+        self.last_tick_ms = 0.0
+        self.published: Optional[PublishedSession] = None
+        self.read_at = -PUBLISH_WINDOW # Last read through published()
+
+class SessionManager:
+    def __init__(self, backend: str = "object", max_sessions: int = MAX_SESSIONS,
+                 idle_pause: float = IDLE_PAUSE, hibernate_after: float = HIBERNATE_AFTER,
+                 session_dir: str = SESSION_DIR, checkpoint_interval: float = CHECKPOINT_INTERVAL,
+                 log_prefix: str = "[SYSTEM]", publish_window: float = PUBLISH_WINDOW,
+                 on_hibernate: Optional[Callable[[str], None]] = None):
+        self.backend = backend
+        self.max_sessions = max_sessions
+        self.idle_pause = idle_pause
+        self.hibernate_after = hibernate_after
+        self.session_dir = session_dir
+        self.checkpoint_interval = checkpoint_interval
+        self.log_prefix = log_prefix
+        self.publish_window = publish_window
+        self.on_hibernate = on_hibernate # Called with the session id (shards tell the API)
+        self.sessions: "OrderedDict[str, SessionRecord]" = OrderedDict() # LRU first
+        self.hibernated: Dict[str, int] = {} # session_id -> snapshot bytes
+        self._last_checkpoint = time.monotonic()
+        self.captures: Dict[str, ProfileCapture] = {} # session_id -> latest profile capture
+        self._published = threading.Condition()
+        self._creating = threading.Lock()
+        # Request threads add and reorder sessions while the loop iterates and
+        # hibernates them: every change to `sessions` / `hibernated` holds _guard,
+        # and loops walk a copy (records())
+        self._guard = threading.Lock()
+
+        # Snapshots are taken on the ticking thread (a consistent copy in a few ms);
+        # compression and disk writes happen on one background writer thread.
+        # _pending holds the newest unwritten snapshot per session.
+        self._writer = ThreadPoolExecutor(max_workers=1)
+        self._pending: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, session_id):
+        return session_id in self.sessions
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def get(self, session_id: str) -> SimulationEngine:
+        # Touch (un-pauses), restoring from disk or creating as needed
+        record = self.sessions.get(session_id)
+        if record is None:
+            with self._creating: # Concurrent first reads must not create two engines
+                record = self.sessions.get(session_id)
+                if record is None:
+                    sim = self._restore(session_id)
+                    if sim is None:
+                        logger.info(f"{self.log_prefix} Creating new session: {session_id} ({self.backend} backend)")
+                        sim = create_engine(self.backend)
+                    record = self.adopt(session_id, sim)
+        else:
+            with self._guard:
+                if session_id in self.sessions: self.sessions.move_to_end(session_id)
+        record.last_access = time.monotonic()
+        return record.sim
+
+    def touch(self, session_id: str):
+        self.get(session_id)
+
+    def published(self, session_id: str, timeout: float = 5.0) -> Optional[PublishedSession]:
+        # Latest published state, safe to read from any thread while the loop ticks.
+        # A session nobody read lately is published at its next tick (None on timeout).
+        self.get(session_id)
+        record = self.sessions.get(session_id)
+        if record is None: return None # Hibernated meanwhile
+        now = time.monotonic()
+        recent = now - record.read_at < self.publish_window
+        record.read_at = now
+        if recent and record.published is not None: return record.published
+        seen = record.published
+        with self._published:
+            self._published.wait_for(lambda: record.published is not seen, timeout)
+        return record.published
+
+    def adopt(self, session_id: str, sim: SimulationEngine) -> SessionRecord:
+        record = SessionRecord(sim)
+        sim.event_log.session_id = session_id
+        with self._guard:
+            self.sessions[session_id] = record
+            self.hibernated.pop(session_id, None)
+        return record # Over the cap until the loop's next tick_all() hibernates the LRU
+
+    def fork(self, session_id: str, new_id: Optional[str] = None, seed: Optional[int] = None) -> Dict:
+        # Clone a session's exact state under a new id. Without a seed the branch
+        # replays the same random stream; with one it diverges from here on.
+        start = time.perf_counter()
+        new_id = new_id or f"{session_id}_fork_{uuid.uuid4().hex[:6]}"
+        if self.exists(new_id): raise ValueError(f"Session {new_id} already exists")
+        blob = self.get(session_id).snapshot(compress=False)
+        clone = create_engine(self.backend).restore(blob)
+        if seed is not None: clone.rng = SimRandom(seed, backend=clone.rng.backend)
+        self.adopt(new_id, clone)
+        logger.info(f"{self.log_prefix} Forked session {session_id} -> {new_id}")
+        return {
+            "session_id": new_id,
+            "forked_from": session_id,
+            "sim_minute": clone.sim_minute,
+            "snapshot_bytes": len(blob),
+            "fork_ms": round((time.perf_counter() - start) * 1000, 2),
+        }
+
+    def exists(self, session_id: str) -> bool:
+        # Live, hibernated, or saved by an earlier run (a fork must not overwrite its checkpoint)
+        if session_id in self.sessions or session_id in self.hibernated: return True
+        with self._lock:
+            if session_id in self._pending: return True
+        return os.path.exists(self._path(session_id))
+
+    def tick_all(self, ticks: int = 1):
+        # One loop iteration: `ticks` owed ticks for every non-idle session
+        # (a backlog runs silently as one batch), then idle housekeeping.
+        # Hibernation only happens here, on the ticking thread, never in a request.
+        self._enforce_cap()
+        now = time.monotonic()
+        for session_id, record in self.records():
+            idle = now - record.last_access
+            if idle >= self.hibernate_after:
+                self.hibernate(session_id)
+                continue
+            if idle >= self.idle_pause or not ticks: continue
+            start = time.perf_counter()
+            capture = self.captures.get(session_id)
+            try:
+                if capture is None or capture.done: self._turn(record.sim, ticks)
+                else: capture.run(lambda: self._turn(record.sim, ticks))
+            except Exception as e:
+                logger.exception(f"{self.log_prefix} Error in session {session_id}: {e}")
+            if now - record.read_at < self.publish_window: self._publish(record)
+            elapsed = (time.perf_counter() - start) / ticks
+            SESSION_TICK.observe(elapsed, self.backend)
+            record.last_tick_ms = elapsed * 1000
+            record.tick_ms = record.last_tick_ms if not record.ticks else 0.9 * record.tick_ms + 0.1 * record.last_tick_ms
+            record.ticks += ticks
+        if self.checkpoint_interval and now - self._last_checkpoint >= self.checkpoint_interval:
+            self.checkpoint()
+
+    def _publish(self, record: SessionRecord):
+        try:
+            record.published = record.sim.publish(record.published)
+        except Exception as e:
+            logger.exception(f"{self.log_prefix} Could not publish session state: {e}")
+        with self._published: self._published.notify_all()
+
+    @staticmethod
+    def _turn(sim: SimulationEngine, ticks: int):
+        if ticks > 1: sim.advance(ticks - 1, is_fast_forward=True)
+        sim.tick()
+
+    def start_capture(self, session_id: str, kind: str, ticks: int, every: int = 1) -> Dict:
+        # Profiles the session's next loop turns (replaces any earlier capture)
+        capture = ProfileCapture(session_id, kind, ticks, every)
+        self.touch(session_id)
+        self.captures[session_id] = capture
+        logger.info(f"{self.log_prefix} Profiling session {session_id}: {kind}, {ticks} ticks every {every}")
+        return capture.status()
+
+    def capture_result(self, session_id: str, format: str = "raw") -> Optional[Dict]:
+        # Status while running; status plus the download (body, media_type, filename) once done
+        capture = self.captures.get(session_id)
+        if capture is None: return None
+        result = capture.status()
+        if capture.done and not capture.error:
+            result["body"], result["media_type"], result["filename"] = capture.result(format)
+        return result
+
+    def checkpoint(self):
+        # Queue a snapshot of every session that ticked since its last checkpoint
+        self._last_checkpoint = time.monotonic()
+        for session_id, record in self.records():
+            if record.ticks == record.checkpointed_ticks: continue
+            self._save(session_id, record.sim)
+            record.checkpointed_ticks = record.ticks
+
+    def close(self):
+        # Final checkpoint, then wait for the writer
+        self.checkpoint()
+        self._writer.shutdown(wait=True)
+
+    def active_ids(self):
+        # Sessions that are still ticking (not paused)
+        now = time.monotonic()
+        return [sid for sid, r in self.records() if now - r.last_access < self.idle_pause]
+
+    def records(self):
+        # (session_id, record) pairs, safe to iterate while requests add sessions
+        with self._guard: return list(self.sessions.items())
+
+    def hibernate(self, session_id: str):
+        # Snapshot into _pending before the pop (the loop is not ticking meanwhile):
+        # a read that misses the session from then on restores exactly this state
+        record = self.sessions.get(session_id)
+        if record is None: return # Already gone
+        size = self._save(session_id, record.sim)
+        with self._guard:
+            self.sessions.pop(session_id, None)
+            self.hibernated[session_id] = size
+        logger.info(f"{self.log_prefix} Hibernated idle session {session_id} ({size // 1024} KB)")
+        if self.on_hibernate is not None: self.on_hibernate(session_id)
+
+    def stats(self, state_size: bool = False) -> Dict:
+        now = time.monotonic()
+        per_session = {}
+        records = self.records()
+        for session_id, record in records:
+            idle = now - record.last_access
+            entry = {
+                "state": "paused" if idle >= self.idle_pause else "active",
+                "idle_s": round(idle, 1),
+                "ticks": record.ticks,
+                "sim_minute": record.sim.sim_minute,
+                "patients": record.sim._active_count(),
+                "tick_ms": round(record.tick_ms, 3),
+                "last_tick_ms": round(record.last_tick_ms, 3),
+            }
+            # Snapshot size is the closest cheap proxy for a session's memory; opt-in (O(state)).
+            # Call from the ticking thread (between ticks) when state_size is set
+            if state_size: entry["state_bytes"] = len(record.sim.snapshot(compress=False))
+            per_session[session_id] = entry
+        with self._guard: hibernated = list(self.hibernated.items())
+        for session_id, size in hibernated:
+            per_session[session_id] = {"state": "hibernated", "state_bytes": size}
+        return {
+            "live": len(records),
+            "paused": sum(1 for s in per_session.values() if s["state"] == "paused"),
+            "hibernated": len(hibernated),
+            "max_sessions": self.max_sessions,
+            "tick_ms_total": round(sum(r.tick_ms for _, r in records), 3),
+            "sessions": per_session,
+        }
+
+    def _enforce_cap(self):
+        while True:
+            with self._guard:
+                if len(self.sessions) <= self.max_sessions: return
+                session_id = next(iter(self.sessions))
+            self.hibernate(session_id)
+
+    def _path(self, session_id: str) -> str:
+        # Session ids come straight from query strings; never use them as file names
+        return os.path.join(self.session_dir, hashlib.sha256(session_id.encode()).hexdigest()[:32] + ".session")
+
+    def _save(self, session_id: str, sim: SimulationEngine) -> int:
+        blob = sim.snapshot(compress=False)
+        with self._lock:
+            queued = session_id in self._pending
+            self._pending[session_id] = blob
+        if not queued: self._writer.submit(self._flush, session_id)
+        return len(blob)
+
+    def _flush(self, session_id: str):
+        # Writer thread: compress and atomically replace the session's file
+        with self._lock: blob = self._pending[session_id]
+        try:
+            os.makedirs(self.session_dir, exist_ok=True)
+            path = self._path(session_id)
+            with open(path + ".tmp", "wb") as f: f.write(dumps({"session_id": session_id, "engine": blob}))
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            logger.error(f"{self.log_prefix} Could not write session {session_id}: {e}")
+        with self._lock:
+            if self._pending[session_id] is blob:
+                del self._pending[session_id]
+                return
+        self._writer.submit(self._flush, session_id) # A newer snapshot came in meanwhile
+
+    def _restore(self, session_id: str) -> Optional[SimulationEngine]:
+        with self._lock: blob = self._pending.get(session_id)
+        if blob is None:
+            path = self._path(session_id)
+            if not os.path.exists(path): return None
+            with open(path, "rb") as f: stored = loads(f.read())
+            if stored["session_id"] != session_id: return None
+            blob = stored["engine"]
+        try:
+            sim = create_engine(self.backend).restore(blob)
+        except ValueError as e: # e.g. saved by a different engine backend
+            logger.warning(f"{self.log_prefix} Ignoring saved state for session {session_id}: {e}")
+            return None
+        with self._guard: self.hibernated.pop(session_id, None)
+        logger.info(f"{self.log_prefix} Restored session {session_id}")
+        return sim
@@ -0,0 +1,402 @@
+import multiprocessing as mp
+import queue
+import threading
+import time
+import uuid
+import zlib
+from typing import Any, Callable, Dict, List, Optional
+
+from engine_registry import create_engine
+from session_manager import SessionManager
+from sim_random import SimRandom
+from sim_clock import TickClock
+from vitals_snapshot import PublishedSession, VitalsSnapshot
+from alert_store import AlertStore
+from models import Alert
+from sim_log import EventLog, logger, setup_logging
+from sim_metrics import export_metrics, record_loop
+
+TOUCH_INTERVAL = 1.0 # Seconds between keep-alive touches per session
+WATCH_INTERVAL = 1.0 # Seconds between shard liveness checks
+
+# ---------------------------------------------------------
+# Shard Worker (runs in its own process)
+# ---------------------------------------------------------
+def _session_payload(sim, alerts_sent: Optional[int], events_sent: int):
+    # What the API process needs to answer /status, /alerts, /events and /facilities.
+    # The first publish of a session (alerts_sent None) carries its whole alert
+    # store and its event log's total, so the API's copy starts with the right
+    # totals and counters.
+    payload = {
+        "vitals": sim._get_vitals(),
+        "facility_census": sim._facility_census(),
+        "new_events": sim.event_log.since(events_sent),
+    }
+    if alerts_sent is None:
+        payload["alerts"] = sim.alerts.get_state()
+        payload["events"] = sim.event_log.get_state()
+    else: payload["new_alerts"] = [a.model_dump() for a in sim.alerts.since(alerts_sent)]
+    return payload
+
+REPLY_COMMANDS = ("export", "surge", "profile", "profile_result", "adopt") # Last item is the reply token
+
+def _reply_error(e: Exception) -> Exception:
+    # Caller errors keep their type (the API maps them to 4xx); anything else is
+    # flattened so the reply always pickles
+    if isinstance(e, (ValueError, LookupError)) and type(e).__module__ == "builtins": return e
+    return RuntimeError(f"{type(e).__name__}: {e}")
+
+def _shard_main(shard_id, commands, published, backend, tick_interval, publish_every):
+    setup_logging()
+    alerts_sent = {} # session_id -> alert seq published up to
+    events_sent = {} # session_id -> event seq published up to
+
+    def evicted(session_id):
+        # Hibernated (idle, or over the cap): the API drops its copy until the next touch
+        alerts_sent.pop(session_id, None)
+        events_sent.pop(session_id, None)
+        published.put(("evicted", session_id, None))
+
+    sessions = SessionManager(backend, log_prefix=f"[SHARD {shard_id}]", on_hibernate=evicted)
+    ticks = 0
+    overruns = 0
+    worst_tick = 0.0
+    clock = TickClock(tick_seconds=tick_interval)
+
+    def publish(session_id):
+        sim = sessions.sessions[session_id].sim
+        published.put(("session", session_id, _session_payload(sim, alerts_sent.get(session_id), events_sent.get(session_id, 0))))
+        alerts_sent[session_id] = sim.alerts.total
+        events_sent[session_id] = sim.event_log.total
+
+    while True:
+        # 1. Commands (block until the next tick is due)
+        timeout = clock.sleep_time()
+        try:
+            command = commands.get(timeout=timeout)
+        except queue.Empty:
+            command = None
+        if command is not None:
+            if command[0] == "stop":
+                sessions.close() # Final checkpoint
+                return
+            try:
+                if command[0] == "export": # Snapshot for a fork or what-if run (may continue in another process)
+                    _, session_id, token = command
+                    published.put(("export", token, sessions.get(session_id).snapshot(compress=False)))
+                if command[0] == "surge":
+                    _, session_id, surge, token = command
+                    published.put(("reply", token, sessions.get(session_id).add_surge(**surge)))
+                if command[0] == "profile": # Start a capture
+                    _, session_id, options, token = command
+                    try:
+                        published.put(("reply", token, sessions.start_capture(session_id, **options)))
+                    except ValueError as e: # Bad options: the caller's error, nothing to log
+                        published.put(("reply", token, e))
+                if command[0] == "profile_result":
+                    _, session_id, format, token = command
+                    result = sessions.capture_result(session_id, format)
+                    published.put(("reply", token, result if result is not None else LookupError(f"No profile capture for session {session_id}")))
+                if command[0] == "adopt":
+                    _, session_id, blob, seed, token = command
+                    if sessions.exists(session_id): raise ValueError(f"Session {session_id} already exists")
+                    clone = create_engine(backend).restore(blob)
+                    if seed is not None: clone.rng = SimRandom(seed, backend=clone.rng.backend)
+                    sessions.adopt(session_id, clone)
+                    logger.info(f"[SHARD {shard_id}] Adopted forked session {session_id}")
+                    alerts_sent.pop(session_id, None)
+                    events_sent[session_id] = 0
+                    publish(session_id)
+                    published.put(("reply", token, True))
+                if command[0] == "touch":
+                    session_id = command[1]
+                    is_new = session_id not in sessions
+                    sessions.touch(session_id) # Creates, restores from disk or un-pauses
+                    if is_new:
+                        alerts_sent.pop(session_id, None)
+                        events_sent[session_id] = 0 # Saved state keeps the event total, not the ring
+                        publish(session_id) # First snapshot right away so the API is not kept waiting
+            except Exception as e: # One bad command must not take the shard and its sessions down
+                logger.exception(f"[SHARD {shard_id}] {command[0]} failed: {e}")
+                if command[0] in REPLY_COMMANDS: published.put(("reply", command[-1], _reply_error(e)))
+            continue
+        due = clock.due()
+        if not due: continue
+
+        # 2. Tick every non-idle session in this shard (a backlog runs as one batch)
+        start = time.monotonic()
+        sessions.tick_all(due)
+        published_before = ticks // publish_every
+        ticks += due
+
+        # 3. Publish snapshots + shard health (about once per publish_every ticks)
+        publish_now = ticks // publish_every > published_before
+        if publish_now:
+            for session_id in sessions.active_ids(): publish(session_id)
+
+        elapsed = time.monotonic() - start
+        record_loop(clock, elapsed)
+        worst_tick = max(worst_tick, elapsed)
+        if elapsed > tick_interval: overruns += 1
+        if publish_now:
+            published.put(("shard", shard_id, {
+                "sessions": len(sessions),
+                "ticks": ticks,
+                "overruns": overruns,
+                "last_tick_ms": round(elapsed * 1000, 2),
+                "worst_tick_ms": round(worst_tick * 1000, 2),
+                "lag_ms": round(clock.lag() * 1000, 2),
+                "dropped_ticks": clock.dropped_ticks,
+                "session_stats": sessions.stats(),
+                "metrics": export_metrics(sessions),
+            }))
+
+class SessionReplica:
+    # One session as seen outside its shard: alert, event and board history rebuilt
+    # from the shard's publishes, plus the PublishedSession readers get. Replicas fed
+    # the same publishes from the same sync_state() give the same board versions, so
+    # a client's since_version means the same thing on every API worker (sim_broker).
+    def __init__(self, session_id: str):
+        self.alerts = AlertStore()
+        self.events = EventLog(session_id, mode="memory")
+        self.board = VitalsSnapshot()
+        self.published: Optional[PublishedSession] = None
+
+    def apply(self, payload: Dict):
+        # One shard publish (left untouched: the broker relays it as is)
+        vitals = {k: v for k, v in payload["vitals"].items() if k != "patients"}
+        # Re-version the board here so deltas line up with what this process served
+        self.board.update({p["id"]: p for p in payload["vitals"]["patients"]})
+        vitals["version"] = self.board.version
+        if "alerts" in payload: # Whole store: the shard (re)created the session
+            self.alerts = AlertStore.from_state(payload["alerts"])
+            self.events.set_state(payload["events"])
+        for alert in payload.get("new_alerts", ()): self.alerts.append(Alert(**alert))
+        self.events.extend(payload["new_events"])
+        self._publish(vitals, payload["facility_census"], new_store="alerts" in payload)
+
+    def _publish(self, vitals: Dict, facility_census: Dict[str, int], new_store: bool = False):
+        previous = self.published
+        self.published = PublishedSession(vitals, self.board.frozen(), facility_census,
+                                          self.alerts.view(previous.alerts if previous and not new_store else None),
+                                          self.events.view(previous.events if previous and not new_store else None))
+
+    def sync_state(self) -> Dict:
+        return {
+            "vitals": self.published.vitals,
+            "board": self.board.frozen(), # Version maps included, so deltas match from any version
+            "facility_census": self.published.facility_census,
+            "alerts": self.alerts.get_state(),
+            "events": (self.events.since(0), self.events.total),
+        }
+
+    @classmethod
+    def from_sync(cls, session_id: str, state: Dict) -> "SessionReplica":
+        replica = cls(session_id)
+        replica.board = state["board"] # An unpickled copy, this replica's own
+        replica.alerts = AlertStore.from_state(state["alerts"])
+        records, total = state["events"]
+        replica.events.extend(records)
+        replica.events.total = total
+        replica._publish(state["vitals"], state["facility_census"])
+        return replica
+
+# ---------------------------------------------------------
+# Scheduler (API process side)
+# ---------------------------------------------------------
+class ShardedSessionScheduler:
+    # Spreads sessions across worker processes. Each shard owns its sessions,
+    # ticks them on its own clock and publishes vitals snapshots back here, so
+    # the API event loop never runs a tick.
+    def __init__(self, num_shards: int, backend: str = "object", tick_interval: float = 0.1, publish_every: int = 10):
+        self.num_shards = num_shards
+        self.backend = backend
+        self.tick_interval = tick_interval
+        self.publish_every = publish_every
+        self._ctx = mp.get_context("spawn")
+        self._commands = []
+        self._processes = []
+        self._published = self._ctx.Queue()
+        self._sessions: Dict[str, SessionReplica] = {}
+        self._listeners: List[Callable[[str, Optional[str], Dict], None]] = [] # Broker connections (sim_broker)
+        self._shard_stats: Dict[int, Dict] = {}
+        self._last_touch: Dict[str, float] = {} # session_id -> last touch sent to its shard
+        self._exports: Dict[str, Any] = {} # request token -> exported snapshot / command reply
+        self._waiting = set() # Tokens of requests still waiting (late replies are dropped)
+        self._cond = threading.Condition()
+        self._collector = None
+        self._stopping = threading.Event()
+
+    def start(self):
+        self._commands = [None] * self.num_shards
+        self._processes = [None] * self.num_shards
+        for shard_id in range(self.num_shards): self._start_shard(shard_id)
+        self._collector = threading.Thread(target=self._collect, daemon=True)
+        self._collector.start()
+        threading.Thread(target=self._watch, daemon=True).start()
+        logger.info(f"[SYSTEM] Started {self.num_shards} simulation shards ({self.backend} backend)")
+
+    def _start_shard(self, shard_id: int):
+        commands = self._ctx.Queue()
+        process = self._ctx.Process(
+            target=_shard_main,
+            args=(shard_id, commands, self._published, self.backend, self.tick_interval, self.publish_every),
+            daemon=True,
+        )
+        process.start()
+        self._commands[shard_id] = commands
+        self._processes[shard_id] = process
+
+    def _watch(self):
+        # Restarts a shard that died. Its sessions resume from their last checkpoint
+        # on the next request; until then they are dropped here.
+        while not self._stopping.wait(WATCH_INTERVAL):
+            for shard_id, process in enumerate(self._processes):
+                if process.is_alive() or self._stopping.is_set(): continue
+                logger.error(f"[SYSTEM] Shard {shard_id} died (exit code {process.exitcode}), restarting it")
+                with self._cond:
+                    for session_id in [sid for sid in self._sessions if self.shard_for(sid) == shard_id]: self._evict(session_id)
+                    self._last_touch = {sid: t for sid, t in self._last_touch.items() if self.shard_for(sid) != shard_id}
+                    self._cond.notify_all()
+                self._start_shard(shard_id)
+
+    def stop(self):
+        self._stopping.set()
+        for commands in self._commands: commands.put(("stop",))
+        for process in self._processes: process.join(timeout=10) # Shards write a final checkpoint
+        self._published.put(("stop", None, None))
+
+    def shard_for(self, session_id: str) -> int:
+        # Stable across processes (unlike hash())
+        return zlib.crc32(session_id.encode()) % self.num_shards
+
+    def ensure_session(self, session_id: str):
+        # Tells the owning shard the session is in use (creating / waking it),
+        # at most once a second per session
+        now = time.monotonic()
+        with self._cond:
+            if now - self._last_touch.get(session_id, -TOUCH_INTERVAL) < TOUCH_INTERVAL: return
+            self._last_touch[session_id] = now
+        self._commands[self.shard_for(session_id)].put(("touch", session_id))
+
+    def get_snapshot(self, session_id: str, timeout: float = 5.0) -> Optional[SessionReplica]:
+        self.ensure_session(session_id)
+        with self._cond:
+            self._cond.wait_for(lambda: session_id in self._sessions, timeout=timeout)
+            return self._sessions.get(session_id)
+
+    def published(self, session_id: str, timeout: float = 5.0) -> Optional[PublishedSession]:
+        # The session's latest PublishedSession (None if it has not published yet);
+        # readers use it without the lock
+        snapshot = self.get_snapshot(session_id, timeout)
+        return None if snapshot is None else snapshot.published
+
+    def export(self, session_id: str, timeout: float = 5.0) -> Optional[bytes]:
+        # Engine snapshot straight from the owning shard (None on timeout)
+        return self._request(session_id, ("export", session_id), timeout)
+
+    def add_surge(self, session_id: str, surge: Dict, timeout: float = 5.0) -> Optional[Dict]:
+        # Scheduled by the owning shard; returns the surge with absolute sim minutes (None on timeout)
+        return self._request(session_id, ("surge", session_id, surge), timeout)
+
+    def _request(self, session_id: str, command: tuple, timeout: float) -> Any:
+        # Sends `command` + a reply token to the owning shard and waits for the reply
+        # (raises what the shard sent back as an exception; None on timeout)
+        token = uuid.uuid4().hex
+        with self._cond: self._waiting.add(token)
+        self._commands[self.shard_for(session_id)].put(command + (token,))
+        with self._cond:
+            received = self._cond.wait_for(lambda: token in self._exports, timeout=timeout)
+            self._waiting.discard(token)
+            if not received: return None
+            reply = self._exports.pop(token)
+        if isinstance(reply, Exception): raise reply
+        return reply
+
+    def start_capture(self, session_id: str, options: Dict, timeout: float = 5.0) -> Optional[Dict]:
+        return self._request(session_id, ("profile", session_id, options), timeout)
+
+    def capture_result(self, session_id: str, format: str = "raw", timeout: float = 30.0) -> Optional[Dict]:
+        return self._request(session_id, ("profile_result", session_id, format), timeout)
+
+    def metrics(self) -> list:
+        # (labels, metric families) per shard, as of its last report
+        with self._cond:
+            return [({"shard": str(k)}, s["metrics"]) for k, s in sorted(self._shard_stats.items()) if "metrics" in s]
+
+    def fork(self, session_id: str, new_id: Optional[str] = None, seed: Optional[int] = None, timeout: float = 5.0) -> Optional[Dict]:
+        # Source shard exports a snapshot, the new id's shard adopts it
+        start = time.perf_counter()
+        new_id = new_id or f"{session_id}_fork_{uuid.uuid4().hex[:6]}"
+        with self._cond:
+            if new_id in self._sessions: raise ValueError(f"Session {new_id} already exists")
+        blob = self.export(session_id, timeout)
+        if blob is None: return None
+        with self._cond: self._last_touch[new_id] = time.monotonic()
+        if self._request(new_id, ("adopt", new_id, blob, seed), timeout) is None: return None
+        if self.get_snapshot(new_id, timeout=timeout) is None: return None
+        return {
+            "session_id": new_id,
+            "forked_from": session_id,
+            "snapshot_bytes": len(blob),
+            "fork_ms": round((time.perf_counter() - start) * 1000, 2),
+        }
+
+    def session_stats(self) -> Dict:
+        # SessionManager.stats() of every shard, merged (as of each shard's last report)
+        with self._cond:
+            shard_stats = [s["session_stats"] for s in self._shard_stats.values() if "session_stats" in s]
+        merged = {"live": 0, "paused": 0, "hibernated": 0, "tick_ms_total": 0.0, "sessions": {}}
+        for stats in shard_stats:
+            for key in ("live", "paused", "hibernated", "tick_ms_total"): merged[key] += stats[key]
+            merged["sessions"].update(stats["sessions"])
+        return merged
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return {
+                "shards": self.num_shards,
+                "alive": sum(1 for p in self._processes if p.is_alive()),
+                "tick_interval_ms": self.tick_interval * 1000,
+                "per_shard": {shard_id: {k: v for k, v in s.items() if k not in ("session_stats", "metrics")} for shard_id, s in sorted(self._shard_stats.items())},
+            }
+
+    def subscribe(self, listener: Callable[[str, Optional[str], Dict], None]):
+        # listener("sync", None, {session_id: state}) right away, with the state of
+        # every session to start from (see SessionReplica.from_sync), then
+        # listener("session", session_id, payload) for every shard publish and
+        # listener("evicted", session_id, None) when a shard hibernates one. Called on
+        # the collector thread, under the lock, so it must not block.
+        with self._cond:
+            listener("sync", None, {session_id: replica.sync_state() for session_id, replica in self._sessions.items()})
+            self._listeners.append(listener)
+
+    def unsubscribe(self, listener: Callable[[str, Optional[str], Dict], None]):
+        with self._cond:
+            if listener in self._listeners: self._listeners.remove(listener)
+
+    def _evict(self, session_id: str):
+        # Under the lock. The next request touches (restores) the session right away.
+        self._sessions.pop(session_id, None)
+        self._last_touch.pop(session_id, None)
+        for listener in self._listeners: listener("evicted", session_id, None)
+
+    def _collect(self):
+        while True:
+            kind, key, payload = self._published.get()
+            if kind == "stop": return
+            with self._cond:
+                if kind == "session":
+                    replica = self._sessions.get(key)
+                    if replica is None: replica = self._sessions[key] = SessionReplica(key)
+                    replica.apply(payload)
+                    for listener in self._listeners: listener("session", key, payload)
+                elif kind == "evicted":
+                    self._evict(key)
+                elif kind in ("export", "reply"):
+                    if key in self._waiting: self._exports[key] = payload
+                elif kind == "shard":
+                    if payload["overruns"] > self._shard_stats.get(key, {}).get("overruns", 0):
+                        logger.warning(f"[SYSTEM] Shard {key} tick overrun: {payload['last_tick_ms']}ms > {self.tick_interval * 1000:.0f}ms budget")
+                    self._shard_stats[key] = payload
+                self._cond.notify_all()
@@ -0,0 +1,250 @@
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import Client, Listener
+from typing import Any, Dict, Optional
+
+from session_scheduler import TOUCH_INTERVAL, SessionReplica, ShardedSessionScheduler
+from sim_log import logger, setup_logging
+from vitals_snapshot import PublishedSession
+
+# Simulation Broker
+# Multi-worker deployments (uvicorn --workers N). One owner process,
+# `python3 sim_broker.py`, runs the simulation shards and is the only thing that
+# ticks. API workers started with SOLARIS_BROKER=<socket path> connect to it over
+# a Unix socket: each worker is sent every session's state once, then every shard
+# publish as it arrives, and keeps its own SessionReplica per session, so reads are
+# answered from the worker's memory and read throughput grows with workers.
+# Commands (touch, fork, surge, export, profiles, stats) are forwarded to the owner.
+# Messages are pickled: the socket is created owner-only (0600); set
+# SOLARIS_BROKER_KEY on both sides to also require a shared key.
+BROKER_SOCKET = os.environ.get("SOLARIS_BROKER", "")
+BROKER_KEY = os.environ.get("SOLARIS_BROKER_KEY", "").encode() or None
+CONNECT_TIMEOUT = 30.0 # Seconds a worker waits for the owner at startup
+RECONNECT_DELAY = 1.0
+
+# Scheduler methods a worker may call on the owner
+CALLS = ("ensure_session", "export", "add_surge", "fork", "start_capture", "capture_result",
+         "session_stats", "stats", "metrics")
+
+# ---------------------------------------------------------
+# Owner (the simulation process)
+# ---------------------------------------------------------
+class BrokerServer:
+    def __init__(self, path: str, scheduler: ShardedSessionScheduler, authkey: Optional[bytes] = BROKER_KEY):
+        self.path = path
+        self.scheduler = scheduler
+        self.authkey = authkey
+        self._calls = ThreadPoolExecutor(max_workers=16, thread_name_prefix="broker-call") # Forks / exports block for up to seconds
+        self._listener = None
+
+    def serve_forever(self):
+        if os.path.exists(self.path): os.unlink(self.path) # Left over from a previous run
+        umask = os.umask(0o177)
+        try:
+            self._listener = Listener(self.path, family="AF_UNIX", authkey=self.authkey)
+        finally:
+            os.umask(umask)
+        logger.info(f"[BROKER] Serving {self.scheduler.num_shards} shards on {self.path}")
+        while True:
+            try:
+                conn = self._listener.accept()
+            except OSError as e: # Includes a failed key check
+                logger.warning(f"[BROKER] Rejected connection: {e}")
+                continue
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def close(self):
+        if self._listener is not None: self._listener.close()
+        if os.path.exists(self.path): os.unlink(self.path)
+
+    def _serve(self, conn):
+        # One API worker: a sender thread drains `outbox` so the collector never
+        # waits on a slow socket; this thread reads the worker's calls
+        outbox = queue.SimpleQueue()
+        listener = lambda kind, session_id, payload: outbox.put((kind, session_id, payload))
+        threading.Thread(target=self._send, args=(conn, outbox), daemon=True).start()
+        self.scheduler.subscribe(listener) # Queues the sync, then every publish after it
+        logger.info("[BROKER] API worker connected")
+        try:
+            while True:
+                _, token, name, args = conn.recv()
+                if name == "ensure_session":
+                    self.scheduler.ensure_session(*args) # Never blocks
+                elif name in CALLS:
+                    self._calls.submit(self._call, outbox, token, name, args)
+                else:
+                    outbox.put(("reply", token, ValueError(f"Unknown broker call '{name}'")))
+        except (EOFError, OSError):
+            logger.info("[BROKER] API worker disconnected")
+        finally:
+            self.scheduler.unsubscribe(listener)
+            outbox.put(None)
+
+    def _call(self, outbox, token, name, args):
+        try:
+            result = getattr(self.scheduler, name)(*args)
+        except Exception as e:
+            result = e
+        outbox.put(("reply", token, result))
+
+    @staticmethod
+    def _send(conn, outbox):
+        while True:
+            message = outbox.get()
+            if message is None: break
+            try:
+                conn.send(message)
+            except (OSError, ValueError):
+                break
+        conn.close()
+
+def run_owner(path: str = BROKER_SOCKET):
+    setup_logging()
+    if not path: raise SystemExit("Set SOLARIS_BROKER to the socket path, e.g. SOLARIS_BROKER=/tmp/solaris.sock")
+    shards = int(os.environ.get("SOLARIS_SHARDS", "0")) or os.cpu_count() or 1 # 0 here means one per core
+    scheduler = ShardedSessionScheduler(shards, backend=os.environ.get("SOLARIS_ENGINE", "object"))
+    scheduler.start()
+    server = BrokerServer(path, scheduler)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0)) # Stop the shards (final checkpoint) on docker stop too
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        scheduler.stop()
+
+# ---------------------------------------------------------
+# Client (API worker side)
+# ---------------------------------------------------------
+class BrokerClient:
+    # Stands in for ShardedSessionScheduler in an API worker: same methods, but
+    # the sessions live in the owner process
+    def __init__(self, path: str = BROKER_SOCKET, authkey: Optional[bytes] = BROKER_KEY):
+        self.path = path
+        self.authkey = authkey
+        self._conn = None
+        self._send_lock = threading.Lock()
+        self._sessions: Dict[str, SessionReplica] = {}
+        self._last_touch: Dict[str, float] = {}
+        self._replies: Dict[str, Any] = {}
+        self._waiting = set() # Tokens of calls still waiting (late replies are dropped)
+        self._cond = threading.Condition()
+        self._stopped = False
+
+    def start(self):
+        self._connect(CONNECT_TIMEOUT)
+        threading.Thread(target=self._receive, daemon=True).start()
+
+    def stop(self):
+        self._stopped = True
+        with self._send_lock:
+            if self._conn is not None: self._conn.close()
+
+    def _connect(self, timeout: float):
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                conn = Client(self.path, family="AF_UNIX", authkey=self.authkey)
+                break
+            except OSError: # Not up yet, or shutting down
+                if time.monotonic() > deadline: raise RuntimeError(f"No simulation broker at {self.path} (start it with `python3 sim_broker.py`)")
+                time.sleep(RECONNECT_DELAY)
+        with self._send_lock: self._conn = conn
+        logger.info(f"[SYSTEM] Connected to simulation broker at {self.path}")
+
+    def _receive(self):
+        while not self._stopped:
+            try:
+                kind, key, payload = self._conn.recv()
+            except (EOFError, OSError):
+                if self._stopped: return
+                logger.error(f"[SYSTEM] Lost the simulation broker at {self.path}, reconnecting")
+                with self._cond: self._last_touch.clear() # Re-touch in-use sessions right away
+                self._connect(float("inf"))
+                continue
+            with self._cond:
+                if kind == "session":
+                    replica = self._sessions.get(key)
+                    if replica is None: replica = self._sessions[key] = SessionReplica(key)
+                    replica.apply(payload)
+                elif kind == "sync": # First message on every connection
+                    self._sessions = {session_id: SessionReplica.from_sync(session_id, state) for session_id, state in payload.items()}
+                elif kind == "evicted": # Hibernated by its shard
+                    self._sessions.pop(key, None)
+                    self._last_touch.pop(key, None)
+                elif kind == "reply":
+                    if key in self._waiting: self._replies[key] = payload
+                self._cond.notify_all()
+
+    def _send(self, token: Optional[str], name: str, args: tuple):
+        with self._send_lock:
+            try:
+                self._conn.send(("call", token, name, args))
+            except (OSError, ValueError):
+                pass # Receiver reconnects; the caller times out
+
+    def _call(self, name: str, *args, timeout: float = 5.0) -> Any:
+        # None on timeout; exceptions raised by the owner are raised here
+        token = uuid.uuid4().hex
+        with self._cond: self._waiting.add(token)
+        self._send(token, name, args)
+        with self._cond:
+            received = self._cond.wait_for(lambda: token in self._replies, timeout=timeout)
+            self._waiting.discard(token)
+            if not received: return None
+            reply = self._replies.pop(token)
+        if isinstance(reply, Exception): raise reply
+        return reply
+
+    def ensure_session(self, session_id: str):
+        now = time.monotonic()
+        with self._cond:
+            if now - self._last_touch.get(session_id, -TOUCH_INTERVAL) < TOUCH_INTERVAL: return
+            self._last_touch[session_id] = now
+        self._send(None, "ensure_session", (session_id,))
+
+    def get_snapshot(self, session_id: str, timeout: float = 5.0) -> Optional[SessionReplica]:
+        self.ensure_session(session_id)
+        with self._cond:
+            self._cond.wait_for(lambda: session_id in self._sessions, timeout=timeout)
+            return self._sessions.get(session_id)
+
+    def published(self, session_id: str, timeout: float = 5.0) -> Optional[PublishedSession]:
+        snapshot = self.get_snapshot(session_id, timeout)
+        return None if snapshot is None else snapshot.published
+
+    def export(self, session_id: str, timeout: float = 5.0) -> Optional[bytes]:
+        return self._call("export", session_id, timeout, timeout=timeout + 1)
+
+    def add_surge(self, session_id: str, surge: Dict, timeout: float = 5.0) -> Optional[Dict]:
+        return self._call("add_surge", session_id, surge, timeout, timeout=timeout + 1)
+
+    def fork(self, session_id: str, new_id: Optional[str] = None, seed: Optional[int] = None, timeout: float = 5.0) -> Optional[Dict]:
+        # The owner relays the new session's first publish before its reply
+        return self._call("fork", session_id, new_id, seed, timeout, timeout=2 * timeout + 1)
+
+    def start_capture(self, session_id: str, options: Dict, timeout: float = 5.0) -> Optional[Dict]:
+        return self._call("start_capture", session_id, options, timeout, timeout=timeout + 1)
+
+    def capture_result(self, session_id: str, format: str = "raw", timeout: float = 30.0) -> Optional[Dict]:
+        return self._call("capture_result", session_id, format, timeout, timeout=timeout + 1)
+
+    def session_stats(self) -> Dict:
+        return self._call("session_stats") or {"live": 0, "paused": 0, "hibernated": 0, "tick_ms_total": 0.0, "sessions": {}}
+
+    def stats(self) -> Dict:
+        stats = self._call("stats") or {}
+        return {**stats, "broker": self.path, "api_worker_pid": os.getpid()}
+
+    def metrics(self) -> list:
+        return self._call("metrics") or []
+
+if __name__ == "__main__":
+    run_owner()
@@ -0,0 +1,30 @@
+import time
+
+class TickClock:
+    # Paces a live loop at one tick per `tick_seconds` of wall-clock time.
+    # When ticks run long the loop falls behind; due() then hands back the
+    # whole backlog so callers can run it as one batch (up to max_catch_up
+    # ticks; anything beyond that is dropped and counted, so a stalled host
+    # slows the simulation down instead of freezing the API).
+    def __init__(self, tick_seconds=0.1, max_catch_up=50):
+        self.tick_seconds = tick_seconds
+        self.max_catch_up = max_catch_up
+        self.start = time.monotonic()
+        self.ticks_done = 0
+        self.dropped_ticks = 0
+
+    def due(self) -> int:
+        owed = int((time.monotonic() - self.start) / self.tick_seconds) - self.ticks_done
+        if owed > self.max_catch_up:
+            self.dropped_ticks += owed - self.max_catch_up
+            self.ticks_done += owed - self.max_catch_up
+            owed = self.max_catch_up
+        self.ticks_done += max(owed, 0)
+        return max(owed, 0)
+
+    def lag(self) -> float:
+        # Seconds the loop is behind its schedule (0 when on time)
+        return max(0.0, time.monotonic() - (self.start + (self.ticks_done + 1) * self.tick_seconds))
+
+    def sleep_time(self) -> float:
+        return max(0.0, self.start + (self.ticks_done + 1) * self.tick_seconds - time.monotonic())
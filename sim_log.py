@@ -0,0 +1,179 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+from collections import deque
+from itertools import islice
+from typing import Dict, List, Optional
+
+# Logging
+# Everything logs through the "solaris" logger. A QueueHandler hands records to
+# a background QueueListener thread, so a tick never waits on stdout.
+# SOLARIS_LOG_LEVEL and SOLARIS_LOG_FORMAT ("text" or "json") shape the output.
+#
+# Simulation events (arrivals, alerts, results back, redirects, hourly summaries)
+# belong to a session's EventLog. Routine ones are sampled (SOLARIS_LOG_SAMPLE =
+# fraction kept) and all are rate limited (SOLARIS_LOG_RATE per second per
+# session) before they reach the log. SOLARIS_SIM_EVENTS picks where they go:
+# "log", "memory" (a ring of SOLARIS_EVENT_LOG_SIZE per session, served by
+# GET /sessions/<id>/events), "both" or "off".
+LOG_LEVEL = os.environ.get("SOLARIS_LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("SOLARIS_LOG_FORMAT", "text")
+SIM_EVENTS = os.environ.get("SOLARIS_SIM_EVENTS", "both")
+LOG_SAMPLE = float(os.environ.get("SOLARIS_LOG_SAMPLE", "1.0"))
+LOG_RATE = float(os.environ.get("SOLARIS_LOG_RATE", "20"))
+EVENT_LOG_SIZE = int(os.environ.get("SOLARIS_EVENT_LOG_SIZE", "500"))
+
+logger = logging.getLogger("solaris")
+sim_logger = logging.getLogger("solaris.sim")
+
+class JsonFormatter(logging.Formatter):
+    # One JSON object per line; simulation events carry their fields
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        return json.dumps(entry, default=str)
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_handler: Optional[logging.Handler] = None
+
+def setup_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT):
+    # Once per process (API, every shard); later calls are no-ops
+    global _listener, _handler
+    if _listener is not None: return
+    records = queue.SimpleQueue()
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter() if fmt == "json" else logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+    _listener = logging.handlers.QueueListener(records, output)
+    _listener.start()
+    _handler = logging.handlers.QueueHandler(records)
+    logger.addHandler(_handler)
+    logger.setLevel(level)
+    logger.propagate = False
+    atexit.register(stop_logging)
+
+def stop_logging():
+    # Flushes whatever is still queued
+    global _listener, _handler
+    if _listener is None: return
+    logger.removeHandler(_handler)
+    _listener.stop()
+    _listener = _handler = None
+
+class EventRecords:
+    # Read side of an event log: `ring` (newest records, None = not kept) and `total`
+    ring = None
+    total = 0
+
+    def since(self, seq: int) -> List[Dict]:
+        if self.ring is None: return []
+        first = self.total - len(self.ring)
+        return list(islice(self.ring, max(0, seq - first), None))
+
+    def query(self, after: int = -1, limit: int = 100, kind: Optional[str] = None,
+              min_level: str = "DEBUG") -> Dict:
+        threshold = logging.getLevelName(min_level.upper())
+        if not isinstance(threshold, int): raise ValueError(f"Unknown level '{min_level}'")
+        events = []
+        for record in self.since(after + 1):
+            if kind is not None and record["kind"] != kind: continue
+            if logging.getLevelName(record["level"]) < threshold: continue
+            events.append(record)
+            if len(events) >= limit: break
+        return {
+            "total": self.total,
+            "retained": 0 if self.ring is None else len(self.ring),
+            "next_after": events[-1]["seq"] if events else after,
+            "events": events,
+        }
+
+class EventLog(EventRecords):
+    # One session's simulation events. Every event gets a sequence number; the
+    # in-memory ring keeps the newest ones (all of them, no sampling), the log
+    # gets a sampled, rate-limited subset. Sampling is counter based, so it never
+    # touches the simulation's random stream.
+    def __init__(self, session_id: str = "-", mode: str = SIM_EVENTS, sample: float = LOG_SAMPLE,
+                 rate: float = LOG_RATE, size: int = EVENT_LOG_SIZE):
+        self.session_id = session_id
+        self.to_log = mode in ("log", "both")
+        self.ring = deque(maxlen=max(1, size)) if mode in ("memory", "both") else None
+        self.total = 0 # Events ever recorded = next seq
+        self.sample = sample
+        self.rate = rate
+        self.suppressed = 0 # Rate-limited since the last event that got through
+        self._sampled = 0.0
+        self._tokens = rate
+        self._refilled = time.monotonic()
+
+    @property
+    def enabled(self) -> bool:
+        return self.to_log or self.ring is not None
+
+    def event(self, minute: int, kind: str, message: str, level: int = logging.INFO, routine: bool = True, **fields):
+        # `message` is a str.format template over `fields`
+        seq = self.total
+        self.total += 1
+        if not self.enabled: return
+        text = message.format(**fields)
+        if self.ring is not None:
+            self.ring.append({**fields, "seq": seq, "sim_minute": minute, "kind": kind,
+                              "level": logging.getLevelName(level), "message": text})
+        if self.to_log and sim_logger.isEnabledFor(level) and self._admit(routine):
+            if self.suppressed:
+                text += f" (+{self.suppressed} suppressed)"
+                self.suppressed = 0
+            sim_logger.log(level, "[%s] %s", self.session_id, text, extra={
+                "fields": {**fields, "session_id": self.session_id, "sim_minute": minute, "kind": kind},
+            })
+
+    def _admit(self, routine: bool) -> bool:
+        if routine and self.sample < 1.0:
+            self._sampled += self.sample
+            if self._sampled < 1.0: return False
+            self._sampled -= 1.0
+        # Token bucket: `rate` per second, bursts up to one second's worth
+        now = time.monotonic()
+        self._tokens = min(self.rate, self._tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+        if self._tokens < 1.0:
+            self.suppressed += 1
+            return False
+        self._tokens -= 1.0
+        return True
+
+    def get_state(self) -> Dict:
+        # Saved with the engine so seqs (the readers' `after` cursor) carry on after a
+        # restore. The ring itself is not: it would triple the snapshot's size and cost.
+        return {"total": self.total}
+
+    def set_state(self, state: Dict):
+        self.total = state["total"]
+        if self.ring is not None: self.ring.clear()
+
+    def extend(self, records: List[Dict]):
+        # Events recorded in another process (shards publish them to the API)
+        if not records: return
+        if self.ring is not None:
+            # Source restarted (restored from disk) or evicted some before publishing: keep seqs contiguous
+            if records[0]["seq"] != self.total: self.ring.clear()
+            self.ring.extend(records)
+        self.total = records[-1]["seq"] + 1
+
+    def view(self, previous: Optional["EventView"] = None) -> "EventView":
+        # Read-only copy for other threads (`previous` is reused if nothing happened since)
+        if previous is not None and previous.total == self.total: return previous
+        return EventView(tuple(self.ring) if self.ring is not None else None, self.total)
+
+class EventView(EventRecords):
+    def __init__(self, ring: Optional[tuple], total: int):
+        self.ring = ring
+        self.total = total
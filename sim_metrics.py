@@ -0,0 +1,248 @@
+import bisect
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import time
+import tracemalloc
+from time import perf_counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Metrics
+# Process-local histograms and gauges, rendered as Prometheus text by GET /metrics.
+# Live ticks are timed per phase (arrivals, patients, cleanup, admission) when
+# SOLARIS_TICK_TIMING is on (default); fast-forward ticks (catch-up batches,
+# what-if and batch runs) never are. Sharded workers publish theirs with
+# their health reports and the API renders them with a shard label.
+#
+# SOLARIS_PROFILING=1 enables POST /sessions/<id>/profile: cProfile ("cpu") or
+# tracemalloc ("memory") around a sample of one session's ticks, downloaded
+# from GET /sessions/<id>/profile when done. Off by default.
+PHASE_TIMING = os.environ.get("SOLARIS_TICK_TIMING", "1") == "1"
+PROFILING = os.environ.get("SOLARIS_PROFILING", "0") == "1"
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0) # Seconds
+PROFILE_TICKS_MAX = 10000
+
+class Histogram:
+    # Fixed buckets, one child per label value; observe() is a bisect and three adds
+    def __init__(self, name: str, help: str, label: Optional[str] = None, buckets: Tuple[float, ...] = BUCKETS):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.buckets = buckets
+        self.children: Dict[str, List] = {} # label value -> [per-bucket counts (+Inf last), sum, count]
+
+    def observe(self, seconds: float, label: str = ""):
+        child = self.children.get(label)
+        if child is None: child = self.children[label] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        child[0][bisect.bisect_left(self.buckets, seconds)] += 1
+        child[1] += seconds
+        child[2] += 1
+
+    def export(self) -> Dict:
+        return {"name": self.name, "help": self.help, "type": "histogram", "label": self.label,
+                "buckets": self.buckets, "children": {k: [list(c[0]), c[1], c[2]] for k, c in self.children.items()}}
+
+class Gauge:
+    # A value per label; `type` "counter" for values that only grow
+    def __init__(self, name: str, help: str, label: Optional[str] = None, type: str = "gauge"):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.type = type
+        self.children: Dict[str, float] = {}
+
+    def set(self, value: float, label: str = ""):
+        self.children[label] = value
+
+    def export(self) -> Dict:
+        return family(self.name, self.help, self.type, self.label, self.children)
+
+def family(name: str, help: str, type: str, label: Optional[str], values: Dict[str, float]) -> Dict:
+    # Plain-dict form of a gauge / counter (what export() returns and shards publish)
+    return {"name": name, "help": help, "type": type, "label": label, "children": dict(values)}
+
+TICK_PHASES = Histogram("solaris_tick_phase_seconds", "Wall time per phase of one live engine tick", "phase")
+SESSION_TICK = Histogram("solaris_session_tick_seconds", "Wall time of one session's turn in a loop iteration, per owed tick", "backend")
+LOOP_ITERATION = Histogram("solaris_loop_iteration_seconds", "Wall time of one simulation loop iteration (all sessions)")
+LOOP_LAG = Gauge("solaris_loop_lag_seconds", "How far the simulation loop is behind its tick schedule")
+DROPPED_TICKS = Gauge("solaris_loop_dropped_ticks_total", "Ticks skipped because the loop fell too far behind", type="counter")
+LOCAL_METRICS = (TICK_PHASES, SESSION_TICK, LOOP_ITERATION, LOOP_LAG, DROPPED_TICKS)
+
+class PhaseClock:
+    # Laps of one tick: lap(phase) records the time since the previous lap
+    __slots__ = ("last",)
+
+    def __init__(self):
+        self.last = perf_counter()
+
+    def lap(self, phase: str):
+        now = perf_counter()
+        TICK_PHASES.observe(now - self.last, phase)
+        self.last = now
+
+class _NoClock:
+    def lap(self, phase: str): pass
+
+NO_CLOCK = _NoClock()
+
+def phase_clock(is_fast_forward: bool):
+    return PhaseClock() if PHASE_TIMING and not is_fast_forward else NO_CLOCK
+
+def record_loop(clock, seconds: float):
+    # After each loop iteration (API process or shard)
+    LOOP_ITERATION.observe(seconds)
+    LOOP_LAG.set(round(clock.lag(), 6))
+    DROPPED_TICKS.set(clock.dropped_ticks)
+
+def session_metrics(sessions) -> List[Dict]:
+    # Sampled at scrape / publish time from a SessionManager (O(patients))
+    stats = sessions.stats()
+    active = stats["live"] - stats["paused"]
+    patients: Dict[str, float] = {}
+    alerts = 0
+    for _, record in sessions.records():
+        for status, count in record.sim._status_counts().items(): patients[status] = patients.get(status, 0) + count
+        alerts += record.sim.alerts.total
+    return [
+        family("solaris_sessions", "Sessions by lifecycle state", "gauge", "state",
+               {"active": active, "paused": stats["paused"], "hibernated": stats["hibernated"]}),
+        family("solaris_patients", "Patients in live sessions by status", "gauge", "status", patients),
+        family("solaris_alerts_total", "Alerts raised by live sessions", "counter", None, {"": alerts}),
+    ]
+
+def export_metrics(sessions=None) -> List[Dict]:
+    families = [m.export() for m in LOCAL_METRICS]
+    if sessions is not None: families += session_metrics(sessions)
+    return families
+
+def _labels(pairs: List[Tuple[str, str]]) -> str:
+    if not pairs: return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def render(sources: List[Tuple[Dict[str, str], List[Dict]]]) -> str:
+    # Prometheus text exposition (0.0.4). `sources` = (extra labels, families) per
+    # process; families with the same name are written under one HELP / TYPE.
+    merged: Dict[str, Tuple[Dict, List]] = {}
+    for extra, families in sources:
+        for fam in families:
+            merged.setdefault(fam["name"], (fam, []))[1].append((extra, fam))
+    lines = []
+    for name, (first, parts) in merged.items():
+        lines.append(f"# HELP {name} {first['help']}")
+        lines.append(f"# TYPE {name} {first['type']}")
+        for extra, fam in parts:
+            for value, data in sorted(fam["children"].items()):
+                pairs = list(extra.items()) + ([(fam["label"], value)] if fam["label"] else [])
+                if fam["type"] != "histogram":
+                    lines.append(f"{name}{_labels(pairs)} {_number(data)}")
+                    continue
+                counts, total, count = data
+                cumulative = 0
+                for bound, n in zip(list(fam["buckets"]) + ["+Inf"], counts):
+                    cumulative += n
+                    lines.append(f"{name}_bucket{_labels(pairs + [('le', bound)])} {cumulative}")
+                lines.append(f"{name}_sum{_labels(pairs)} {_number(total)}")
+                lines.append(f"{name}_count{_labels(pairs)} {count}")
+    return "\n".join(lines) + "\n"
+
+# ---------------------------------------------------------
+# Profile Captures
+# ---------------------------------------------------------
+PROFILE_KINDS = ("cpu", "memory")
+
+class ProfileCapture:
+    # Profiles `ticks` of one session's loop turns, every `every`-th one.
+    # cpu: one cProfile.Profile enabled only around the sampled turns.
+    # memory: tracemalloc around each sampled turn; allocations still alive at
+    # its end are summed per source line (tracing is process wide, so other
+    # threads' allocations during the turn are counted too).
+    def __init__(self, session_id: str, kind: str = "cpu", ticks: int = 100, every: int = 1):
+        if kind not in PROFILE_KINDS: raise ValueError(f"Unknown profile kind '{kind}'. Choose from: {', '.join(PROFILE_KINDS)}")
+        if not 1 <= ticks <= PROFILE_TICKS_MAX: raise ValueError(f"ticks must be between 1 and {PROFILE_TICKS_MAX}")
+        if every < 1: raise ValueError("every must be at least 1")
+        self.session_id = session_id
+        self.kind = kind
+        self.ticks = ticks
+        self.every = every
+        self.seen = 0
+        self.captured = 0
+        self.seconds = 0.0 # Wall time of the captured turns
+        self.peak_bytes = 0
+        self.error: Optional[str] = None
+        self.started = time.time()
+        self._profile = cProfile.Profile() if kind == "cpu" else None
+        self._lines: Dict[str, List[int]] = {} # "file:line" -> [bytes, blocks]
+
+    @property
+    def done(self) -> bool:
+        return self.captured >= self.ticks or self.error is not None
+
+    def run(self, turn: Callable[[], None]):
+        # Calls turn(), under the profiler if this one is sampled
+        self.seen += 1
+        if self.done or (self.seen - 1) % self.every: return turn()
+        start = perf_counter()
+        if self._profile is not None:
+            try:
+                self._profile.enable()
+            except ValueError as e: # Another profiler is active in this process
+                self.error = str(e)
+                return turn()
+            try: turn()
+            finally: self._profile.disable()
+        else:
+            started = not tracemalloc.is_tracing()
+            if started: tracemalloc.start()
+            tracemalloc.clear_traces()
+            tracemalloc.reset_peak()
+            try:
+                turn()
+                snapshot = tracemalloc.take_snapshot()
+                self.peak_bytes = max(self.peak_bytes, tracemalloc.get_traced_memory()[1])
+            finally:
+                if started: tracemalloc.stop()
+            for stat in snapshot.statistics("lineno"):
+                frame = stat.traceback[0]
+                entry = self._lines.setdefault(f"{frame.filename}:{frame.lineno}", [0, 0])
+                entry[0] += stat.size
+                entry[1] += stat.count
+        self.seconds += perf_counter() - start
+        self.captured += 1
+
+    def status(self) -> Dict:
+        return {
+            "session_id": self.session_id,
+            "kind": self.kind,
+            "state": "failed" if self.error else "done" if self.done else "running",
+            "ticks": self.ticks,
+            "every": self.every,
+            "captured": self.captured,
+            "captured_ms": round(self.seconds * 1000, 2),
+            "error": self.error,
+        }
+
+    def result(self, format: str = "raw") -> Tuple[bytes, str, str]:
+        # (body, media type, file name). cpu "raw" is a pstats file (pstats.Stats /
+        # snakeviz open it); "text" is the top functions by cumulative time.
+        # memory is always text.
+        if self._profile is not None and format == "raw":
+            self._profile.create_stats()
+            return marshal.dumps(self._profile.stats), "application/octet-stream", f"{self.session_id}-cpu.prof"
+        out = io.StringIO()
+        out.write(f"# {self.session_id}: {self.kind} profile of {self.captured} ticks (every {self.every}), {self.seconds * 1000:.1f} ms\n")
+        if self._profile is not None:
+            pstats.Stats(self._profile, stream=out).sort_stats("cumulative").print_stats(40)
+        else:
+            out.write(f"# peak traced memory in one tick: {self.peak_bytes / 1024:.1f} KiB\n")
+            out.write(f"{'KiB retained':>12} {'blocks':>8}  line\n")
+            top = sorted(self._lines.items(), key=lambda item: -item[1][0])[:40]
+            for where, (size, count) in top: out.write(f"{size / 1024:12.1f} {count:8d}  {where}\n")
+        return out.getvalue().encode(), "text/plain", f"{self.session_id}-{self.kind}.txt"
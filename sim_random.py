@@ -0,0 +1,82 @@
+import random
+
+import numpy as np
+
+class SimRandom:
+    # Per-engine random stream. Uniforms are pre-drawn in blocks (one block per
+    # tick sized to the patient count) and served from a buffer, so a tick costs
+    # one generator call instead of one per coin flip.
+    #
+    # Block sizes never change the values: both generators produce the same
+    # stream however it is chunked, so a given seed always gives the same
+    # trajectory. backend="numpy" draws blocks with numpy.random.Generator.
+    def __init__(self, seed=None, backend="python", block_size=256):
+        if backend not in ("python", "numpy"):
+            raise ValueError(f"Unknown RNG backend '{backend}'. Choose from: python, numpy")
+        self.seed = seed
+        self.backend = backend
+        self.block_size = block_size
+        if backend == "numpy":
+            self._gen = np.random.default_rng(seed)
+        else:
+            self._gen = random.Random(seed)
+        self._buf = []
+        self._pos = 0
+
+    def get_state(self):
+        # Generator state plus the still-unused part of the buffer: restoring it
+        # continues the exact same stream
+        if self.backend == "numpy":
+            gen = self._gen.bit_generator.state
+        else:
+            version, words, gauss = self._gen.getstate()
+            gen = (version, np.array(words, dtype=np.uint32), gauss)
+        return {
+            "backend": self.backend,
+            "seed": self.seed,
+            "block_size": self.block_size,
+            "gen": gen,
+            "buffer": np.array(self._buf[self._pos:], dtype=np.float64),
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        rng = cls(state["seed"], backend=state["backend"], block_size=state["block_size"])
+        if rng.backend == "numpy":
+            rng._gen.bit_generator.state = state["gen"]
+        else:
+            version, words, gauss = state["gen"]
+            rng._gen.setstate((version, tuple(words.tolist()), gauss))
+        rng._buf = state["buffer"].tolist()
+        return rng
+
+    def _draw(self, n):
+        if self.backend == "numpy": return self._gen.random(n).tolist()
+        r = self._gen.random
+        return [r() for _ in range(n)]
+
+    def prefetch(self, n):
+        # Make sure at least n uniforms are buffered
+        available = len(self._buf) - self._pos
+        if available < n:
+            self._buf = self._buf[self._pos:] + self._draw(max(n - available, self.block_size))
+            self._pos = 0
+
+    def random(self) -> float:
+        if self._pos >= len(self._buf): self.prefetch(1)
+        u = self._buf[self._pos]
+        self._pos += 1
+        return u
+
+    def uniforms(self, n) -> np.ndarray:
+        # n uniforms at once, taken from the same stream
+        self.prefetch(n)
+        block = np.array(self._buf[self._pos:self._pos + n])
+        self._pos += n
+        return block
+
+    def randint(self, a, b) -> int:
+        return a + int(self.random() * (b - a + 1))
+
+    def choice(self, seq):
+        return seq[int(self.random() * len(seq))]
@@ -0,0 +1,216 @@
+import struct
+import zlib
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+import numpy as np
+
+from models import trusted_model
+
+# ---------------------------------------------------------
+# Compact binary encoding for engine snapshots
+# ---------------------------------------------------------
+# A small tagged format for plain values (None/bool/int/float/str/bytes/
+# list/tuple/dict/datetime) plus NumPy arrays stored as raw buffers.
+# Homogeneous lists get packed forms: all-int lists as one int64 buffer,
+# all-str lists as one length table + one blob, lists of same-keyed dicts or
+# same-length tuples as one column per key / position, and big dicts as a key
+# list plus a value list. Lists of pydantic models go through encode_table():
+# one typed column per field, strings dictionary-coded, so an encounter costs
+# a few bytes per field instead of a JSON object.
+MAGIC = b"SOLS"
+FORMAT_VERSION = 1
+
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+_U32 = struct.Struct("<I")
+_I64 = struct.Struct("<q")
+_F64 = struct.Struct("<d")
+
+def _pack(value, out: List[bytes]):
+    if value is None: out.append(b"N")
+    elif value is True: out.append(b"T")
+    elif value is False: out.append(b"F")
+    elif isinstance(value, (int, np.integer)):
+        value = int(value)
+        if -2**63 <= value < 2**63:
+            out.append(b"i" + _I64.pack(value))
+        else: # e.g. PCG64 state words
+            raw = value.to_bytes((value.bit_length() + 8) // 8, "little", signed=True)
+            out.append(b"I" + _U32.pack(len(raw)) + raw)
+    elif isinstance(value, (float, np.floating)): out.append(b"f" + _F64.pack(value))
+    elif isinstance(value, str):
+        raw = value.encode()
+        out.append(b"s" + _U32.pack(len(raw)) + raw)
+    elif isinstance(value, bytes): out.append(b"b" + _U32.pack(len(value)) + value)
+    elif isinstance(value, datetime): out.append(b"D" + _I64.pack((value - EPOCH) // MICROSECOND))
+    elif isinstance(value, np.ndarray):
+        value = np.ascontiguousarray(value)
+        dtype = value.dtype.str.encode()
+        out.append(b"a" + _U32.pack(len(dtype)) + dtype + _U32.pack(value.ndim)
+                   + b"".join(_U32.pack(d) for d in value.shape) + value.tobytes())
+    elif isinstance(value, list) and value and _packed_list(value, out): pass
+    elif isinstance(value, (list, tuple)):
+        out.append((b"l" if isinstance(value, list) else b"t") + _U32.pack(len(value)))
+        for item in value: _pack(item, out)
+    elif isinstance(value, dict) and len(value) >= 16:
+        out.append(b"M")
+        _pack(list(value), out)
+        _pack(list(value.values()), out)
+    elif isinstance(value, dict):
+        out.append(b"d" + _U32.pack(len(value)))
+        for k, v in value.items():
+            _pack(k, out)
+            _pack(v, out)
+    else:
+        raise TypeError(f"Cannot snapshot value of type {type(value).__name__}")
+
+def _packed_list(values: list, out: List[bytes]) -> bool:
+    first = type(values[0])
+    if any(type(v) is not first for v in values): return False
+    if first is int:
+        if not all(-2**63 <= v < 2**63 for v in values): return False
+        out.append(b"L" + _U32.pack(len(values)) + np.array(values, dtype=np.int64).tobytes())
+    elif first is str:
+        raw = [v.encode() for v in values]
+        out.append(b"S" + _U32.pack(len(raw)) + np.array([len(r) for r in raw], dtype=np.uint32).tobytes() + b"".join(raw))
+    elif first is dict:
+        keys = tuple(values[0])
+        if any(tuple(v) != keys for v in values): return False
+        out.append(b"R" + _U32.pack(len(values)))
+        _pack(keys, out)
+        for k in keys: _pack([v[k] for v in values], out)
+    elif first is tuple:
+        width = len(values[0])
+        if not width or any(len(v) != width for v in values): return False
+        out.append(b"C" + _U32.pack(len(values)) + _U32.pack(width))
+        for column in zip(*values): _pack(list(column), out)
+    else:
+        return False
+    return True
+
+def _unpack(buf: memoryview, pos: int):
+    tag = buf[pos:pos + 1].tobytes()
+    pos += 1
+    if tag == b"N": return None, pos
+    if tag == b"T": return True, pos
+    if tag == b"F": return False, pos
+    if tag == b"i": return _I64.unpack_from(buf, pos)[0], pos + 8
+    if tag == b"f": return _F64.unpack_from(buf, pos)[0], pos + 8
+    if tag == b"D": return EPOCH + _I64.unpack_from(buf, pos)[0] * MICROSECOND, pos + 8
+    if tag in (b"I", b"s", b"b"):
+        n = _U32.unpack_from(buf, pos)[0]
+        raw = buf[pos + 4:pos + 4 + n].tobytes()
+        pos += 4 + n
+        if tag == b"I": return int.from_bytes(raw, "little", signed=True), pos
+        return (raw.decode() if tag == b"s" else raw), pos
+    if tag == b"a":
+        n = _U32.unpack_from(buf, pos)[0]
+        dtype = np.dtype(buf[pos + 4:pos + 4 + n].tobytes().decode())
+        pos += 4 + n
+        ndim = _U32.unpack_from(buf, pos)[0]
+        shape = tuple(_U32.unpack_from(buf, pos + 4 + 4 * i)[0] for i in range(ndim))
+        pos += 4 + 4 * ndim
+        nbytes = int(np.prod(shape)) * dtype.itemsize
+        array = np.frombuffer(buf[pos:pos + nbytes], dtype=dtype).reshape(shape).copy()
+        return array, pos + nbytes
+    if tag == b"L":
+        n = _U32.unpack_from(buf, pos)[0]
+        return np.frombuffer(buf[pos + 4:pos + 4 + 8 * n], dtype=np.int64).tolist(), pos + 4 + 8 * n
+    if tag == b"S":
+        n = _U32.unpack_from(buf, pos)[0]
+        lengths = np.frombuffer(buf[pos + 4:pos + 4 + 4 * n], dtype=np.uint32).tolist()
+        pos += 4 + 4 * n
+        blob = buf[pos:pos + sum(lengths)].tobytes()
+        strings, start = [], 0
+        for length in lengths:
+            strings.append(blob[start:start + length].decode())
+            start += length
+        return strings, pos + start
+    if tag == b"R":
+        n = _U32.unpack_from(buf, pos)[0]
+        keys, pos = _unpack(buf, pos + 4)
+        columns = []
+        for _ in keys:
+            column, pos = _unpack(buf, pos)
+            columns.append(column)
+        return [dict(zip(keys, row)) for row in zip(*columns)], pos
+    if tag == b"C":
+        width = _U32.unpack_from(buf, pos + 4)[0]
+        pos += 8
+        columns = []
+        for _ in range(width):
+            column, pos = _unpack(buf, pos)
+            columns.append(column)
+        return list(zip(*columns)), pos
+    if tag == b"M":
+        keys, pos = _unpack(buf, pos)
+        values, pos = _unpack(buf, pos)
+        return dict(zip(keys, values)), pos
+    if tag in (b"l", b"t"):
+        n = _U32.unpack_from(buf, pos)[0]
+        pos += 4
+        items = []
+        for _ in range(n):
+            item, pos = _unpack(buf, pos)
+            items.append(item)
+        return (items if tag == b"l" else tuple(items)), pos
+    if tag == b"d":
+        n = _U32.unpack_from(buf, pos)[0]
+        pos += 4
+        result = {}
+        for _ in range(n):
+            k, pos = _unpack(buf, pos)
+            result[k], pos = _unpack(buf, pos)
+        return result, pos
+    raise ValueError(f"Corrupt snapshot (unknown tag {tag!r})")
+
+def dumps(state: Dict, compress: bool = True) -> bytes:
+    out = []
+    _pack(state, out)
+    body = b"".join(out)
+    if compress: body = zlib.compress(body, 1)
+    return MAGIC + bytes([FORMAT_VERSION, int(compress)]) + body
+
+def loads(data: bytes) -> Dict:
+    if data[:4] != MAGIC: raise ValueError("Not a simulation snapshot")
+    if data[4] != FORMAT_VERSION: raise ValueError(f"Unsupported snapshot format version {data[4]}")
+    body = zlib.decompress(data[6:]) if data[5] else data[6:]
+    return _unpack(memoryview(body), 0)[0]
+
+# ---------------------------------------------------------
+# Model tables
+# ---------------------------------------------------------
+def encode_table(models: List[Any], model_cls) -> Dict:
+    table = {"n": len(models)}
+    for field in model_cls.model_fields:
+        values = [getattr(m, field) for m in models]
+        if values and all(type(v) is bool for v in values):
+            table[field] = ("bool", np.array(values, dtype=np.bool_))
+        elif values and all(type(v) is int for v in values):
+            table[field] = ("int", np.array(values, dtype=np.int64))
+        elif values and all(isinstance(v, datetime) for v in values):
+            table[field] = ("datetime", np.array([(v - EPOCH) // MICROSECOND for v in values], dtype=np.int64))
+        else:
+            # Dictionary-coded (strings, enums, None): each distinct value stored once
+            uniques = {}
+            codes = np.array([uniques.setdefault(v, len(uniques)) for v in values], dtype=np.uint32)
+            table[field] = ("dict", list(uniques), codes)
+    return table
+
+def decode_table(table: Dict, model_cls) -> List[Any]:
+    columns = {}
+    for field in model_cls.model_fields:
+        kind, *data = table[field]
+        if kind == "dict":
+            uniques, codes = data
+            columns[field] = [uniques[c] for c in codes.tolist()]
+        elif kind == "datetime":
+            columns[field] = [EPOCH + us * MICROSECOND for us in data[0].tolist()]
+        else:
+            columns[field] = data[0].tolist()
+    names = list(columns)
+    fields_set = set(names)
+    # Values came from validated models, so no need to validate them again
+    return [trusted_model(model_cls, dict(zip(names, row)), fields_set) for row in zip(*columns.values())]
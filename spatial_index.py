@@ -0,0 +1,54 @@
+import math
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+
+class SpatialGrid:
+    # Uniform grid over an equirectangular projection (km), good for a region a
+    # few hundred km across. Cells are sized for about one point each, so a
+    # k-nearest query scans a few rings of cells around the query point instead
+    # of every facility.
+    def __init__(self, lat, lon, cell_km: float = None):
+        lat = np.asarray(lat, dtype=float)
+        lon = np.asarray(lon, dtype=float)
+        scale = math.cos(math.radians(float(lat.mean()))) if len(lat) else 1.0
+        self.x = np.radians(lon) * scale * EARTH_RADIUS_KM
+        self.y = np.radians(lat) * EARTH_RADIUS_KM
+        if cell_km is None:
+            area = max(float(np.ptp(self.x)) * float(np.ptp(self.y)), 1.0) if len(lat) else 1.0
+            cell_km = max(0.5, math.sqrt(area / max(len(lat), 1)))
+        self.cell_km = cell_km
+        self.x0 = float(self.x.min()) if len(lat) else 0.0
+        self.y0 = float(self.y.min()) if len(lat) else 0.0
+        self.cells: Dict[Tuple[int, int], List[int]] = {}
+        for i, cell in enumerate(zip(self._cell(self.x, self.x0), self._cell(self.y, self.y0))):
+            self.cells.setdefault(cell, []).append(i)
+        self.max_ring = max((max(abs(cx), abs(cy)) for cx, cy in self.cells), default=0) + 1
+
+    def _cell(self, values, origin):
+        return np.floor((values - origin) / self.cell_km).astype(np.int64).tolist()
+
+    def distance_km(self, i: int, j: int) -> float:
+        return math.hypot(float(self.x[i] - self.x[j]), float(self.y[i] - self.y[j]))
+
+    def nearest(self, i: int, k: int) -> List[int]:
+        # The k points closest to point i (excluding i), nearest first. Rings
+        # are visited outward until the k-th best is closer than anything an
+        # unvisited ring could hold.
+        if k <= 0: return []
+        cx = int(math.floor((self.x[i] - self.x0) / self.cell_km))
+        cy = int(math.floor((self.y[i] - self.y0) / self.cell_km))
+        found = []
+        for ring in range(self.max_ring * 2 + 1):
+            for dx in range(-ring, ring + 1):
+                # Perimeter of the ring only
+                for dy in (range(-ring, ring + 1) if abs(dx) == ring else {-ring, ring}):
+                    for j in self.cells.get((cx + dx, cy + dy), ()):
+                        if j != i: found.append((self.distance_km(i, j), j))
+            if len(found) >= k:
+                found.sort()
+                if found[k - 1][0] <= ring * self.cell_km: break
+        found.sort()
+        return [j for _, j in found[:k]]
@@ -0,0 +1,81 @@
+from datetime import datetime
+from itertools import product
+
+import pytest
+
+from alert_store import AlertStore
+from models import Alert
+
+CAPACITY = 7
+SEVERITIES = ("HIGH", "MEDIUM", "LOW")
+RULES = ("R0", "R1", "R2", "R3")
+ENCOUNTERS = ("E0", "E1", "E2", "E3", "E4")
+
+def alert(i):
+    # Moduli 3 / 4 / 5 so filter combinations match different, sparse subsets
+    return Alert(id=f"A{i}", encounter_id=ENCOUNTERS[i % 5], rule_violated=RULES[i % 4],
+                 severity=SEVERITIES[i % 3], timestamp=datetime(2024, 1, 1), explanation=f"alert {i}")
+
+def filled(n):
+    store = AlertStore(CAPACITY)
+    alerts = [alert(i) for i in range(n)]
+    for a in alerts: store.append(a)
+    return store, alerts
+
+def brute(retained, after=None, limit=None, severity=None, rule=None, encounter_id=None):
+    ids = [a.id for a in retained]
+    start = ids.index(after) + 1 if after in ids else 0
+    page = [a for a in retained[start:]
+            if severity in (None, a.severity) and rule in (None, a.rule_violated) and encounter_id in (None, a.encounter_id)]
+    return page if limit is None else page[:limit]
+
+@pytest.mark.parametrize("n", (0, 3, CAPACITY, CAPACITY + 1, 4 * CAPACITY + 2))
+def test_ring_keeps_newest_and_trims_indexes(n):
+    store, alerts = filled(n)
+    retained = alerts[-CAPACITY:] if n else []
+    assert store.total == n and len(store) == len(retained)
+    assert list(store) == retained
+    assert store.since(0) == retained
+    assert sorted(store._seq_of) == sorted(a.id for a in retained)
+    for index in (store.by_severity, store.by_rule, store.by_encounter):
+        assert sum(len(seqs) for seqs in index.values()) == len(retained)
+        assert all(seqs for seqs in index.values())
+    assert sum(store.severity_counts.values()) == n # All-time
+
+def test_page_cursors():
+    store, alerts = filled(4 * CAPACITY + 2)
+    retained = alerts[-CAPACITY:]
+    assert store.page() == retained
+    for k, a in enumerate(retained):
+        assert store.page(after=a.id) == retained[k + 1:]
+        assert store.page(after=a.id, limit=2) == retained[k + 1:k + 3]
+    for evicted in (alerts[0].id, alerts[-CAPACITY - 1].id, "unknown"):
+        assert store.page(after=evicted) == retained # Restarts from the oldest retained
+        assert store.page(after=evicted, limit=3) == retained[:3]
+
+@pytest.mark.parametrize("n", (5, 4 * CAPACITY + 2))
+def test_filtered_pages_match_brute_force(n):
+    store, alerts = filled(n)
+    retained = alerts[-CAPACITY:]
+    view = store.view()
+    cursors = [None, alerts[0].id] + [a.id for a in retained]
+    for after, limit, severity, rule, encounter_id in product(
+            cursors, (None, 1, 2), (None,) + SEVERITIES, (None,) + RULES, (None, "E-missing") + ENCOUNTERS):
+        expected = brute(retained, after, limit, severity, rule, encounter_id)
+        assert store.page(after, limit, severity, rule, encounter_id) == expected
+        assert view.page(after, limit, severity, rule, encounter_id) == expected
+
+@pytest.mark.parametrize("step", (1, 2, 3, CAPACITY, CAPACITY + 3))
+def test_incremental_views_match_fresh_ones(step):
+    store = AlertStore(CAPACITY)
+    previous = store.view()
+    for i in range(5 * CAPACITY):
+        store.append(alert(i))
+        if i % step: continue
+        view = store.view(previous)
+        fresh = store.view()
+        assert view.alerts == fresh.alerts
+        assert (view.total, view.first_seq) == (fresh.total, fresh.first_seq)
+        assert view.counters() == fresh.counters() == store.counters()
+        assert store.view(view) is view # Nothing raised since: reused
+        previous = view
@@ -0,0 +1,30 @@
+import pytest
+
+from engine_registry import ENGINE_BACKENDS, create_engine
+from sim_log import EventLog
+
+def engine(backend):
+    sim = create_engine(backend)
+    sim.event_log = EventLog(mode="memory", size=1000)
+    return sim
+
+def run(sim, minutes):
+    for _ in range(minutes): sim.tick() # Live ticks: advance() fast-forwards silently
+
+@pytest.mark.parametrize("backend", list(ENGINE_BACKENDS))
+def test_restored_session_continues_event_seqs(backend):
+    sim = engine(backend)
+    run(sim, 240)
+    cursor = sim.event_log.query(limit=1000)["next_after"]
+    assert cursor == sim.event_log.total - 1 > 0
+
+    clone = engine(backend).restore(sim.snapshot())
+    assert clone.event_log.total == sim.event_log.total
+    assert clone.event_log.query(after=cursor)["events"] == []
+
+    run(sim, 60)
+    run(clone, 60)
+    page = clone.event_log.query(after=cursor, limit=1000)
+    assert page["events"] and page["events"][0]["seq"] == cursor + 1
+    original = sim.event_log.query(after=cursor, limit=1000)
+    assert (page["total"], page["events"]) == (original["total"], original["events"])
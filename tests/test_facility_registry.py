@@ -0,0 +1,21 @@
+from facility_registry import FacilityRegistry
+from spatial_index import SpatialGrid
+
+ONE_ED = {
+    "id": "ONLY", "name": "Only ED", "lat": 43.65, "lon": -79.39, "capacity": 40,
+    "physical_beds": 30, "surge_capacity": 10,
+    "staffing": {"day_shift": {"md_count": 3, "rn_count": 8}},
+}
+
+def test_one_facility_registry_has_no_neighbours():
+    registry = FacilityRegistry([ONE_ED])
+    assert registry.ids == ["ONLY"]
+    assert registry.neighbours == {"ONLY": []}
+    assert registry.neighbour_km == {"ONLY": []}
+    assert registry.neighbour_index[0].tolist() == []
+
+def test_nearest_with_no_neighbours_wanted():
+    grid = SpatialGrid([43.65, 43.70], [-79.39, -79.40])
+    assert grid.nearest(0, 0) == []
+    assert grid.nearest(0, -1) == []
+    assert grid.nearest(0, 1) == [1]
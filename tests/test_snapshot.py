@@ -0,0 +1,54 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from engine_registry import ENGINE_BACKENDS, create_engine
+from sim_snapshot import FORMAT_VERSION, MAGIC, dumps, loads
+
+RNG_BACKENDS = ("python", "numpy")
+
+def alerts(sim):
+    # Timestamps are wall-clock; everything else must replay exactly
+    return [a.model_dump(exclude={"timestamp"}) for a in sim.alerts.since(0)]
+
+@pytest.mark.parametrize("rng_backend", RNG_BACKENDS)
+@pytest.mark.parametrize("backend", list(ENGINE_BACKENDS))
+@pytest.mark.parametrize("compress", (True, False))
+def test_restored_engine_replays_the_original(backend, rng_backend, compress):
+    sim = create_engine(backend, seed=7, rng_backend=rng_backend)
+    for _ in range(360): sim.tick()
+    assert sim.alerts.total > 0 and sim._active_count() > 0
+
+    clone = create_engine(backend, rng_backend=rng_backend).restore(sim.snapshot(compress))
+    assert clone._get_vitals() == sim._get_vitals()
+    assert alerts(clone) == alerts(sim)
+    for _ in range(120):
+        sim.tick()
+        clone.tick()
+        assert clone._get_vitals() == sim._get_vitals()
+    assert alerts(clone) == alerts(sim)
+
+def test_plain_values_round_trip():
+    state = {
+        "none": None, "flags": [True, False], "int": -3, "big": 2**100, "float": 0.25,
+        "str": "ü", "bytes": b"\x00\x01", "when": datetime(2024, 5, 1, 12, 30, 0, 5),
+        "ints": [1, 2, 3], "strs": ["a", "", "bc"], "rows": [{"a": 1, "b": "x"}, {"a": 2, "b": "y"}],
+        "pairs": [(1, "a"), (2, "b")], "tuple": (1, "a", None), "mixed": [1, "a", None],
+        "big_dict": {f"k{i}": i for i in range(20)}, "nested": {"x": [{"y": (1,)}]},
+    }
+    assert loads(dumps(state)) == state
+    array = np.arange(12, dtype=np.int32).reshape(3, 4)
+    restored = loads(dumps({"array": array}, compress=False))["array"]
+    assert restored.dtype == array.dtype and np.array_equal(restored, array)
+
+def test_unreadable_snapshots_raise_value_error():
+    with pytest.raises(ValueError): loads(b"not a snapshot")
+    with pytest.raises(ValueError): loads(MAGIC + bytes([FORMAT_VERSION + 1, 0]) + b"N")
+    with pytest.raises(ValueError): loads(MAGIC + bytes([FORMAT_VERSION, 0]) + b"?")
+
+@pytest.mark.parametrize("backend", list(ENGINE_BACKENDS))
+def test_snapshot_from_another_backend_raises_value_error(backend):
+    other = next(b for b in ENGINE_BACKENDS if b != backend)
+    blob = create_engine(other).snapshot()
+    with pytest.raises(ValueError): create_engine(backend).restore(blob)
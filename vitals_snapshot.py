@@ -0,0 +1,99 @@
+import itertools
+from typing import Any, Dict, List, Optional
+
+class VitalsSnapshot:
+    # Versioned copy of the patient board. Each update() diffs the new rows
+    # against the previous ones and stamps only the rows that changed, so
+    # pollers can ask for "everything since version N" and get a small delta
+    # instead of the whole board. Removals are kept as tombstones for
+    # `history` versions; older clients get a full snapshot instead.
+    def __init__(self, history: int = 600):
+        self.version = 0
+        self.history = history
+        self.rows: Dict[str, Dict] = {}
+        self.changed_at: Dict[str, int] = {} # id -> version of last change
+        self.removed_at: Dict[str, int] = {} # id -> version it left the board
+        self.oldest = 0 # Deltas from before this version are no longer reconstructible
+
+    def update(self, rows: Dict[str, Dict]):
+        version = self.version + 1
+        changed = False
+        for pid, row in rows.items():
+            old = self.rows.get(pid)
+            if old is None or not _same_row(old, row):
+                self.changed_at[pid] = version
+                self.removed_at.pop(pid, None)
+                changed = True
+        for pid in self.rows.keys() - rows.keys():
+            del self.changed_at[pid]
+            self.removed_at[pid] = version
+            changed = True
+        self.rows = rows
+        if not changed: return
+        self.version = version
+
+        # Forget tombstones that no client in the window can still need
+        cutoff = version - self.history
+        if cutoff > self.oldest:
+            self.removed_at = {pid: v for pid, v in self.removed_at.items() if v > cutoff}
+            self.oldest = cutoff
+
+    def restart_at(self, version: int):
+        # Board restored from an engine snapshot: keep counting from `version`, but
+        # rows are rebuilt from scratch, so every older client gets a full board
+        self.version = version
+        self.oldest = version + 1
+        self.rows, self.changed_at, self.removed_at = {}, {}, {}
+
+    def frozen(self) -> "VitalsSnapshot":
+        # Read-only copy for other threads. Row dicts are replaced on update, never
+        # edited, so they are shared; only the version maps are copied.
+        copy = VitalsSnapshot.__new__(VitalsSnapshot)
+        copy.version, copy.history, copy.oldest, copy.rows = self.version, self.history, self.oldest, self.rows
+        copy.changed_at = dict(self.changed_at)
+        copy.removed_at = dict(self.removed_at)
+        return copy
+
+    def full(self) -> List[Dict]:
+        return list(self.rows.values())
+
+    def delta(self, since_version: int) -> Optional[Dict]:
+        # None when the caller has to fall back to full()
+        if since_version < self.oldest or since_version > self.version: return None
+        return {
+            "changed": [self.rows[pid] for pid, v in self.changed_at.items() if v > since_version],
+            "removed": [pid for pid, v in self.removed_at.items() if v > since_version],
+        }
+
+def _same_row(old, new):
+    # Exit rows count their ttl down every minute; that alone is not a change
+    # (clients get the ttl when the row appears and a removal when it expires)
+    if old["ttl"] != -1 and new["ttl"] != -1:
+        return {**old, "ttl": new["ttl"]} == new
+    return old == new
+
+def board_payload(snapshot: VitalsSnapshot, since_version: Optional[int] = None) -> Dict:
+    # Patient part of a /status response: a delta when possible, else the full board
+    delta = snapshot.delta(since_version) if since_version is not None else None
+    if delta is None: return {"patients": snapshot.full()}
+    return {"delta": True, "since_version": since_version, **delta}
+
+_publications = itertools.count(1) # Process-wide, so a version never repeats, even for a restored session
+
+class PublishedSession:
+    # What the read endpoints serve for one session (status, alerts, events,
+    # facility census) as of the end of one tick, or one shard publish. Built by
+    # the thread that owns the session and never modified afterwards, so readers
+    # on any thread use it without locks; the owner swaps in the next one by reference.
+    __slots__ = ("version", "vitals", "board", "facility_census", "alerts", "events")
+
+    def __init__(self, vitals: Dict, board: VitalsSnapshot, facility_census: Dict[str, int], alerts: Any, events: Any):
+        self.version = next(_publications)
+        self.vitals = vitals # Without the patient board
+        self.board = board # frozen()
+        self.facility_census = facility_census
+        self.alerts = alerts # AlertView
+        self.events = events # EventView
+
+    def status(self, since_version: Optional[int] = None) -> Dict:
+        return {**self.vitals, **board_payload(self.board, since_version), "total_alerts": self.alerts.total}